@@ -1,12 +1,39 @@
 import serial
 import threading
-from enum import Enum
+import asyncio
+import collections
+import selectors
+import contextlib
+import queue
+import os
+from enum import Enum, IntFlag
 import time
 import math
+import array
+import struct
+import json
+import heapq
+import concurrent.futures
 import serial.tools.list_ports
 import re
 
+try:
+    import numpy as np  # Optional, used to process logs.
+except ImportError:
+    np = None
+
 SETTINGS_FILENAME = "settings_default.txt"
+# The settings that are uploaded to (and saved on) each controller are kept in this file, per serial number.
+# At the next start, only the settings that are different are send. None always sends all settings.
+# This is only used if SAVE_UPLOADED_SETTINGS is True.
+SETTINGS_CACHE_FILENAME = "settings_cache.json"
+# If True, the uploaded settings are also saved on the controller (SAVE), this writes to its flash memory.
+# Only then the controller still has them after the reset at the next start, so only the changed ones need to be send.
+SAVE_UPLOADED_SETTINGS = False
+# The serial port of each controller (by serial number) is kept in this file, see discoverControllers().
+PORT_CACHE_FILENAME = "port_cache.json"
+# Maximum time in seconds to wait for a controller to answer its serial number, when probing a port.
+DISCOVERY_TIMEOUT = 1
 LIBRARY_VERSION = "v1.88"
 
 # DEBUG MODE
@@ -38,8 +65,93 @@ AUTO_SEND_SETTINGS = True
 AUTO_SEND_ENBL = False
 
 # The value's of these commands don't get stored in this library.
-NOT_SETTING_COMMANDS = ["DPOS", "EPOS", "HOME", "ZERO", "RSET", "INDX", "STEP", "MOVE", "STOP", "CONT", "SAVE", "STAT", "TIME", "SRNO", "SOFT", "XLA3", "XLA1", "XRT1", "XRT3", "XLS1", "XLS3", "SFRQ", "SYNC"]
+NOT_SETTING_COMMANDS = ["DPOS", "EPOS", "HOME", "ZERO", "RSET", "INDX", "STEP", "MOVE", "SCAN", "STOP", "CONT", "SAVE", "STAT", "TIME", "SRNO", "SOFT", "XLA3", "XLA1", "XRT1", "XRT3", "XLS1", "XLS3", "SFRQ", "SYNC"]
+# Received values of these tags are stored in axis_data instead of the settings.
+DATA_TAGS = frozenset(NOT_SETTING_COMMANDS)
+# Received values of these tags are not logged.
+NOT_LOGGED_TAGS = frozenset(["SRNO", "XLS ", "XRTU", "XLA ", "XTRA", "SOFT", "SYNC"])
+# Status bits that indicate an error: thermal protection 1 & 2 (bit 2 & 3), error limit (bit 16),
+# safety timeout (bit 18) and position fail (bit 21).
+STAT_ERROR_MASK = (1 << 2) | (1 << 3) | (1 << 16) | (1 << 18) | (1 << 21)  # See StatusFlags.
+
+# LOG_CAPACITY
+# The number of samples an axis keeps while logging (see Axis.startLogging).
+# Each logged tag takes 8 bytes per sample. When the log is full, the oldest samples are overwritten.
+LOG_CAPACITY = 100000
+
+# LOG_FILE_TAGS
+# The tags that are stored when logging to a file (see Axis.startLogging(filename=...)), one column per tag.
+LOG_FILE_TAGS = ["TIME", "EPOS", "DPOS", "STAT", "SSPD"]
+# The number of samples that are collected before they are handed to the writing thread.
+LOG_FILE_BATCH_SIZE = 1024
 DEFAULT_POLI_VALUE = 200
+
+# ADAPTIVE POLI
+# With Axis.enableAdaptivePolling() (or Xeryon.enableAdaptivePolling() for all axes), POLI is set to POLI_ACTIVE as soon as
+# the axis moves, scans, searches its index or something waits for it, and back to POLI_IDLE after it's idle
+# for POLI_IDLE_DELAY seconds. (POLI in ms)
+POLI_ACTIVE = 5
+POLI_IDLE = 200
+POLI_IDLE_DELAY = 0.5
+# Sending one of these commands makes the axis active right away, before the status shows it's moving.
+MOTION_COMMANDS = frozenset(["DPOS", "STEP", "SCAN", "MOVE", "INDX"])
+# Status bits that show the axis is active: searching the index (bit 9) and scanning (bit 13).
+STAT_ACTIVE_MASK = (1 << 9) | (1 << 13)  # See StatusFlags.
+
+# VELOCITY ESTIMATOR
+# EPOS and TIME of each update go through an alpha-beta-gamma filter, see Axis.getVelocity(), getAcceleration() and isSettled().
+# Without TIME frames, the time EPOS arrives is used instead (less accurate, it includes the serial jitter).
+# ESTIMATOR_THETA sets the smoothing: 0 follows each sample, closer to 1 smooths more but lags more.
+ESTIMATOR_THETA = 0.5
+# The axis is settled if the estimated speed would move it less than PTOL in SETTLE_TIME seconds,
+# for SETTLE_SAMPLES updates in a row.
+SETTLE_TIME = 0.05
+SETTLE_SAMPLES = 3
+
+# MAX_QUEUED_COMMANDS
+# Maximum amount of commands that can wait in the send queue.
+# If the queue is full, sendCommand() blocks until the communication thread has written the queue to the controller.
+# If that takes longer than SEND_QUEUE_TIMEOUT seconds, an exception is raised.
+MAX_QUEUED_COMMANDS = 1000
+SEND_QUEUE_TIMEOUT = 5
+
+# IO_HUB_READ_CHUNK
+# When an IOHub services many controllers, it reads at most this many bytes from each port before moving on to the next.
+# This way a controller that is streaming logs can't delay the others.
+IO_HUB_READ_CHUNK = 4096
+
+# METRICS_SAMPLES
+# Xeryon.enableMetrics() keeps the last METRICS_SAMPLES latencies of each kind per axis to calculate percentiles.
+METRICS_SAMPLES = 10000
+
+# ACKNOWLEDGED MODE
+# With Xeryon.enableAcknowledgedMode(), the controller echoes every command (ECHO=1) and at most ACK_WINDOW commands
+# per controller are written before their echo is received, the others wait in the queue.
+# A command that isn't echoed in time is written again, at most ACK_RETRIES times. The timeout follows the measured
+# round trip time of each axis (never shorter than ACK_MIN_TIMEOUT), ACK_TIMEOUT is used until it's measured.
+ACK_WINDOW = 16
+ACK_TIMEOUT = 0.5
+ACK_MIN_TIMEOUT = 0.02
+ACK_RETRIES = 3
+# These commands are never written twice: if the echo got lost, a second STEP would move the stage twice.
+NOT_RETRANSMITTED_COMMANDS = frozenset(["STEP", "RSET"])
+
+# MOVE WATCHDOG
+# Each movement gets an ETA from a trapezoidal profile (distance, SSPD, ACCE, DECE), see Axis.estimateMoveTime().
+# A movement that takes longer than MOVE_TIMEOUT_FACTOR times its ETA plus MOVE_TIMEOUT_MARGIN seconds fails with a
+# timeout, even if the controller doesn't report anything. None disables this.
+MOVE_TIMEOUT_FACTOR = 3
+MOVE_TIMEOUT_MARGIN = 1
+# ACCE and DECE are in steps of ACCE_MULTIPLIER times the unit of SSPD per second, e.g. 100 um/s^2 for a linear stage.
+# This scale is an assumption, it isn't part of the stage data in this library. (The simulator uses the same
+# assumption, so it can't confirm it.) To check it for a stage, compare the eta of a MoveHandle with
+# end_time - start_time, for a short move (mostly acceleration) and a long one (mostly SSPD).
+# A wrong value only makes the ETAs wrong: the watchdog allows MOVE_TIMEOUT_FACTOR times the ETA.
+ACCE_MULTIPLIER = 100
+
+# QUERY_TIMEOUT
+# Maximum time in seconds start() waits for the answers to the questions it asks the controller (HLIM, LLIM, SSPD, ...).
+QUERY_TIMEOUT = 1
 AMPLITUDE_MULTIPLIER = 1456.0
 PHASE_MULTIPLIER = 182
 
@@ -47,22 +159,32 @@ PHASE_MULTIPLIER = 182
 class Xeryon:
     axis_list = None  # A list storing all the axis in the system.
     axis_letter_list = None # A list storing all the axis_letters in the system.
+    axis_dict = None  # A dictionary {axis_letter: axis}, used to pass incoming data to the correct axis.
     master_settings = None
+    master_file_settings = None  # The master settings as read from the settings file, see uploadSettings().
+    settings_cache_lock = threading.Lock()  # Shared by all Xeryon objects, they use the same settings cache file.
 
-    def __init__(self, COM_port = None, baudrate = 115200):
+    def __init__(self, COM_port = None, baudrate = 115200, io_hub = None, serial_number = None):
         """
             :param COM_port: Specify the COM port used
             :type COM_port: string
             :param baudrate: Specify the baudrate
             :type baudrate: int
+            :param io_hub: Optional IOHub. If specified, the serial port is serviced by the IOHub's thread instead of its own threads.
+            :type io_hub: IOHub
+            :param serial_number: Serial number (SRNO) of the controller. If specified (and COM_port isn't),
+                                  start() connects to the port of the controller with this serial number.
             :return: Return a Xeryon object.
 
             Main Xeryon Drive Class, initialize with the COM port and baudrate for communication with the driver.
         """
-        self.comm = Communication(self, COM_port, baudrate)  # Startup communication
+        self.comm = Communication(self, COM_port, baudrate, io_hub)  # Startup communication
+        self.serial_number = serial_number
         self.axis_list = []
         self.axis_letter_list = []
+        self.axis_dict = {}
         self.master_settings = {}
+        self.master_file_settings = {}
 
     def isSingleAxisSystem(self):
         """
@@ -70,11 +192,15 @@ class Xeryon:
         """
         return len(self.getAllAxis()) <= 1
 
-    def start(self, external_communication_thread = False, external_settings_default = None):
+    def start(self, external_communication_thread = False, external_settings_default = None, force_full_upload = False):
         """
+        :param force_full_upload: If True, all settings are send, even the ones that didn't change since the last start.
         :return: Nothing.
         This functions NEEDS to be ran before any commands are executed.
         This function starts the serial communication and configures the settings with the controller.
+        By default all settings of the settings file are send at each start. Only sending the settings that changed
+        is opt-in: set SAVE_UPLOADED_SETTINGS to True, the settings are then saved in the flash memory of the
+        controller (so it still has them after the reset) and kept in SETTINGS_CACHE_FILENAME. See uploadSettings().
         """
         
         if len(self.getAllAxis()) <= 0:
@@ -88,31 +214,44 @@ class Xeryon:
         
         time.sleep(0.2)        
 
+        identity = None
+        if AUTO_SEND_SETTINGS and SAVE_UPLOADED_SETTINGS and SETTINGS_CACHE_FILENAME is not None \
+                and not external_communication_thread:
+            identity = self.readIdentity()
+        answers = self.configureAxes(external_settings_default, force_full_upload, identity)
+
+        if external_communication_thread:
+            return comm  # Nothing is read until the caller runs the communication, so the answers can't be awaited here.
+        if not waitForAnswers(answers, QUERY_TIMEOUT):
+            outputConsole("The controller didn't answer all questions for the limits (HLIM, LLIM, SSPD, PTO2, PTOL).", True)
+
+    def configureAxes(self, external_settings_default = None, force_full_upload = False, identity = None):
+        """
+        :param identity: (SRNO, SOFT) of the controller, see readIdentity(). None sends all settings.
+        :return: A list with the Futures of the questions for the limits, see Axis.query().
+        This function is ran by start(), after the axes are reset.
+        It reads the settings file, sends the settings, enables all axes and asks the controller for the limits.
+        """
         self.readSettings(external_settings_default)  # Read settings file
         if AUTO_SEND_SETTINGS:
-            self.sendMasterSettings()
-            for axis in self.getAllAxis():  # Loop trough each axis:
-                axis.sendSettings()  # Send the settings
+            self.uploadSettings(identity, force_full_upload)
+        if self.getCommunication().window is not None:
+            for axis in self.getAllAxis():
+                axis.sendCommand("ECHO=1")  # Acknowledged mode, see enableAcknowledgedMode().
+        for axis in self.getAllAxis():
+            if axis.adaptive_poli is not None:
+                axis.enableAdaptivePolling(True, *axis.adaptive_poli)  # The reset restored the saved POLI.
 
         # Enable all axes
         for axis in self.getAllAxis():
             axis.sendCommand("ENBL=1")
 
-        # ask for LLIM & HLIM value's
-        # TODO: Put ECHO on temporarily so each questioned value is returned
+        # Ask for the limits, speed and position tolerances. start() waits for the answers.
+        answers = queryMany({axis: ["HLIM", "LLIM", "SSPD", "PTO2", "PTOL"] for axis in self.getAllAxis()})
         for axis in self.getAllAxis():
-            axis.sendCommand("HLIM=?")
-            axis.sendCommand("LLIM=?")
-            axis.sendCommand("SSPD=?")
-            axis.sendCommand("PTO2=?")
-            axis.sendCommand("PTOL=?")
             if "XRTA" in str(axis.stage):
                 axis.sendCommand("ENBL=3")
-        
-        
-        if external_communication_thread:
-            return comm
-        
+        return [future for axis_answers in answers.values() for future in axis_answers.values()]
 
     def stop(self):
         """
@@ -135,21 +274,96 @@ class Xeryon:
             axis.sendCommand("STOP=0")
             axis.was_valid_DPOS = False
 
+    def moveMany(self, targets, differentUnits=None, wait=True, timeout=None):
+        """
+        :param targets: A dictionary {axis: position} for the axes of this controller.
+        :return: A dictionary {axis: MoveHandle}.
+        All axes start moving at the same time. See the moveMany() function for the other parameters.
+        For axes of different controllers, use the moveMany() function.
+        """
+        for axis in targets:
+            if axis not in self.getAllAxis():
+                raise Exception("Axis " + str(axis) + " doesn't belong to this controller.")
+        return moveMany(targets, differentUnits, wait, timeout)
+
+
+    def enableMetrics(self, enable=True):
+        """
+        :param enable: True to start collecting metrics (this clears the previous ones), False to stop.
+        Enables the latency instrumentation of the communication, see metrics().
+        """
+        self.getCommunication().metrics = CommandMetrics() if enable else None
+
+    def metrics(self):
+        """
+        :return: A snapshot of the metrics, None if they aren't enabled (see enableMetrics()). It's a dictionary with:
+                 "queue_depth" & "write_buffer": the commands and bytes that wait to be written right now,
+                 "max_queue_depth": the largest queue depth since the metrics are enabled,
+                 "frames": the number of received frames, "fps": frames per second since the previous snapshot,
+                 "axes": {axis letter (or "master"): {"queue", "response", "total", "move", "wakeup"}}.
+                 The latencies are dictionaries {"count", "p50", "p99", "max"} in seconds:
+                 "queue" is the time a command waits in the queue, "response" the time from writing it until the
+                 controller confirms it, "total" both together. "move" is the time from sending DPOS until
+                 the position is reached and "wakeup" the time from then until setDPOS() or wait() returns.
+        """
+        comm = self.getCommunication()
+        metrics = comm.metrics
+        if metrics is None:
+            return None
+        default_letter = self.axis_list[0].axis_letter if self.isSingleAxisSystem() and self.axis_list else "master"
+        frames, fps, latencies = metrics.snapshot()
+        axes = {}
+        for letter, values in latencies.items():
+            axes[default_letter if letter is None else letter] = values
+        return {
+            "queue_depth": len(comm.readyToSend),
+            "max_queue_depth": metrics.max_queue_depth,
+            "write_buffer": len(comm.write_buffer),
+            "frames": frames,
+            "fps": fps,
+            "axes": axes,
+        }
+
+    def enableAdaptivePolling(self, enable=True, active=POLI_ACTIVE, idle=POLI_IDLE, idle_delay=POLI_IDLE_DELAY):
+        """
+        Enables adaptive polling on all axes, see Axis.enableAdaptivePolling().
+        Use the function of an axis to give it its own limits.
+        """
+        for axis in self.getAllAxis():
+            axis.enableAdaptivePolling(enable, active, idle, idle_delay)
 
-    def reset(self):
+    def enableAcknowledgedMode(self, enable=True, depth=ACK_WINDOW):
         """
+        :param enable: True to enable the acknowledged mode, False to go back to sending without confirmation.
+        :param depth: The maximum number of commands that are written before the controller has confirmed them.
+        Turns ECHO on, so the controller confirms each command it has processed. Commands are pipelined up to depth
+        commands in flight, the others wait in the queue. Commands that aren't confirmed in time are written again.
+        This way the controller is never flooded with commands. See CommandWindow and Axis.getRoundTripTime().
+        Can be called before or after start(), start() turns ECHO on again after the reset.
+        """
+        comm = self.getCommunication()
+        with comm.send_condition:
+            comm.window = CommandWindow(depth) if enable else None
+        if comm.ser is not None and comm.ser.is_open:
+            for axis in self.getAllAxis():
+                axis.sendCommand("ECHO=1" if enable else "ECHO=0")
+
+    def reset(self, force_full_upload = False):
+        """
+        :param force_full_upload: If True, all settings are send, even the ones that didn't change since the last start.
         :return: None
-        This function sends RESET to the controller, and resends all settings.
+        This function sends RESET to the controller, and configures it again like start() does.
+        The settings file is read again and uploaded with uploadSettings(): only the changed settings if
+        SAVE_UPLOADED_SETTINGS is True, all of them otherwise.
         """
         for axis in self.getAllAxis():
             axis.reset()
         time.sleep(0.2)
 
-        self.readSettings()  # Read settings file again
-
-        if AUTO_SEND_SETTINGS:
-            for axis in self.getAllAxis():
-                axis.sendSettings()  # Update settings
+        identity = None
+        if AUTO_SEND_SETTINGS and SAVE_UPLOADED_SETTINGS and SETTINGS_CACHE_FILENAME is not None:
+            identity = self.readIdentity()
+        self.configureAxes(None, force_full_upload, identity)  # Read settings file again, and send it.
 
     def getAllAxis(self):
         """
@@ -167,6 +381,7 @@ class Xeryon:
                        stage)
         self.axis_list.append(newAxis)  # Add axis to axis list.
         self.axis_letter_list.append(axis_letter)
+        self.axis_dict[axis_letter] = newAxis
         return newAxis
 
     # End User Commands
@@ -181,11 +396,7 @@ class Xeryon:
         :param letter: Specify the axis letter
         :return: Returns the correct axis object. Or None if the axis does not exist.
         """
-        if self.axis_letter_list.count(letter) == 1:  # Axis letter found
-            indx = self.axis_letter_list.index(letter)
-            if len(self.getAllAxis()) > indx:
-                return self.getAllAxis()[indx]  # Return axis
-        return None
+        return self.axis_dict.get(letter)
 
     def readSettings(self, external_settings_default = None):
         """
@@ -199,6 +410,9 @@ class Xeryon:
                 file = open(SETTINGS_FILENAME, "r")
             else:
                 file = open(external_settings_default, "r")
+            self.master_file_settings = {}
+            for axis in self.getAllAxis():
+                axis.file_settings = {}
 
             for line in file.readlines():  # For each line:
                 if "=" in line and line.find("%") != 0:  # Check if it's a command and not a comment or blank line.
@@ -240,13 +454,108 @@ class Xeryon:
             raise e
 
     
+    def readIdentity(self, timeout = 1):
+        """
+        :param timeout: Maximum time in seconds to wait for the answers.
+        :return: A tuple (SRNO, SOFT) with the serial number and software version of the controller.
+                 None if the controller doesn't answer within the timeout.
+        """
+        answers = {}
+        answered = threading.Event()
+
+        def onData(tag, value):
+            if tag == "SRNO" or tag == "SOFT":
+                answers[tag] = value
+                if len(answers) == 2:
+                    answered.set()
+
+        for axis in self.getAllAxis():
+            axis.data_callbacks.append(onData)
+        try:
+            self.comm.sendCommand("SRNO=?")
+            self.comm.sendCommand("SOFT=?")
+            answered.wait(timeout)
+        finally:
+            for axis in self.getAllAxis():
+                axis.data_callbacks.remove(onData)
+        if "SRNO" not in answers:
+            return None
+        return answers["SRNO"], answers.get("SOFT", "")
+
+    def uploadSettings(self, identity = None, force_full_upload = False, save = None):
+        """
+        :param identity: (SRNO, SOFT) of the controller, see readIdentity(). None sends all settings.
+        :param force_full_upload: If True, all settings are send.
+        :param save: If True, the settings are saved on the controller. None uses SAVE_UPLOADED_SETTINGS.
+        :return: The number of settings that are send.
+        Sends the settings of the master and all axes, as they are read from the settings file, to the controller.
+        Settings that are only set while running (e.g. ECHO or POLI) are never send or saved here.
+        If they are saved, they are also kept in SETTINGS_CACHE_FILENAME. As the controller is reset before,
+        it has these saved settings again, so only the settings that are different have to be send (and saved) now.
+        """
+        if save is None:
+            save = SAVE_UPLOADED_SETTINGS
+        settings = {"master": dict(self.master_file_settings)}
+        for axis in self.getAllAxis():
+            settings[axis.getLetter()] = axis.getSettingsToSend(fromSettingsFile=True)
+
+        key = None
+        cached = None
+        if save and identity is not None and SETTINGS_CACHE_FILENAME is not None:
+            key = str(identity[0]) + "/" + str(identity[1])
+            if not force_full_upload:
+                cached = self.__readSettingsCache().get(key)
+
+        sent = 0
+        for part, values in settings.items():
+            previous = None if cached is None else cached.get(part)
+            tags = [tag for tag, value in values.items() if previous is None or previous.get(tag) != str(value)]
+            if len(tags) == 0:
+                continue
+            sent += len(tags)
+            if part == "master":
+                for tag in tags:
+                    self.comm.sendCommand(str(tag) + "=" + str(values[tag]))
+            else:
+                self.getAxis(part).sendSettings(tags, fromSettingsFile=True)
+            if save:
+                # Save them, so the controller has them again after the next reset.
+                if part == "master":
+                    self.comm.sendCommand("SAVE=0")
+                else:
+                    self.getAxis(part).saveSettings()
+
+        if key is not None and (sent > 0 or cached is None):
+            self.__writeSettingsCache(key, dict([(part, dict([(tag, str(value)) for tag, value in values.items()]))
+                                                 for part, values in settings.items()]))
+        return sent
+
+    def __readSettingsCache(self):
+        try:
+            with open(SETTINGS_CACHE_FILENAME, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def __writeSettingsCache(self, key, settings):
+        # Several controllers can be started at the same time, they all use the same file.
+        with Xeryon.settings_cache_lock:
+            cache = self.__readSettingsCache()
+            cache[key] = settings
+            temporary_filename = SETTINGS_CACHE_FILENAME + ".tmp"
+            with open(temporary_filename, "w") as file:
+                json.dump(cache, file, indent=1, sort_keys=True)
+            os.replace(temporary_filename, SETTINGS_CACHE_FILENAME)
+
     def setMasterSetting(self, tag, value, fromSettingsFile=False):
         """
             In multi-axis systems, commands without an axis specified are for the master.
             This function adds a setting (tag, value) to the list of settings for the master.
         """
         self.master_settings.update({tag: value})
-        if not fromSettingsFile:
+        if fromSettingsFile:
+            self.master_file_settings.update({tag: value})
+        else:
             self.comm.sendCommand(str(tag)+"="+str(value))
         if "COM" in tag:
             self.setCOMPort(str(value))
@@ -282,16 +591,142 @@ class Xeryon:
         """
         This function loops through every available COM-port.
         It check's if it contains any signature of Xeryon.
+        If a serial number is specified, it looks for the port of that controller, see findSerialNumber().
         :return:
         """
+        if self.serial_number is not None:
+            self.setCOMPort(findSerialNumber(self.serial_number, self.getCommunication().baud))
+            return
         if OUTPUT_TO_CONSOLE:
             print("Automatically searching for COM-Port. If you want to speed things up you should manually provide it inside the controller object.")
-        ports = list(serial.tools.list_ports.comports())
-        com_port = None
-        for port in ports:
-            if "04D8" in str(port.hwid):
-                self.setCOMPort(str(port.device))
-                break
+        for port in findXeryonPorts():
+            self.setCOMPort(port)
+            break
+
+
+def findXeryonPorts():
+    """
+    :return: The devices (e.g. "/dev/ttyACM0" or "COM3") of all serial ports with the signature of a Xeryon controller.
+    """
+    return [str(port.device) for port in serial.tools.list_ports.comports() if "04D8" in str(port.hwid)]
+
+
+def probeSerialNumber(port, baudrate = 115200, timeout = None):
+    """
+    :param port: The serial port, e.g. "/dev/ttyACM0".
+    :param timeout: Maximum time in seconds to wait for the answer. Default DISCOVERY_TIMEOUT.
+    :return: The serial number (SRNO) of the controller on this port, as a string. None if there is no answer.
+    Ports that are used by a Xeryon object of this program are never opened, that would steal its data.
+    """
+    if timeout is None:
+        timeout = DISCOVERY_TIMEOUT
+    # The check and the open are done under one lock, so a Communication can't open the port in between.
+    with Communication.ports_condition:
+        Communication.ports_condition.wait_for(lambda: port not in Communication.ports_probing)
+        if port in Communication.ports_in_use:
+            return None
+        try:
+            ser = serial.Serial(port, baudrate, timeout=0.01)
+        except Exception:
+            return None
+        Communication.ports_probing.add(port)
+    try:
+        ser.reset_input_buffer()
+        ser.write(b"SRNO=?\n")
+        deadline = time.monotonic() + timeout
+        buffer = b""
+        while time.monotonic() < deadline:
+            buffer += ser.read(max(1, ser.in_waiting))
+            lines = buffer.split(b"\n")
+            buffer = lines.pop()  # Incomplete line.
+            for line in lines:
+                parsed = parseFrame(line.decode("ascii", "replace"))
+                if parsed is not None and parsed[1] == "SRNO":
+                    return parsed[2]
+        return None
+    except Exception:
+        return None
+    finally:
+        ser.close()
+        with Communication.ports_condition:
+            Communication.ports_probing.discard(port)
+            Communication.ports_condition.notify_all()
+
+
+def discoverControllers(ports = None, baudrate = 115200, timeout = None):
+    """
+    :param ports: The ports to probe. None probes all ports with the signature of a Xeryon controller.
+    :param timeout: Maximum time in seconds to wait for each controller. Default DISCOVERY_TIMEOUT.
+    :return: A dictionary {serial number: port} of the controllers that answered.
+    All ports are probed at the same time. The result is added to the port map in PORT_CACHE_FILENAME.
+    """
+    if ports is None:
+        ports = findXeryonPorts()
+    found = {}
+
+    def probe(port):
+        serial_number = probeSerialNumber(port, baudrate, timeout)
+        if serial_number is not None:
+            found[serial_number] = port
+
+    threads = [threading.Thread(target=probe, args=(port,)) for port in ports]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if PORT_CACHE_FILENAME is not None:
+        with discovery_lock:
+            port_map = readPortMap()
+            # Controllers that moved to another port replace the old entry, ports that changed hands are dropped.
+            port_map = dict([(srno, port) for srno, port in port_map.items()
+                             if port not in found.values() or found.get(srno) == port])
+            port_map.update(found)
+            temporary_filename = PORT_CACHE_FILENAME + ".tmp"
+            with open(temporary_filename, "w") as file:
+                json.dump(port_map, file, indent=1, sort_keys=True)
+            os.replace(temporary_filename, PORT_CACHE_FILENAME)
+    return found
+
+
+def readPortMap():
+    """
+    :return: The dictionary {serial number: port} in PORT_CACHE_FILENAME, as written by discoverControllers().
+    """
+    if PORT_CACHE_FILENAME is None:
+        return {}
+    try:
+        with open(PORT_CACHE_FILENAME, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def findSerialNumber(serial_number, baudrate = 115200, ports = None):
+    """
+    :param serial_number: The serial number (SRNO) of the controller.
+    :param ports: The ports to search. None searches all ports with the signature of a Xeryon controller.
+    :return: The port of the controller with this serial number.
+    First the port in the port map is checked, only if the controller isn't there anymore all ports are probed.
+    Raises an exception if the controller isn't found.
+    """
+    serial_number = str(serial_number)
+    cached_port = readPortMap().get(serial_number)
+    if cached_port is not None and probeSerialNumber(cached_port, baudrate) == serial_number:
+        return cached_port
+    with discovery_serial_lock:  # Don't probe all ports several times at once.
+        cached_port = readPortMap().get(serial_number)
+        if cached_port is not None and probeSerialNumber(cached_port, baudrate) == serial_number:
+            return cached_port  # Found by a search that was running at the same time.
+        found = discoverControllers(ports, baudrate)
+    if serial_number not in found:
+        raise Exception("No controller with serial number " + serial_number + " found. Found: " + str(found))
+    return found[serial_number]
+
+
+discovery_lock = threading.Lock()  # Protects PORT_CACHE_FILENAME.
+discovery_serial_lock = threading.Lock()  # Only one findSerialNumber() searches all ports at a time.
 
 
 
@@ -327,44 +762,415 @@ class Units(Enum):
         return None
 
 
+class SampleSplitter:
+    """
+    Finds the tag the controller sends first in each update, so a log can start a new sample with it.
+    The tags of one update are received right after each other, and the updates are POLI apart. So for the first
+    learn_updates updates, the time before each tag is added up: the tag after the largest gaps starts the updates.
+    Until then, a tag that is received twice starts a new sample. The log can start in the middle of an update,
+    so these samples may mix two updates: restart is set when they have to be discarded.
+    """
+    learn_updates = 4  # The number of updates to learn from.
+    row_tag = None  # The tag that starts each sample, None while learning.
+    restart = False  # True when the samples formed while learning have to be discarded.
+
+    def __init__(self):
+        self.row_tag = None
+        self.restart = False
+        self.counts = {}  # Dictionary {tag: number of times received}
+        self.gaps = {}  # Dictionary {tag: total time since the tag before it}
+        self.last_time = None
+        self.sample_tags = set()  # The tags of the current sample, while learning.
+
+    def isNewSample(self, tag):
+        """
+        :param tag: The tag that is received, while row_tag is None.
+        :return: True if a new sample has to be started for this tag.
+        """
+        now = time.monotonic()
+        if self.last_time is not None:
+            self.gaps[tag] = self.gaps.get(tag, 0) + now - self.last_time
+        self.last_time = now
+        count = self.counts.get(tag, 0) + 1
+        self.counts[tag] = count
+        if count > self.learn_updates:
+            # Only the tags of each update, not e.g. the answer to a question that came in between.
+            tags = [tag for tag in self.gaps if self.counts[tag] >= self.learn_updates]
+            self.row_tag = max(tags, key=self.gaps.get)
+            self.restart = True
+            return tag == self.row_tag
+        if tag in self.sample_tags:
+            self.sample_tags = set([tag])
+            return True
+        self.sample_tags.add(tag)
+        return len(self.sample_tags) == 1  # The first tag of the log.
+
+
+class LogFileSink:
+    """
+    Streams the data logged by an axis to a binary file, for captures that don't fit in memory.
+    It's used instead of a LogBuffer when Axis.startLogging() gets a filename.
+    Samples are formed the same way as in a LogBuffer (one sample per update) and stored as fixed-width
+    records with one column per tag in LOG_FILE_TAGS: 8 byte integers, SSPD as an 8 byte float.
+    The records are collected in batches of LOG_FILE_BATCH_SIZE samples and written by a separate thread,
+    so the communication thread never waits for the disk.
+    The file starts with a single JSON line describing the columns. Use readLogFile() to read it back.
+    """
+    filename = None
+    tags = None  # The tags that are stored, in the order of the columns.
+    sample_nb = 0  # The number of samples started.
+
+    def __init__(self, filename, tags = None, batch_size = None):
+        self.filename = filename
+        self.tags = list(LOG_FILE_TAGS if tags is None else tags)
+        self.batch_size = LOG_FILE_BATCH_SIZE if batch_size is None else int(batch_size)
+        self.column_index = dict([(tag, index) for index, tag in enumerate(self.tags)])
+        typecodes = ["d" if tag == "SSPD" else "q" for tag in self.tags]
+        self.record = struct.Struct("<" + "".join(typecodes))
+        self.sample = [0.0 if typecode == "d" else 0 for typecode in typecodes]  # The current sample.
+        self.sample_nb = 0
+        self.splitter = SampleSplitter()
+        self.batch = bytearray()
+        self.batch_samples = 0
+
+        # Header: one JSON line, padded so the records start at a multiple of 8 bytes.
+        header = json.dumps({"format": "Xeryon log", "version": 1, "columns": [list(c) for c in zip(self.tags, typecodes)]})
+        header = header + " " * (-(len(header) + 1) % 8) + "\n"
+        self.file = open(filename, "wb")
+        self.file.write(header.encode())
+
+        self.pending = collections.deque()  # Batches waiting to be written.
+        self.pending_event = threading.Event()
+        self.stop_thread = False
+        self.lock = threading.Lock()  # Samples are added from the communication thread, close() runs in the user's thread.
+        self.thread = threading.Thread(target=self.__writeData)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, tag, value):
+        """
+        :param tag: The tag of the received data, e.g. "EPOS".
+        :param value: The received value.
+        Stores the value in the current sample. The first tag of each update starts a new sample (see SampleSplitter).
+        Tags that aren't stored are ignored. Values received after close() are ignored.
+        """
+        with self.lock:
+            if self.stop_thread:
+                return
+            splitter = self.splitter
+            if tag == splitter.row_tag or (splitter.row_tag is None and splitter.isNewSample(tag)):
+                if splitter.restart:
+                    splitter.restart = False
+                    self.__restart()
+                self.__newSample()
+            index = self.column_index.get(tag)
+            if index is not None:
+                self.sample[index] = value
+
+    def __newSample(self):
+        if self.sample_nb > 0:
+            self.__storeSample()
+        self.sample_nb += 1
+
+    def __restart(self):
+        # Discards the samples formed while the first tag of the updates wasn't known yet, see SampleSplitter.
+        # The values of the current sample are kept, they are the start values of the next one.
+        self.sample_nb = 0
+        self.batch = bytearray()
+        self.batch_samples = 0
+
+    def __storeSample(self):
+        # The new sample starts from the values of this one, so self.sample is kept as it is.
+        self.batch += self.record.pack(*self.sample)
+        self.batch_samples += 1
+        if self.batch_samples >= self.batch_size:
+            self.__handOver()
+
+    def __handOver(self):
+        if len(self.batch) > 0:
+            self.pending.append(self.batch)
+            self.batch = bytearray()
+            self.batch_samples = 0
+            self.pending_event.set()
+
+    def __writeData(self):
+        """
+        This function is ran in a seperate thread. It writes the batches to the file.
+        """
+        while True:
+            self.pending_event.wait(0.5)
+            self.pending_event.clear()
+            while len(self.pending) > 0:
+                self.file.write(self.pending.popleft())
+            self.file.flush()
+            if self.stop_thread and len(self.pending) == 0:
+                break
+
+    def close(self):
+        """
+        Writes the remaining samples and closes the file.
+        """
+        with self.lock:
+            if self.stop_thread:
+                return
+            if self.sample_nb > 0:
+                self.__storeSample()
+            self.__handOver()
+            self.stop_thread = True
+        self.pending_event.set()
+        self.thread.join()
+        self.file.close()
+
+    def __len__(self):
+        """
+        :return: The number of samples stored.
+        """
+        return self.sample_nb
+
+    def getLogs(self):
+        """
+        :return: A dictionary {tag: list}, like LogBuffer.getLogs(). The file is closed first.
+        This works without NumPy too, then the records are read with struct.
+        """
+        if np is not None:
+            return dict([(tag, column.tolist()) for tag, column in self.getLogViews().items()])
+        self.close()
+        with open(self.filename, "rb") as file:
+            file.readline()  # Header, the columns are self.tags.
+            data = file.read()
+        data = data[:len(data) - len(data) % self.record.size]
+        columns = [list(column) for column in zip(*self.record.iter_unpack(data))]
+        if len(columns) == 0:
+            columns = [[] for tag in self.tags]
+        return dict(zip(self.tags, columns))
+
+    def getLogViews(self):
+        """
+        :return: A dictionary {tag: column}, the columns are memory-mapped from the file (see readLogFile), nothing
+                 is copied. Without NumPy, the columns are lists (see getLogs).
+        The file is closed first.
+        """
+        if np is None:
+            return self.getLogs()
+        self.close()
+        log = readLogFile(self.filename)
+        return dict([(tag, log[tag]) for tag in log.dtype.names])
+
+
+def readLogFile(filename):
+    """
+    :param filename: A file written by LogFileSink.
+    :return: A NumPy structured array with one field per tag, e.g. log["EPOS"].
+    The file is memory-mapped, so only the parts that are used are loaded from the disk.
+    """
+    if np is None:
+        raise Exception("NumPy is needed to read log files.")
+    with open(filename, "rb") as file:
+        header_line = file.readline()
+    header = json.loads(header_line.decode())
+    dtype = np.dtype([(str(tag), "<f8" if typecode == "d" else "<i8") for tag, typecode in header["columns"]])
+    sample_nb = (os.path.getsize(filename) - len(header_line)) // dtype.itemsize
+    if sample_nb == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(filename, dtype, mode="r", offset=len(header_line), shape=(sample_nb,))
+
+
+class StatusFlags(IntFlag):
+    """
+    The status bits of an axis (STAT), returned by Axis.status().
+    """
+    THERMAL_PROTECTION_1 = 1 << 2
+    THERMAL_PROTECTION_2 = 1 << 3
+    FORCE_ZERO = 1 << 4
+    MOTOR_ON = 1 << 5
+    CLOSED_LOOP = 1 << 6
+    ENCODER_AT_INDEX = 1 << 7
+    ENCODER_VALID = 1 << 8
+    SEARCHING_INDEX = 1 << 9
+    POSITION_REACHED = 1 << 10
+    ENCODER_ERROR = 1 << 12
+    SCANNING = 1 << 13
+    LEFT_END_STOP = 1 << 14
+    RIGHT_END_STOP = 1 << 15
+    ERROR_LIMIT = 1 << 16
+    SEARCHING_OPTIMAL_FREQUENCY = 1 << 17
+    SAFETY_TIMEOUT = 1 << 18
+    POSITION_FAIL = 1 << 21
+
+
+class LogBuffer:
+    """
+    Stores the data logged by an axis (see Axis.startLogging) in arrays, they grow by doubling up to the capacity.
+    There is one column per tag and one row per sample. A new sample starts with the first tag of each update of
+    the controller (see SampleSplitter), whatever the order of the tags is,
+    tags that are not received in a sample keep the value of the previous sample. This way all columns are aligned.
+    The rows form a ring buffer: when it's full, the oldest samples are overwritten.
+    Integers take 8 bytes per sample ('q'), floats (e.g. SSPD) also 8 bytes ('d').
+    """
+    capacity = None  # Maximum number of samples.
+    initial_size = 1024  # The number of samples the columns have room for at first.
+    columns = None  # Dictionary {tag: array}
+    sample_nb = 0  # The number of samples started. The current sample is stored at index (sample_nb - 1) % capacity.
+
+    def __init__(self, capacity = LOG_CAPACITY):
+        if int(capacity) <= 0:
+            raise Exception("The log capacity should be at least 1 sample.")
+        self.capacity = int(capacity)
+        self.size = min(self.initial_size, self.capacity)  # The number of samples the columns have room for now.
+        self.columns = {}
+        self.sample_nb = 0
+        self.index = 0  # Index of the current sample.
+        self.splitter = SampleSplitter()  # Finds the first tag of each update.
+
+    def add(self, tag, value):
+        """
+        :param tag: The tag of the received data, e.g. "EPOS".
+        :param value: The received value, int or float.
+        Stores the value in the current sample. The first tag of each update starts a new sample.
+        """
+        splitter = self.splitter
+        if tag == splitter.row_tag or (splitter.row_tag is None and splitter.isNewSample(tag)):
+            if splitter.restart:
+                splitter.restart = False
+                self.sample_nb = 0  # Discard the samples formed while learning, see SampleSplitter.
+            self.__newSample()
+        column = self.columns.get(tag)
+        if column is None:
+            column = self.__addColumn(tag, value)
+        column[self.index] = value
+
+    def __newSample(self):
+        previous = self.index
+        self.index = self.sample_nb % self.capacity
+        self.sample_nb += 1
+        if self.index >= self.size:
+            self.__grow()
+        if self.index != previous:
+            for column in self.columns.values():  # Start from the values of the previous sample.
+                column[self.index] = column[previous]
+
+    def __grow(self):
+        # Doubling keeps the time spent on growing per sample constant, without allocating the capacity up front.
+        size = min(self.size * 2, self.capacity)
+        for column in self.columns.values():
+            column.extend(array.array(column.typecode, [0]) * (size - self.size))
+        self.size = size
+
+    def __addColumn(self, tag, value):
+        typecode = "d" if isinstance(value, float) else "q"
+        column = array.array(typecode, [0]) * self.size
+        self.columns[tag] = column
+        return column
+
+    def __len__(self):
+        """
+        :return: The number of samples stored.
+        """
+        return min(self.sample_nb, self.capacity)
+
+    def close(self):
+        """
+        Nothing to do, the samples stay in memory. (Same interface as LogFileSink)
+        """
+        pass
+
+    def isWrapped(self):
+        """
+        :return: True if the oldest samples are overwritten.
+        """
+        return self.sample_nb > self.capacity
+
+    def getLogs(self):
+        """
+        :return: A dictionary {tag: list}, with the oldest sample first.
+        """
+        return dict([(tag, column.tolist()) for tag, column in self.getLogViews().items()])
+
+    def getLogViews(self):
+        """
+        :return: A dictionary {tag: column}, with the oldest sample first.
+        If the buffer didn't wrap, each column is a memoryview on the stored array (no copy), numpy.asarray() works on it.
+        If it did wrap, the samples are put in order in a new array.
+        """
+        length = len(self)
+        logs = {}
+        for tag, column in self.columns.items():
+            if self.isWrapped():
+                start = self.sample_nb % self.capacity
+                logs[tag] = memoryview(column[start:] + column[:start])
+            else:
+                logs[tag] = memoryview(column)[:length]
+        return logs
+
+
 class Axis:
     axis_letter = None  # Stores the axis letter for this specific axis.
     xeryon_object = None  # Stores the "Xeryon" object.
     axis_data = None  # Stores all the data the controller sends.
     settings = None  # Stores all the settings from the settings file
+    file_settings = None  # The settings as read from the settings file, without the ones set while running.
     stage = None  # Specifies the type of stage used in this axis.
     units = Units.mm  # Specifies the units this axis is currently working in.
     update_nb = 0  # This number increments each time an update is recieved from the controller.
+    data_nb = 0  # This number increments each time EPOS or STAT is recieved, it's used to wake up waiting functions.
+    waiting_nb = 0  # The number of threads waiting in waitFor(). If 0, there is no need to notify update_condition.
+    update_condition = None  # Notified each time EPOS or STAT is recieved. Blocking functions wait on this.
+    data_callbacks = None  # Functions called as callback(tag, value) for each value received. (Used by AsyncAxis)
+    value_handlers = None  # Dictionary {tag: function} with the extra processing for EPOS, STAT and TIME.
+    pending_queries = None  # Dictionary {tag: list of Futures} of the questions ("TAG=?") that are not answered yet.
+    query_lock = None  # Protects pending_queries, questions are asked from the user's thread and answered from the communication thread.
+    unit_factors = None  # Dictionary {Units: number of encoder units in one unit}, computed for the stage of this axis.
+    unit_operands = None  # Dictionary {Units: (a, b, c, d)}, a value in that unit is value * a / b * c / d encoder units.
+    stat = 0  # The last STAT value received, as an integer.
+    epos = 0  # The last EPOS value received, as an integer. (axis_data has it as a string)
+    status_flags = None  # The last STAT value received, as StatusFlags.
     was_valid_DPOS = False  # if True, the STEP command takes DPOS as the refrence. It's called "targeted_position=1/0" in the Microcontroller
     def_poli_value = str(DEFAULT_POLI_VALUE)
 
     isLogging = False  # Stores if this axis is currently "Logging": it's storing its axis_data.
-    logs = {}  # This stores all the data. It's a dictionary of the form:
-
-    previous_epos = [0,0] # Two samples to calculate speed
-    previous_time = [0,0]
-
-    # { "EPOS": [...,...,...], "DPOS": [...,...,...], "STAT":[...,...,...],...}
-
-    def findIndex(self, forceWaiting = False, direction=0):
-        """
-        :return: None
+    log_buffer = None  # LogBuffer that stores all the logged data.
+    logging_poli = False  # True while startLogging() has set POLI to 1, adaptive polling leaves POLI alone then.
+
+    adaptive_poli = None  # (active POLI, idle POLI, idle delay in seconds) if adaptive polling is enabled.
+    poli_active = False  # True while adaptive polling has set POLI to the active value.
+    idle_since = None  # time.monotonic() since the axis is idle, POLI goes to the idle value after the idle delay.
+    poli_lock = None  # Protects the switching of the adaptive polling, it's done from several threads.
+
+    # Velocity estimator, see __updateEstimate().
+    estimator_gains = (None, 0, 0, 0)  # (ESTIMATOR_THETA, alpha, beta, gamma), shared by all axes.
+    estimated_position = None  # Filtered EPOS in encoder units, None until the first update.
+    velocity = 0.0  # Estimated velocity in encoder units/s.
+    acceleration = 0.0  # Estimated acceleration in encoder units/s^2.
+    settled_nb = SETTLE_SAMPLES  # The number of updates in a row the axis was standing still.
+    last_time = None  # The TIME of the previous update (in 0.1 ms, it wraps around at 2**16).
+    update_epos = None  # EPOS of the current update, until TIME of the same update is received. (Or the other way around)
+    update_time = None
+    time_received = False  # False until the controller sends TIME. Until then, the time EPOS arrives is used.
+
+    def findIndex(self, forceWaiting = False, direction=0, timeout=None, blocking=True):
+        """
+        :param timeout: Maximum time in seconds to wait for the index. None waits until the controller stops searching.
+        :param blocking: If False, this function doesn't wait and returns an IndexHandle right after sending INDX.
+        :return: True if the index is found, False if not. An IndexHandle if blocking is False.
         This function finds the index, after finding the index it goes to the index position.
         It blocks the program until the index is found.
         """
         self.__sendCommand("INDX=" + str(direction))
         self.was_valid_DPOS = False
+        if not blocking:
+            return IndexHandle(self)
 
         if DISABLE_WAITING is False or forceWaiting is True:
             self.__waitForUpdate()  # Waits a couple of updates, so the EncoderValid flag is valid and doesn't lagg behind.
             self.__waitForUpdate()
             outputConsole("Searching index for axis " + str(self) + ".")
-            while not self.isEncoderValid():  # While index not found, wait.
-                if not self.isSearchingIndex():  # Check if searching for index bit is true.
-                    outputConsole("Index is not found, but stopped searching for index.", True)
-                    return False
-                    break
-                time.sleep(0.2)
+            # Wait until the index is found or the controller stops searching for it.
+            if not self.waitFor(lambda: self.isEncoderValid() or not self.isSearchingIndex(), timeout):
+                outputConsole("Index is not found, timeout reached.", True)
+                return False
+            if not self.isEncoderValid():  # Check if searching for index bit is true.
+                outputConsole("Index is not found, but stopped searching for index.", True)
+                return False
 
         if self.isEncoderValid():
             outputConsole("Index of axis " + str(self) + " found.")
@@ -379,13 +1185,15 @@ class Axis:
             direction = -1
         self.sendCommand("MOVE=" + str(direction))
 
-    def setDPOS(self, value, differentUnits=None, outputToConsole=True, forceWaiting = False):
+    def setDPOS(self, value, differentUnits=None, outputToConsole=True, forceWaiting = False, timeout=None, blocking=True):
         """
         :param value: The new value DPOS has to become.
         :param differentUnits: If the value isn't specified in the current units, specify the correct units.
         :type differentUnits: Units
         :param outputToConsole: Default set to True. If set to False, this function won't output text to the console.
-        :return: None
+        :param timeout: Maximum time in seconds to wait for the position. None waits until the controller reports it.
+        :param blocking: If False, this function doesn't wait and returns a MoveHandle right after sending DPOS.
+        :return: True if the position is reached, False if not. A MoveHandle if blocking is False.
         Note: This function makes use of the sendCommand function, which is blocking the program until the position is reached.
         """
         unit = self.units  # Current units
@@ -393,86 +1201,117 @@ class Axis:
             unit = differentUnits  # Then specify the unit in differentUnits argument.
 
         DPOS = int(self.convertUnitsToEncoder(value, unit))  # Convert into encoder units.
-        error = False
 
         self.__sendCommand("DPOS=" + str(DPOS))
         self.was_valid_DPOS = True # And keep it True in order to avoid an accumulating error.
-        # self.__waitForUpdate()
+        # The handle watches the incoming EPOS & STAT, until EPOS is within PTO2 AND positionReached status is received.
+        if not blocking:
+            return MoveHandle(self, DPOS, value, unit)
 
         # Block all futher processes until position is reached.
         if DEBUG_MODE is False and DISABLE_WAITING is False or forceWaiting is True:  # This check isn't nessecary in DEBUG mode or when DISABLE_WAITING is True
-            # send_time = getActualTime()
-            # distance = abs(int(DPOS) - int(self.getData("EPOS")))  # For calculating timeout time.
-
-            # Wait some updates. This is so the flags (e.g. left end stop) of the previous command aren't received.
-            # self.__waitForUpdate()
-
-            # Wait until EPOS is within PTO2 AND positionReached status is received.
-            while not (self.__isWithinTol(DPOS) and self.isPositionReached()):
-
-                # Check if stage is at left end or right end. ==> out of range movement.
-                if self.isAtLeftEnd() or self.isAtRightEnd():
-                    # TODO: fix this so it does not go off while positioning on the limit value. 
-                    outputConsole("DPOS is out or range. (1) " + getDposEposString(value, self.getEPOS(), unit), True)
-                    error = True
-                    return False
-
-                # # Position reached flag is set, but EPOS not within tolerance of DPOS.
-                # if self.isPositionReached() and not self.__isWithinTol(DPOS):
-                # # if self.isPositionReached():
-                #     # Check if it's a lineair stage and DPOS is beyond it's limits.
-                #     if self.stage.isLineair and (
-                #             int(self.getSetting("LLIM")) > int(DPOS) or int(self.getSetting("HLIM")) < int(DPOS)):
-                #         outputConsole("DPOS is out or range.(2)" + getDposEposString(value, self.getEPOS(), unit), True)
-                #         error = True
-                #         break
-
-                #     # EPOS is not within tolerance of DPOS, unknown reason.
-                #     outputConsole("Position not reached. (3) " + getDposEposString(value, self.getEPOS(), unit), True)
-                #     error = True
-                #     break
-                
-                # if self.isEncoderError():
-                #     outputConsole("Position not reached. (4). Encoder gave an error.", True)
-                #     error = True
-                #     return False
-                    
-                if self.isErrorLimit():
-                    outputConsole("Position not reached. (5) ELIM Triggered.", True)
-                    error = True
-                    return False
-
-                if self.isSafetyTimeoutTriggered():
-                    outputConsole("Position not reached. (6) TOU2 (Timeout 2) triggered.", True)
-                    error = True
-                    return False
-
-                if self.isPositionFailTriggered():
-                    outputConsole("Position not reached. (8) TOU3 (Timeout 3) triggered, 'position fail' status bit 21 went high. ", True)
-                    error = True
-                    return False
-
-                if self.isThermalProtection1() or self.isThermalProtection2():
-                    outputConsole("Position not reached. (7) amplifier error.", True)
-                    error = True
-                    return False
-
-                # # This movement took too long, timeout time is estimated with speed & distance.
-                # if self.__timeOutReached(send_time, distance):
-                #     outputConsole(
-                #         "Position not reached, timeout reached. (4) " + getDposEposString(value, self.getEPOS(), unit),
-                #         True)
-                #     error = True
-                #     break
-                # Keep polling ==> if timeout is not done, the computer will poll too fast. The microcontroller can't follow.
-                
-                time.sleep(0.01)
+            # Only made when it's waited for, a handle stays registered in data_callbacks until the movement is done.
+            handle = MoveHandle(self, DPOS, value, unit)
+            if not handle.wait(timeout):
+                if handle.error is not None:
+                    # The status bits showed an end stop, error limit, timeouts, amplifier errors...
+                    outputConsole(handle.error + " " + getDposEposString(value, self.getEPOS(), unit), True)
+                else:
+                    outputConsole(
+                        "Position not reached, timeout reached. (4) " + getDposEposString(value, self.getEPOS(), unit),
+                        True)
+                return False
 
-        if outputToConsole and error is False and DISABLE_WAITING is False:  # Output new DPOS & EPOS if necessary
+        if outputToConsole and DISABLE_WAITING is False:  # Output new DPOS & EPOS if necessary
             outputConsole(getDposEposString(value, self.getEPOS(), unit))
         
         return True
 
+    def streamWaypoints(self, positions, differentUnits=None, dwell=None, timeout=None, blocking=True):
+        """
+        :param positions: The positions to go to, one after the other (a list, NumPy array...).
+        :param differentUnits: If the positions aren't specified in the current units, specify the correct units.
+        :type differentUnits: Units
+        :param dwell: Time in seconds to stay at each position before going to the next one.
+                      A number (the same for each position) or a list with a time for each position. None: no dwell.
+        :param timeout: Maximum time in seconds to wait for all positions. None waits until the last one is reached.
+        :param blocking: If False, this function returns a WaypointStream right after sending the first DPOS.
+        :return: True if all positions are reached, False if not. A WaypointStream if blocking is False.
+        All positions are converted to encoder units and checked against LLIM & HLIM before anything is send.
+        The next DPOS is send by the communication thread as soon as the previous position is reached,
+        so there is no round trip to this thread in between. The arrival times are in WaypointStream.arrival_times.
+        """
+        unit = self.units
+        if differentUnits is not None:
+            unit = differentUnits
+        values = list(positions)
+        if len(values) == 0:
+            raise Exception("No waypoints specified.")
+        DPOS = self.convertUnitsToEncoderBatch(values, unit)
+        DPOS = DPOS.tolist() if np is not None else [int(value) for value in DPOS]
+
+        LLIM = self.getSetting("LLIM")
+        HLIM = self.getSetting("HLIM")
+        for index, position in enumerate(DPOS):
+            if (LLIM is not None and position < int(LLIM)) or (HLIM is not None and position > int(HLIM)):
+                raise Exception("Waypoint " + str(index) + " (" + str(values[index]) + " " + str(unit) +
+                                ") is out of range, it's outside LLIM and HLIM.")
+
+        if dwell is None or isinstance(dwell, (int, float)):
+            dwell = [dwell or 0] * len(DPOS)
+        else:
+            dwell = list(dwell)
+            if len(dwell) != len(DPOS):
+                raise Exception("Specify a dwell time for each waypoint, or a single dwell time.")
+
+        self.was_valid_DPOS = True
+        stream = WaypointStream(self, DPOS, values, unit, dwell)
+        if not blocking:
+            return stream
+
+        if not stream.wait(timeout):
+            if stream.error is not None:
+                outputConsole(stream.error + " " + getDposEposString(values[len(stream.arrival_times)], self.getEPOS(), unit), True)
+            else:
+                outputConsole("Waypoints not reached, timeout reached. (4) " + str(len(stream.arrival_times)) + " of " +
+                              str(len(DPOS)) + " reached.", True)
+            return False
+        return True
+
+    def isDPOSReached(self, DPOS):
+        """
+        :param DPOS: The desired position in encoder units.
+        :return: True if EPOS is within PTO2 of DPOS AND the "position reached" flag is set.
+        """
+        return bool(self.__isWithinTol(DPOS) and self.isPositionReached())
+
+    def getMoveError(self):
+        """
+        :return: A message explaining why the current movement failed, or None if there is no error.
+        It checks the status bits for an end stop, error limit, safety timeouts and amplifier errors.
+        """
+        # Check if stage is at left end or right end. ==> out of range movement.
+        if self.isAtLeftEnd() or self.isAtRightEnd():
+            # TODO: fix this so it does not go off while positioning on the limit value. 
+            return "DPOS is out or range. (1)"
+
+        # if self.isEncoderError():
+        #     return "Position not reached. (4). Encoder gave an error."
+
+        if self.isErrorLimit():
+            return "Position not reached. (5) ELIM Triggered."
+
+        if self.isSafetyTimeoutTriggered():
+            return "Position not reached. (6) TOU2 (Timeout 2) triggered."
+
+        if self.isPositionFailTriggered():
+            return "Position not reached. (8) TOU3 (Timeout 3) triggered, 'position fail' status bit 21 went high."
+
+        if self.isThermalProtection1() or self.isThermalProtection2():
+            return "Position not reached. (7) amplifier error."
+
+        return None
+
 
 
     def setTRGS(self, value):
@@ -525,13 +1364,30 @@ class Axis:
         """
         return self.units
 
-    def step(self, value, forceWaiting = False):
+    def step(self, value, forceWaiting = False, blocking=True):
         """
         :param value: The amount it needs to step (specified in the current units)
+        :param blocking: If False, this function doesn't wait and returns a MoveHandle right after sending DPOS.
         If this axis has a rotating stage, this function handles the "wrapping". (Going around in a full circle)
         This function makes use of sendCommand, which blocks the program until the desired position is reached.
         """
         step = self.convertUnitsToEncoder(value, self.units)
+        new_DPOS = self.getStepDPOS(step)
+        if not blocking:
+            return self.setDPOS(new_DPOS, Units.enc, False, blocking=False)
+
+        self.setDPOS(new_DPOS, Units.enc, False, forceWaiting=forceWaiting)  # This is used so position is checked in here.
+        if DISABLE_WAITING is False:
+            self.__waitForUpdate()  # Waits a couple of updates, so the EPOS is valid and doesn't lagg behind.
+            outputConsole("Stepped: " + str(self.convertEncoderUnitsToUnits(step, self.units)) + " " + str(
+                self.units) + " " + getDposEposString(self.getDPOS(), self.getEPOS(), self.units))
+
+    def getStepDPOS(self, step):
+        """
+        :param step: The amount it needs to step, in encoder units.
+        :return: The new DPOS (in encoder units) after taking this step.
+        If this axis has a rotating stage, the "wrapping" is handled here.
+        """
         if self.was_valid_DPOS:
             # If the previous DPOS was valid, DPOS is taken as a refrence.
             new_DPOS = int(self.getData("DPOS")) + step
@@ -544,18 +1400,13 @@ class Axis:
             # -180 *(val // 180 % 2) + (val % 180)
             encoderUnitsPerRevolution = self.convertUnitsToEncoder(360, Units.deg)
             new_DPOS = -encoderUnitsPerRevolution/2 * (new_DPOS // (encoderUnitsPerRevolution/2) % 2) + (new_DPOS % (encoderUnitsPerRevolution/2))
-
-        self.setDPOS(new_DPOS, Units.enc, False, forceWaiting=forceWaiting)  # This is used so position is checked in here.
-        if DISABLE_WAITING is False:
-            self.__waitForUpdate()  # Waits a couple of updates, so the EPOS is valid and doesn't lagg behind.
-            outputConsole("Stepped: " + str(self.convertEncoderUnitsToUnits(step, self.units)) + " " + str(
-                self.units) + " " + getDposEposString(self.getDPOS(), self.getEPOS(), self.units))
+        return new_DPOS
 
     def getEPOS(self):
         """
         :return: Returns the EPOS in the correct units this axis is working in.
         """
-        return self.convertEncoderUnitsToUnits(self.getData("EPOS"), self.units)
+        return self.convertEncoderUnitsToUnits(self.epos, self.units)
 
     def setUnits(self, units):
         """
@@ -564,29 +1415,55 @@ class Axis:
         """
         self.units = units
 
-    def startLogging(self, increase_poli = True):
+    def startLogging(self, increase_poli = True, capacity = None, filename = None):
         """
+        :param capacity: The maximum number of samples to keep, default LOG_CAPACITY. Older samples are overwritten.
+        :param filename: If specified, the data is streamed to this file instead of kept in memory. (See LogFileSink)
         This function starts logging all data that the controller sends.
         It updates the POLI (Polling Interval) to get more data.
         """
+        self.isLogging = False
+        if self.log_buffer is not None:
+            self.log_buffer.close()  # A previous log to a file is written and closed, even if endLogging() wasn't called.
+        if filename is not None:
+            self.log_buffer = LogFileSink(filename)
+        else:
+            self.log_buffer = LogBuffer(LOG_CAPACITY if capacity is None else capacity)
         self.isLogging = True
         if increase_poli:
+            self.xeryon_object.getAllAxis()[0].logging_poli = True
+            self.logging_poli = True
             self.xeryon_object.getAllAxis()[0].setSetting("POLI", "1") #also adapt it for the master
             self.setSetting("POLI", "1")
         self.__waitForUpdate()  # To make sure the POLI is set.
         # DISABLE_WAITING isn't checked here, because it is really necessary.
 
-    def endLogging(self, convertTimeAndEpos=False):
+    def endLogging(self, convertTimeAndEpos=False, views=False):
         """
         This function stops the logging of all the data.
         It updates the POLI (Polling Interval) back to the default value.
+        :param convertTimeAndEpos: If True, TIME is converted to ms since the start of the log and EPOS to the current units.
+                                   If NumPy is installed, "VELOCITY" (units/s) and "ACCELERATION" (units/s^2) are added.
+        :param views: If True, each column is a view on the log instead of a list, nothing is copied: a memoryview
+                      (see LogBuffer.getLogViews), or when logging to a file, the column memory-mapped from the file
+                      (see LogFileSink.getLogViews).
+        :return: A dictionary of the form { "EPOS": [...,...,...], "DPOS": [...,...,...], "STAT":[...,...,...],...}
+                 All columns have the same length, they are lists for both a log in memory and a log to a file.
+                 If convertTimeAndEpos is True and NumPy is installed, each column is a NumPy array.
         """
         self.isLogging = False
-        logs = self.logs  # Store logs
-        self.logs = {}  # Reset logs
+        logs = {}
+        if self.log_buffer is not None:
+            if views or (convertTimeAndEpos and np is not None):
+                logs = self.log_buffer.getLogViews()  # The conversion makes NumPy arrays of them anyway.
+            else:
+                logs = self.log_buffer.getLogs()
 
         # Process time & epos logs
         if convertTimeAndEpos:
+            if np is not None:
+                logs = self.__convertLogs(logs)
+            else:
                 timestamps = [0]
                 for i in range(1, len(logs["TIME"])):
                     t= logs["TIME"][i]
@@ -597,18 +1474,123 @@ class Axis:
                     
                     timestamps.append(round(timestamps[-1] + dT,2))
                 
-                epos_in_units = [self.convertEncoderUnitsToUnits(pos) for pos in logs["EPOS"]]
+                epos_in_units = self.convertEncoderUnitsToUnitsBatch(logs["EPOS"])
 
                 logs["TIME"] = timestamps
                 logs["EPOS"] = epos_in_units
 
-        self.setSetting("POLI", str(self.def_poli_value))  # Restore POLI back to default value.
-        self.xeryon_object.getAllAxis()[0].setSetting("POLI", str(self.def_poli_value))  #also adapt it for the master
+        # Restore POLI back to default value, or to the adaptive value. (Also for the master)
+        for axis in set([self, self.xeryon_object.getAllAxis()[0]]):
+            axis.logging_poli = False
+            axis.__restorePOLI()
+        return logs
+
+    def __convertLogs(self, logs):
+        """
+        :param logs: The logs as returned by LogBuffer.getLogViews().
+        :return: The logs as NumPy arrays, TIME in ms and EPOS in the current units, with VELOCITY and ACCELERATION added.
+        Same result as the conversion in endLogging, but vectorized.
+        """
+        logs = {tag: np.asarray(column) for tag, column in logs.items()}
+
+        # The TIME counter (in 0.1 ms) wraps around at 2**16, so the steps are taken modulo 2**16.
+        steps = np.diff(logs["TIME"].astype(np.int64)) % 2**16
+        timestamps = np.concatenate(([0], np.cumsum(steps))) / 10  # /10 to convert to ms
+        epos_in_units = self.convertEncoderUnitsToUnitsBatch(logs["EPOS"])
+
+        velocity = np.zeros(len(timestamps))
+        acceleration = np.zeros(len(timestamps))
+        if len(timestamps) >= 2:
+            with np.errstate(divide="ignore", invalid="ignore"):  # Two samples with the same TIME.
+                velocity = np.gradient(epos_in_units, timestamps) * 1000  # units/ms ==> units/s
+                acceleration = np.gradient(velocity, timestamps) * 1000
+
+        logs["TIME"] = np.round(timestamps, 2)
+        logs["EPOS"] = epos_in_units
+        logs["VELOCITY"] = velocity
+        logs["ACCELERATION"] = acceleration
         return logs
 
     def getFrequency(self):
         return self.getData("FREQ")
 
+    def enableAdaptivePolling(self, enable=True, active=POLI_ACTIVE, idle=POLI_IDLE, idle_delay=POLI_IDLE_DELAY):
+        """
+        :param enable: True to enable adaptive polling, False to go back to the default POLI.
+        :param active: POLI (in ms) while the axis is active.
+        :param idle: POLI (in ms) while the axis is idle.
+        :param idle_delay: The time in seconds the axis has to be idle before POLI goes to the idle value.
+        The axis is active while it moves (it isn't settled, see isSettled()), scans or searches its index,
+        from the moment DPOS, STEP, SCAN, MOVE or INDX is send, and while something waits for its motion (setDPOS,
+        waitFor, MoveHandle, IndexHandle...). Other data_callbacks, e.g. a logger, don't keep it active.
+        This gives fast feedback while moving and a quiet serial link while idle.
+        While logging (startLogging), POLI stays at 1.
+        """
+        with self.poli_lock:
+            self.adaptive_poli = (int(active), int(idle), idle_delay) if enable else None
+            self.poli_active = False
+            self.idle_since = None
+        if enable:
+            self.__updatePolling(self.isActive())
+            if not self.poli_active and not self.logging_poli:
+                self.setSetting("POLI", str(int(idle)))
+        else:
+            self.__restorePOLI()
+
+    def isActive(self):
+        """
+        :return: True if the axis is moving, scanning, searching its index or something is waiting for its motion.
+        Used by the adaptive polling, see enableAdaptivePolling().
+        """
+        if self.waiting_nb > 0 or self.stat & STAT_ACTIVE_MASK:
+            return True
+        for callback in list(self.data_callbacks):
+            if isinstance(getattr(callback, "__self__", None), (MoveHandle, IndexHandle)):
+                return True  # A movement or index search that isn't done yet.
+        return not self.isSettled()
+
+    def __updatePolling(self, active=None):
+        """
+        :param active: True if the axis is active, None checks it with isActive().
+        Switches POLI to the active value right away, or to the idle value once the axis is idle for the idle delay.
+        This is called for each STAT update, each motion command and each waitFor() when adaptive polling is enabled,
+        and by the MoveWatchdog when the idle delay is over, so it doesn't depend on a STAT update coming in then.
+        """
+        if self.adaptive_poli is None or self.logging_poli:
+            return
+        if active is None:
+            active = self.isActive()
+        with self.poli_lock:
+            if self.adaptive_poli is None:
+                return
+            active_poli, idle_poli, idle_delay = self.adaptive_poli
+            poli = None
+            if active:
+                self.idle_since = None
+                if not self.poli_active:
+                    self.poli_active = True
+                    poli = active_poli
+            elif self.poli_active:
+                now = time.monotonic()
+                if self.idle_since is None:
+                    self.idle_since = now  # Hysteresis: only go back to idle after the idle delay.
+                    move_watchdog.watch(IdleCheck(self, now, self.__updatePolling))
+                elif now - self.idle_since >= idle_delay:
+                    self.poli_active = False
+                    poli = idle_poli
+            if poli is not None:
+                self.setSetting("POLI", str(poli))
+
+    def __restorePOLI(self):
+        """
+        Sets POLI back to the default value, or to the current adaptive value if adaptive polling is enabled.
+        """
+        if self.adaptive_poli is not None:
+            with self.poli_lock:
+                self.setSetting("POLI", str(self.adaptive_poli[0] if self.poli_active else self.adaptive_poli[1]))
+        else:
+            self.setSetting("POLI", str(self.def_poli_value))
+
     def setSetting(self, tag, value, fromSettingsFile=False, doNotSendThrough=False):
         """
         :param tag: The tag that needs to be stored
@@ -623,14 +1605,17 @@ class Axis:
                 tag = "CFRQ"
         if "?" not in str(value):
             self.settings.update({tag: value})
+            if fromSettingsFile:
+                self.file_settings.update({tag: value})
         # a change: settings are send when they are set.
         if not doNotSendThrough:
             self.__sendCommand(str(tag) + "=" + str(value))
 
-    def startScan(self, direction, execTime=None, untilLimit=False):
+    def startScan(self, direction, execTime=None, untilLimit=False, timeout=None):
         """
         :param direction: Positive or negative number.
         :param execTime: Specify the execution time in seconds. If no time is specified, it scans until scanStop() is used.
+        :param timeout: Only used with untilLimit. Maximum time in seconds to wait for the limit.
         :return:
         This function starts a scan.
         A scan is a continous movement with fixed speed. The speed is maintained by closed-loop control.
@@ -649,11 +1634,12 @@ class Axis:
         if untilLimit: # Wait until the software limit is hit. 
             self.__waitForUpdate()
             if int(direction) > 0:
-                while not self.isAtRightEnd():
-                    time.sleep(0.1) # TODO: Find a better solution
+                limitReached = self.waitFor(self.isAtRightEnd, timeout)
             else:
-                while not self.isAtLeftEnd():
-                    time.sleep(0.1) # TODO: Find a better solution
+                limitReached = self.waitFor(self.isAtLeftEnd, timeout)
+            if not limitReached:
+                outputConsole("Limit not reached, timeout reached.", True)
+            return limitReached
 
     def stopScan(self):
         """
@@ -696,9 +1682,11 @@ class Axis:
         """
         self.setSetting("PTO2", value)
 
-    def sendCommand(self, command):
+    def sendCommand(self, command, block=True):
         """
         :param command: the command that needs to be send.
+        :param block: Only for commands that aren't settings (DPOS, STOP...). If False, it never waits for room
+                      in the send queue, see Communication.sendCommand().
         This function is used to let the user send commands.
         If one of the 'setting commands' are used, it is detected.
         This way the settings are saved in self.settings
@@ -708,122 +1696,175 @@ class Axis:
         value = str(command.split("=")[1])
 
         if tag in NOT_SETTING_COMMANDS:
-            self.__sendCommand(command)  # These settings are not stored.
+            self.__sendCommand(command, block)  # These settings are not stored.
         else:
             self.setSetting(tag, value)  # These settings are stored
 
+    def query(self, tag):
+        """
+        :param tag: The tag of the setting or data, e.g. "HLIM" or "SRNO".
+        :return: A concurrent.futures.Future with the answer of the controller.
+        This function sends "TAG=?" and returns right away.
+        The future completes as soon as the controller answers, with the value as an integer (or a string if it isn't numeric).
+        Use future.result(timeout) to wait for it. The answer is also stored, like any other received value.
+        """
+        future = concurrent.futures.Future()
+        with self.query_lock:
+            waiting = [waiting for waiting in self.pending_queries.get(tag, []) if not waiting.done()]
+            waiting.append(future)
+            self.pending_queries[tag] = waiting
+        self.__sendCommand(str(tag) + "=?")
+        return future
+
+    def queryMany(self, tags, timeout=None):
+        """
+        :param tags: A list of tags, e.g. ["HLIM", "LLIM"].
+        :param timeout: If specified, wait at most this many seconds for all answers, see waitForAnswers().
+        :return: A dictionary {tag: Future}.
+        All questions are written to the controller at once.
+        """
+        with self.xeryon_object.getCommunication().send_condition:
+            futures = {tag: Axis.query(self, tag) for tag in tags}  # Not self.query(), AsyncAxis.query() is a coroutine.
+        if timeout is not None:
+            waitForAnswers(futures.values(), timeout)
+        return futures
+
+    def __answerQueries(self, tag, value):
+        # Completes the futures of the questions for this tag, see query().
+        with self.query_lock:
+            waiting = self.pending_queries.pop(tag, None)
+        if waiting is not None:
+            for future in waiting:
+                try:
+                    future.set_result(value)
+                except concurrent.futures.InvalidStateError:
+                    pass  # Cancelled, or it timed out in waitForAnswers().
+
+    def getRoundTripTime(self):
+        """
+        :return: The smoothed time in seconds from writing a command for this axis until the controller confirms it.
+                 None if it isn't measured (yet), see Xeryon.enableAcknowledgedMode().
+        """
+        window = self.xeryon_object.getCommunication().window
+        if window is None:
+            return None
+        rtt = window.rtt.get(None if self.xeryon_object.isSingleAxisSystem() else self.axis_letter)
+        return rtt[0] if rtt is not None else None
+
     def reset(self):
         """
         Reset this axis.
         """
         self.sendCommand("RSET=0")
         self.was_valid_DPOS = False
+        self.estimated_position = None  # EPOS jumps after a reset, start estimating again.
 
     """
         Here all the status bits are checked.
+        The STAT value is decoded once when it's received (see __receiveSTAT), these are just bit tests.
     """
 
     def isThermalProtection1(self, external_stat = None):
         """
         :return: True if the "Thermal Protection 1" flag is set to true.
         """
-        return self.__getStatBitAtIndex(2, external_stat) == "1"
+        return self.__isStatBitSet(2, external_stat)
 
     def isThermalProtection2(self, external_stat = None):
         """
         :return: True if the "Thermal Protection 2" flag is set to true.
         """
-        return self.__getStatBitAtIndex(3, external_stat) == "1"
+        return self.__isStatBitSet(3, external_stat)
 
     def isForceZero(self, external_stat = None):
         """
         :return: True if the "Force Zero" flag is set to true.
         """
-        return self.__getStatBitAtIndex(4, external_stat) == "1"
+        return self.__isStatBitSet(4, external_stat)
 
     def isMotorOn(self, external_stat = None):
         """
         :return: True if the "Motor On" flag is set to true.
         """
-        return self.__getStatBitAtIndex(5, external_stat) == "1"
+        return self.__isStatBitSet(5, external_stat)
 
     def isClosedLoop(self, external_stat = None):
         """
         :return: True if the "Closed Loop" flag is set to true.
         """
-        return self.__getStatBitAtIndex(6, external_stat) == "1"
+        return self.__isStatBitSet(6, external_stat)
 
     def isEncoderAtIndex(self, external_stat = None):
         """
         :return: True if the "Encoder index" flag is set to true.
         """
-        return self.__getStatBitAtIndex(7, external_stat) == "1"
+        return self.__isStatBitSet(7, external_stat)
 
     def isEncoderValid(self, external_stat = None):
         """
         :return: True if the "Encoder Valid" flag is set to true.
         """
-        return self.__getStatBitAtIndex(8, external_stat) == "1"
+        return self.__isStatBitSet(8, external_stat)
 
     def isSearchingIndex(self, external_stat = None):
         """
         :return: True if the "Searching index" flag is set to true.
         """
-        return self.__getStatBitAtIndex(9, external_stat) == "1"
+        return self.__isStatBitSet(9, external_stat)
 
     def isPositionReached(self, external_stat = None):
         """
         :return: True if the position reached flag is set to true.
         """
-        return self.__getStatBitAtIndex(10, external_stat) == "1"
+        return self.__isStatBitSet(10, external_stat)
 
     def isEncoderError(self, external_stat = None):
         """
         :return: True if the "Encoder Error" flag is set to true.
         """
-        return self.__getStatBitAtIndex(12, external_stat) == "1"
+        return self.__isStatBitSet(12, external_stat)
 
     def isScanning(self, external_stat = None):
         """
         :return: True if the "Scanning" flag is set to true.
         """
-        return self.__getStatBitAtIndex(13, external_stat) == "1"
+        return self.__isStatBitSet(13, external_stat)
 
     def isAtLeftEnd(self, external_stat = None):
         """
         :return: True if the "Left end stop" flag is set to true.
         """
-        return self.__getStatBitAtIndex(14, external_stat) == "1"
+        return self.__isStatBitSet(14, external_stat)
 
     def isAtRightEnd(self, external_stat = None):
         """
         :return: True if the "Right end stop" flag is set to true.
         """
-        return self.__getStatBitAtIndex(15, external_stat) == "1"
+        return self.__isStatBitSet(15, external_stat)
 
     def isErrorLimit(self, external_stat = None):
         """
         :return: True if the "ErrorLimit" flag is set to true.
         """
-        return self.__getStatBitAtIndex(16, external_stat) == "1"
+        return self.__isStatBitSet(16, external_stat)
 
     def isSearchingOptimalFrequency(self, external_stat = None):
         """
         :return: True if the "Searching Optimal Frequency" flag is set to true.
         """
-        return self.__getStatBitAtIndex(17, external_stat) == "1"
+        return self.__isStatBitSet(17, external_stat)
 
     def isSafetyTimeoutTriggered(self, external_stat = None):
         """
         :return: True if the "Safety timeout triggered" flag is set to true.
         """
-        return self.__getStatBitAtIndex(18, external_stat) == "1"
+        return self.__isStatBitSet(18, external_stat)
 
     def isPositionFailTriggered(self, external_stat = None):
         """
         :return: True if the "Position fail " flag is set to true.
         """
-        return self.__getStatBitAtIndex(21, external_stat) == "1"
+        return self.__isStatBitSet(21, external_stat)
 
 
     def getLetter(self):
@@ -878,8 +1919,20 @@ class Axis:
         self.axis_letter = axis_letter
         self.xeryon_object = xeryon_object
         self.stage = stage
-        self.axis_data = dict({"EPOS": 0, "DPOS": 0, "STAT": 0, "SSPD":0, "TIME":0})
+        self.unit_factors = self.__computeUnitFactors()
+        self.unit_operands = self.__computeUnitOperands()
+        self.axis_data = dict({"EPOS": 0, "DPOS": 0, "STAT": 0, "SSPD":0, "TIME":0, "VELO_MS":0})
         self.settings = dict({})
+        self.file_settings = {}
+        self.update_condition = threading.Condition()
+        self.data_callbacks = []
+        self.pending_queries = {}
+        self.query_lock = threading.Lock()
+        self.value_handlers = {"EPOS": self.__receiveEPOS, "STAT": self.__receiveSTAT, "TIME": self.__receiveTIME}
+        self.stat = 0
+        self.epos = 0
+        self.status_flags = StatusFlags(0)
+        self.poli_lock = threading.Lock()
         if self.stage.isLineair:
             self.units = Units.mm
         else:
@@ -912,38 +1965,45 @@ class Axis:
         :param DPOS: The desired position
         :return: True if EPOS is within PTO2 of DPOS. (PTO2 = Position Tolerance 2)
         """
-        DPOS = abs(int(DPOS))
+        DPOS = int(DPOS)
         if self.getSetting("PTO2") is not None:
             PTO2 = int(self.getSetting("PTO2"))
         elif self.getSetting("PTOL") is not None:
             PTO2 = int(self.getSetting("PTOL"))
         else:
             PTO2 = 10 #TODO
-        EPOS = abs(int(self.getData("EPOS")))
+        EPOS = self.epos
 
         if DPOS - PTO2 <= EPOS <= DPOS + PTO2:
             return True
 
-    def __timeOutReached(self, start_time, distance):
-        """
-        :param start_time:  The time the command started in ms.
-        :param distance:    The distance the stage needs to travel.
-        :return: True if the timeout time has been reached.
-        The timeout time is calculated based on the speed (SSPD) and the distance.
-        """
-        t = getActualTime()
-        speed = int(self.getSetting("SSPD"))
-        timeout_t = (distance / speed * 1000)  # Convert seconds to milliseconds
-        timeout_t *= 1.25  # 25% safety factor
-
-        # For quick and tiny movements, the method above is not accurate.
-        # If the timeout_t is smaller than the specified TOUT&TOU2, use TOUT+TOU2
-        if self.getSetting("TOUT") is not None:
-            TOUT = int(self.getSetting("TOUT"))*3
-            if TOUT > timeout_t:
-                timeout_t = TOUT
-
-        return (t - start_time) > timeout_t
+    def estimateMoveTime(self, distance):
+        """
+        :param distance: The distance to travel, in encoder units.
+        :return: The expected duration of the movement in seconds, None if the speed (SSPD) isn't known.
+        The stage accelerates with ACCE up to SSPD and decelerates with DECE (a trapezoidal profile).
+        If the distance is too short to reach SSPD, the profile is a triangle.
+        Without ACCE or DECE, the speed is reached right away.
+        """
+        SSPD = self.getSetting("SSPD")
+        if SSPD is None or float(SSPD) <= 0:
+            return None
+        # SSPD is in um/s (linear) or 0.01 deg/s (rotating), see speedMultiplier. ==> encoder units/s
+        factor = self.__getUnitFactor(Units.mm if self.stage.isLineair else Units.deg) / self.stage.speedMultiplier
+        speed = float(SSPD) * factor
+        distance = abs(distance)
+        ACCE = self.getSetting("ACCE")
+        DECE = self.getSetting("DECE")
+        if ACCE is None or DECE is None or float(ACCE) <= 0 or float(DECE) <= 0:
+            return distance / speed
+        acceleration = float(ACCE) * ACCE_MULTIPLIER * factor
+        deceleration = float(DECE) * ACCE_MULTIPLIER * factor
+
+        ramps = speed * speed / (2 * acceleration) + speed * speed / (2 * deceleration)  # Distance to speed up and slow down.
+        if ramps <= distance:
+            return speed / acceleration + speed / deceleration + (distance - ramps) / speed
+        peak = math.sqrt(2 * distance * acceleration * deceleration / (acceleration + deceleration))
+        return peak / acceleration + peak / deceleration
 
     def receiveData(self, data):
         """
@@ -953,91 +2013,217 @@ class Axis:
         eg: if "EPOS=5" is send, it stores "EPOS", "5".
         If logging is enabled, this function will store the new incoming data.
         """
-        if "=" in data:
-            tag = data.split("=")[0]
-            val = data.split("=")[1].rstrip("\n\r").replace(" ", "")
-            
-            if is_numeric(val):
-                if tag not in NOT_SETTING_COMMANDS and "EPOS" not in tag and "DPOS" not in tag:  # The received command is a setting that's requested.
-                    self.setSetting(tag, val, doNotSendThrough=True) # Do not send a received value, it can create a loop. (Setting, reading, setting)
-                else:
-                    self.axis_data[tag] = val
+        tag, separator, val = data.partition("=")
+        if separator:
+            self.receiveValue(tag, val.rstrip("\n\r").replace(" ", ""))
+
+    def receiveValue(self, tag, val):
+        """
+        :param tag: The tag of the received data, e.g. "EPOS".
+        :param val: The received value (a string).
+        :return: None
+        Same as receiveData(), for data that is already split into tag and value. (Used by the Communication class)
+        Tags with extra processing (EPOS, STAT, TIME) are dispatched through value_handlers.
+        """
+        try:
+            value = int(val)
+        except ValueError:
+            if self.pending_queries and tag in self.pending_queries:
+                self.__answerQueries(tag, val)
+            if self.data_callbacks:  # E.g. readIdentity() waits for SOFT, which doesn't have to be a number.
+                for callback in list(self.data_callbacks):
+                    callback(tag, val)
+            return  # Only numeric values are processed.
+
+        if tag in DATA_TAGS:
+            self.axis_data[tag] = val  # As a string, like getData() always returned it. The handlers get the integer.
+        else:  # The received command is a setting that's requested.
+            self.setSetting(tag, val, doNotSendThrough=True) # Do not send a received value, it can create a loop. (Setting, reading, setting)
+
+        if self.pending_queries and tag in self.pending_queries:  # Answered after storing, so getSetting() agrees with the answer.
+            self.__answerQueries(tag, value)
+
+        handler = self.value_handlers.get(tag)
+        if handler is not None:
+            handler(value)
+
+        if self.data_callbacks:
+            for callback in list(self.data_callbacks):
+                callback(tag, val)
+
+        if self.isLogging:  # Log all received data if logging is enabled.
+            if tag not in NOT_LOGGED_TAGS:  # This data is useless.
+                self.log_buffer.add(tag, value)
+
+    def __receiveEPOS(self, value):
+        # This uses "EPOS" as an indicator that a new round of data is coming in.
+        self.epos = value
+        if self.update_time is not None:
+            self.__updateEstimate(value, self.update_time)
+            self.update_time = None
+        else:
+            if self.update_epos is not None and not self.time_received:
+                # Two updates without TIME, the controller doesn't send it. Estimate with the time EPOS arrives instead,
+                # that's less accurate: it includes the jitter of the serial link.
+                self.__updateEstimate(value, int(time.monotonic() * 10000) % 65536)
+            self.update_epos = value
+        self.update_nb += 1  # This update_nb is for the function __waitForUpdate
+        self.__notifyUpdate()
+
+    def __receiveSTAT(self, value):
+        if value != self.stat:
+            self.stat = value
+            self.status_flags = StatusFlags(value)
+        if value & STAT_ERROR_MASK:  # Only decode the separate bits if one of the error bits is set.
+            if self.isSafetyTimeoutTriggered():
+                outputConsole("The safety timeout was triggered (TOU2 command). "
+                            "This means that the stage kept moving and oscillating around the desired position. "
+                            "A reset is required now OR 'ENBL=1' should be send.", True)
+
+            if self.isPositionFailTriggered():
+                outputConsole("Safety timeout TOU3 went off, the 'position fail' status bit went high.")
+
+            if self.isThermalProtection1() or self.isThermalProtection2() or self.isErrorLimit() or self.isSafetyTimeoutTriggered():
+                if self.isErrorLimit():
+                    outputConsole("Error limit is reached (status bit 16). A reset is required now OR 'ENBL=1' should be send.", True)
+
+                if self.isThermalProtection2() or self.isThermalProtection1():
+                    outputConsole("Thermal protection 1 or 2 is raised (status bit 2 or 3). A reset is required now OR 'ENBL=1' should be send.", True)
+
+                if self.isSafetyTimeoutTriggered():
+                    outputConsole("Saftety timeout (TOU2 timeout reached) triggered. A reset is required now OR 'ENBL=1' should be send.", True)
+
+                if AUTO_SEND_ENBL:
+                    self.xeryon_object.setMasterSetting("ENBL", "1")
+                    outputConsole("'ENBL=1' is automatically send.")
+        if self.adaptive_poli is not None:
+            self.__updatePolling()
+        self.__notifyUpdate()
+
+    def __receiveTIME(self, value):
+        if not self.time_received:
+            # Switch from the time EPOS arrives to the TIME of the controller, start estimating again.
+            self.time_received = True
+            self.estimated_position = None
+        # EPOS and TIME of the same update are paired, whichever of both arrives first.
+        if self.update_epos is not None:
+            self.__updateEstimate(self.update_epos, value)
+            self.update_epos = None
+        else:
+            self.update_time = value
+
+    def __updateEstimate(self, epos, time_counter):
+        """
+        :param epos: EPOS of this update, in encoder units.
+        :param time_counter: TIME of this update, in 0.1 ms. It wraps around at 2**16.
+        Updates the alpha-beta-gamma filter that estimates the position, velocity and acceleration.
+        This is ran for each update, it only uses a few numbers and needs no buffer.
+        It uses the TIME the controller sends with each update. As long as the controller sends no TIME, the time
+        EPOS arrives is used instead.
+        The velocity is stored as "VELO_MS" in encoder units/ms. It's also stored and logged as "SSPD" in the units
+        SSPD always had (encoder units/ms divided by 100), so existing logs and scripts stay comparable.
+        """
+        if self.last_time is None or self.estimated_position is None:
+            self.last_time = time_counter
+            self.estimated_position = float(epos)
+            return
+        dt = ((time_counter - self.last_time) % 65536) / 10000  # Unwrap the TIME counter, 0.1 ms ==> s
+        self.last_time = time_counter
+        if dt <= 0:
+            return  # Same update twice.
+
+        theta, alpha, beta, gamma = Axis.estimator_gains
+        if theta != ESTIMATOR_THETA:
+            # Gains of a critically damped (fading memory) filter, calculated again when ESTIMATOR_THETA is changed.
+            theta = ESTIMATOR_THETA
+            alpha = 1 - theta ** 3
+            beta = 1.5 * (1 - theta) ** 2 * (1 + theta)
+            gamma = 0.5 * (1 - theta) ** 3
+            Axis.estimator_gains = (theta, alpha, beta, gamma)
+
+        # Predict where the axis would be now, and correct with the difference to EPOS.
+        velocity = self.velocity
+        acceleration = self.acceleration
+        predicted = self.estimated_position + (velocity + 0.5 * acceleration * dt) * dt
+        residual = epos - predicted
+        self.estimated_position = predicted + alpha * residual
+        self.velocity = velocity = velocity + acceleration * dt + beta * residual / dt
+        self.acceleration = acceleration + 2 * gamma * residual / (dt * dt)
+
+        PTOL = self.settings.get("PTOL")
+        if abs(velocity) * SETTLE_TIME <= (int(PTOL) if PTOL is not None else 1):
+            if self.settled_nb < SETTLE_SAMPLES:
+                self.settled_nb += 1
+        else:
+            self.settled_nb = 0
+
+        self.axis_data["VELO_MS"] = self.velocity / 1000  # encoder units / ms
+        self.axis_data["SSPD"] = self.velocity / 100000  # The scale SSPD always had, see above.
+        if self.isLogging:
+            self.log_buffer.add("SSPD", self.axis_data["SSPD"])
+
+    def getVelocity(self, units = None):
+        """
+        :param units: The units to return the velocity in, default the current units of this axis.
+        :return: The estimated velocity in units per second. Positive towards increasing encoder values.
+        The velocity is estimated from EPOS and TIME of each update, see ESTIMATOR_THETA.
+        """
+        return self.convertEncoderUnitsToUnits(self.velocity, units)
+
+    def getAcceleration(self, units = None):
+        """
+        :param units: The units to return the acceleration in, default the current units of this axis.
+        :return: The estimated acceleration in units per second^2.
+        """
+        return self.convertEncoderUnitsToUnits(self.acceleration, units)
+
+    def isSettled(self):
+        """
+        :return: True if the axis is standing still: for SETTLE_SAMPLES updates in a row, the estimated velocity
+                 would move it less than PTOL in SETTLE_TIME seconds.
+        """
+        return self.settled_nb >= SETTLE_SAMPLES
+
+    def __notifyUpdate(self):
+        # Wake up everything that is waiting for new data. (setDPOS, findIndex, ...)
+        # waitFor() increments waiting_nb before it checks its condition, so no update can be missed here.
+        self.data_nb += 1
+        if self.waiting_nb > 0:
+            with self.update_condition:
+                self.update_condition.notify_all()
 
-                if "STAT" in tag:
-                    if self.isSafetyTimeoutTriggered():
-                        outputConsole("The safety timeout was triggered (TOU2 command). "
-                                    "This means that the stage kept moving and oscillating around the desired position. "
-                                    "A reset is required now OR 'ENBL=1' should be send.", True)
-                    
-                    if self.isPositionFailTriggered():
-                        outputConsole("Safety timeout TOU3 went off, the 'position fail' status bit went high.")
-
-                    if self.isThermalProtection1() or self.isThermalProtection2() or self.isErrorLimit() or self.isSafetyTimeoutTriggered():
-                        if self.isErrorLimit():
-                            outputConsole("Error limit is reached (status bit 16). A reset is required now OR 'ENBL=1' should be send.", True)
-
-                        if self.isThermalProtection2() or self.isThermalProtection1():
-                            outputConsole("Thermal protection 1 or 2 is raised (status bit 2 or 3). A reset is required now OR 'ENBL=1' should be send.", True)
-                        
-                        if self.isSafetyTimeoutTriggered():
-                            outputConsole("Saftety timeout (TOU2 timeout reached) triggered. A reset is required now OR 'ENBL=1' should be send.", True)
-
-                        if AUTO_SEND_ENBL:
-                            self.xeryon_object.setMasterSetting("ENBL", "1")
-                            outputConsole("'ENBL=1' is automatically send.")
-
-                if "EPOS" in tag:  # This uses "EPOS" as an indicator that a new round of data is coming in.
-                    # previous_epos is a list containing two numbers: the two previous EPOS values
-                    self.previous_epos = [self.previous_epos[-1], int(val)]
-                    self.update_nb += 1  # This update_nb is for the function __waitForUpdate
-
-
-
-                if self.isLogging:  # Log all received data if logging is enabled.
-                    if tag not in ["SRNO", "XLS ", "XRTU", "XLA ", "XTRA", "SOFT", "SYNC"]:  # This data is useless.
-                        if self.logs.get(tag) is None:
-                            self.logs[tag] = []
-                        
-                        self.logs[tag].append(int(val))
-
-                if "TIME" in tag:
-                    # CALCULATE SPEED
-                    # previous time is a list containing the last two time samples.
-                    self.previous_time = [self.previous_time[-1], int(val)]
-                    t1 = self.previous_time[0]
-                    t2 = int(val)
-                    if t2 < t1: # unwrap
-                        t2 += 2**16
-
-                    # calculate SSPD
-                    if len(self.previous_epos) >= 2:
-                        if t2 - t1 > 0:
-                            self.axis_data["SSPD"] = (self.previous_epos[1] - self.previous_epos[0])/((t2 - t1)*10) # encoder units / ms
-                            
-                            if self.isLogging:
-                                if self.logs.get("SSPD") is None:
-                                    self.logs["SSPD"] = []
-                                self.logs["SSPD"].append(self.axis_data["SSPD"])
-                    
-                    pass
 
     def getData(self, TAG):
         """
         :param TAG: The tag requested.
         :return: Returns the value of this tag stored, if no data it returns None.
+        The received data (e.g. EPOS, DPOS, STAT, TIME) is stored as the string the controller sent, the estimated
+        speed (SSPD, VELO_MS) as a float. Use int() for the integer, or the epos and stat attributes.
         eg: get("DPOS") returns the value stored for "DPOS".
         """
         return self.axis_data.get(TAG)  # Returnt zelf None als TAG niet bestaat.
 
-    def sendSettings(self):
+    def sendSettings(self, tags = None, fromSettingsFile = False):
         """
+        :param tags: Only send these settings. None sends all settings.
+        :param fromSettingsFile: If True, send the values as they are read from the settings file.
         :return: None
         This function sends ALL settings to the controller.
         """
-        self.__sendCommand(
-            str(self.stage.encoderResolutionCommand))  # This sends: XLS =.. || XRTU=.. || XRTA=.. || XLA =..
-        for tag in self.settings:
-            self.__sendCommand(str(tag) + "=" + str(self.getSetting(tag)))
+        for tag, value in self.getSettingsToSend(fromSettingsFile).items():
+            if tags is None or tag in tags:
+                self.__sendCommand(str(tag) + "=" + str(value))
+
+    def getSettingsToSend(self, fromSettingsFile = False):
+        """
+        :param fromSettingsFile: If True, only the settings as they are read from the settings file.
+        :return: A dictionary {tag: value} with the stage type (XLS =.. || XRTU=.. || XRTA=.. || XLA =..)
+                 and all settings, as sendSettings() sends them.
+        """
+        tag, value = str(self.stage.encoderResolutionCommand).split("=", 1)
+        settings = {tag: value}
+        settings.update(self.file_settings if fromSettingsFile else self.settings)
+        return settings
 
 
     
@@ -1056,28 +2242,8 @@ class Axis:
         """
         if units is None:
             units = self.units
-        value = float(value)
-        if units == Units.mm:
-            return round(value * 10 ** 6 * 1 / self.stage.encoderResolution)
-        elif units == Units.mu:
-            return round(value * 10 ** 3 * 1 / self.stage.encoderResolution)
-        elif units == Units.nm:
-            return round(value * 1 / self.stage.encoderResolution)
-        elif units == Units.inch:
-            return round(value * 25.4 * 10 ** 6 * 1 / self.stage.encoderResolution)
-        elif units == Units.minch:
-            return round(value * 25.4 * 10 ** 3 * 1 / self.stage.encoderResolution)
-        elif units == Units.enc:
-            return round(value)
-        elif units == Units.mrad:
-            return round(value * 10 ** 3 * 1 / self.stage.encoderResolution)
-        elif units == Units.rad:
-            return round(value * 10 ** 6 * 1 / self.stage.encoderResolution)
-        elif units == Units.deg:
-            return round(value * (2 * math.pi) / 360 * 10 ** 6 / self.stage.encoderResolution)
-        else:
-            self.xeryon_object.stop()
-            raise ("Unexpected unit")
+        a, b, c, d = self.__getUnitOperands(units)
+        return round(float(value) * a / b * c / d)
 
     def convertEncoderUnitsToUnits(self, value, units = None):
         """
@@ -1087,32 +2253,98 @@ class Axis:
         """
         if units is None:
             units = self.units
-        value = float(value)
-        if units == Units.mm:
-            return value / (10 ** 6 * 1 / self.stage.encoderResolution)
-        elif units == Units.mu:
-            return value / (10 ** 3 * 1 / self.stage.encoderResolution)
-        elif units == Units.nm:
-            return value / (1 / self.stage.encoderResolution)
-        elif units == Units.inch:
-            return value / (25.4 * 10 ** 6 * 1 / self.stage.encoderResolution)
-        elif units == Units.minch:
-            return value / (25.4 * 10 ** 3 * 1 / self.stage.encoderResolution)
-        elif units == Units.enc:
-            return value
-        elif units == Units.mrad:
-            return value / (10 ** 3 * 1 / self.stage.encoderResolution)
-        elif units == Units.rad:
-            return value / (10 ** 6 * 1 / self.stage.encoderResolution)
-        elif units == Units.deg:
-            return value / ((2 * math.pi) / 360 * 10 ** 6 / self.stage.encoderResolution)
-        else:
+        return float(value) / self.__getUnitFactor(units)
+
+    def convertUnitsToEncoderBatch(self, values, units = None):
+        """
+        :param values: A sequence (list, tuple, NumPy array...) of values that need to be converted into encoder units.
+        :param units: The units the values are in.
+        :return: The values converted into encoder units, rounded the same way as convertUnitsToEncoder.
+                 A NumPy array (int64) if NumPy is installed, else a list.
+        """
+        if units is None:
+            units = self.units
+        a, b, c, d = self.__getUnitOperands(units)
+        if np is not None:
+            # The same operations on the whole array. np.rint rounds half to even, just like round().
+            return np.rint(np.asarray(values, dtype=float) * a / b * c / d).astype(np.int64)
+        return [round(float(value) * a / b * c / d) for value in values]
+
+    def convertEncoderUnitsToUnitsBatch(self, values, units = None):
+        """
+        :param values: A sequence (list, tuple, NumPy array...) of values in encoder units.
+        :param units: The output unit.
+        :return: The values converted into the output unit. A NumPy array if NumPy is installed, else a list.
+        """
+        if units is None:
+            units = self.units
+        factor = self.__getUnitFactor(units)
+        if np is not None:
+            return np.asarray(values, dtype=float) / factor
+        return [float(value) / factor for value in values]
+
+    def __getUnitFactor(self, units):
+        """
+        :return: The number of encoder units in one unit.
+        """
+        factor = self.unit_factors.get(units)
+        if factor is None:
             self.xeryon_object.stop()
-            raise ("Unexpected unit")
+            raise Exception("Unexpected unit: " + str(units))
+        return factor
 
-    def __sendCommand(self, command):
+    def __getUnitOperands(self, units):
+        """
+        :return: The operands (a, b, c, d) to convert a value in units to encoder units, see __computeUnitOperands().
+        """
+        operands = self.unit_operands.get(units)
+        if operands is None:
+            self.xeryon_object.stop()
+            raise Exception("Unexpected unit: " + str(units))
+        return operands
+
+    def __computeUnitOperands(self):
+        """
+        :return: A dictionary {Units: (a, b, c, d)}, a value in that unit is value * a / b * c / d encoder units.
+        These are the same operations, in the same order, as value * 25.4 * 10 ** 6 * 1 / resolution etc.
+        (multiplying or dividing by 1 doesn't change the result). Multiplying by the unit factor instead can round
+        differently, e.g. a result of 0.49999999999999994 becomes 0.5.
+        """
+        resolution = self.stage.encoderResolution
+        return {
+            Units.mm: (10 ** 6, 1, 1, resolution),
+            Units.mu: (10 ** 3, 1, 1, resolution),
+            Units.nm: (1, 1, 1, resolution),
+            Units.inch: (25.4, 1, 10 ** 6, resolution),
+            Units.minch: (25.4, 1, 10 ** 3, resolution),
+            Units.enc: (1, 1, 1, 1),
+            Units.mrad: (10 ** 3, 1, 1, resolution),
+            Units.rad: (10 ** 6, 1, 1, resolution),
+            Units.deg: (2 * math.pi, 360, 10 ** 6, resolution),
+        }
+
+    def __computeUnitFactors(self):
+        """
+        :return: A dictionary {Units: number of encoder units in one unit} for the stage of this axis.
+        This is computed once, when the axis is created.
+        """
+        resolution = self.stage.encoderResolution
+        return {
+            Units.mm: 10 ** 6 * 1 / resolution,
+            Units.mu: 10 ** 3 * 1 / resolution,
+            Units.nm: 1 / resolution,
+            Units.inch: 25.4 * 10 ** 6 * 1 / resolution,
+            Units.minch: 25.4 * 10 ** 3 * 1 / resolution,
+            Units.enc: 1,
+            Units.mrad: 10 ** 3 * 1 / resolution,
+            Units.rad: 10 ** 6 * 1 / resolution,
+            Units.deg: (2 * math.pi) / 360 * 10 ** 6 / resolution,
+        }
+
+    def __sendCommand(self, command, block=True):
         """
         :param command: The command that needs to be send.
+        :param block: If False, never wait for room in the send queue.
         THIS IS A HIDDEN FUNCTION. Just to make sure that the SETTING commands are send via setSetting() and the other commands via sendCommand()
         This function is used to send a command to the controller.
         No "AXIS:" (e.g.: "X:") needs to be specified, just the command.
@@ -1120,13 +2352,16 @@ class Axis:
         tag = command.split("=")[0]
         value = str(command.split("=")[1])
 
+        if self.adaptive_poli is not None and tag in MOTION_COMMANDS:
+            self.__updatePolling(True)  # POLI goes up before the motion starts.
+
         prefix = ""  # In a multi axis system, prefix stores the "LETTER:".
         if not self.xeryon_object.isSingleAxisSystem():
             prefix = self.axis_letter + ":"
 
         # Construct and send the command.
         command = tag + "=" + str(value)
-        self.xeryon_object.getCommunication().sendCommand(prefix + command)
+        self.xeryon_object.getCommunication().sendCommand(prefix + command, block)
 
     def __waitForUpdate(self):
         """
@@ -1140,42 +2375,1222 @@ class Axis:
             wait_nb = wait_nb / int(self.def_poli_value) * int(self.getSetting("POLI"))
 
         start_nb = int(self.update_nb)
-        while (int(self.update_nb) - start_nb) < wait_nb:
-            time.sleep(0.01)  # Wait 10 ms
+        self.waitFor(lambda: (int(self.update_nb) - start_nb) >= wait_nb)
+
+    def waitFor(self, condition, timeout=None):
+        """
+        :param condition: A function without arguments, e.g. axis.isPositionReached.
+        :param timeout: Maximum time to wait in seconds. None waits forever.
+        :return: True if the condition became True, False if the timeout was reached.
+        This function blocks until condition() returns True.
+        The condition is checked again each time EPOS or STAT is received, so there is no polling delay.
+        """
+        if self.adaptive_poli is not None:
+            self.__updatePolling(True)
+        with self.update_condition:
+            self.waiting_nb += 1
+            try:
+                return bool(self.update_condition.wait_for(condition, timeout))
+            finally:
+                self.waiting_nb -= 1
 
-    def __getStatBitAtIndex(self, bit_index, external_stat = None):
-        stat = self.getData("STAT")
+    def __isStatBitSet(self, bit_index, external_stat = None):
+        """
+        :param bit_index: The number of the status bit.
+        :param external_stat: Check this STAT value instead of the last one received.
+        :return: True if the status bit is set.
+        """
         if external_stat is not None:
-            stat = external_stat
+            return (int(external_stat) >> bit_index) & 1 == 1
+        return (self.stat >> bit_index) & 1 == 1
 
-        if stat is not None:
-            bits = bin(int(stat)).replace("0b", "")[::-1]
-            # [::-1 mirrors the string so the status bit numbering is the same.
-            if len(bits) >= bit_index + 1:
-                return bits[bit_index]
-        return "0"
+    def status(self):
+        """
+        :return: All status bits at once, as a StatusFlags object. e.g.:
+                 if StatusFlags.POSITION_REACHED in axis.status(): ...
+        """
+        return self.status_flags
 
 
-class Communication:
-    ser = None  # Holds the serial connection.
-    readyToSend = None  # List that contains commands that are ready to send.
-    stop_thread = False  # Boolean for stopping the thread.
-    thread = None
-    xeryon_object = None  # Link to the "Xeryon" object.
+class MoveHandle:
+    """
+    A MoveHandle follows one movement of an axis, it's returned by setDPOS(..., blocking=False).
+    It checks each EPOS & STAT update of the axis, until the position is reached or a status bit shows an error.
+    Use wait() to block until the movement is done, or moveMany()/waitAll()/asCompleted() for several axes at once.
+    If the movement isn't done by its deadline (MOVE_TIMEOUT_FACTOR times the ETA), it fails with timed_out set,
+    also when the controller doesn't send anything anymore.
+    """
+    axis = None  # The axis that is moving.
+    DPOS = None  # The desired position in encoder units.
+    value = None  # The desired position as it was specified.
+    unit = None  # The units value is specified in.
+    start_time = None  # time.monotonic() when DPOS was send.
+    end_time = None  # time.monotonic() when the movement was done.
+    eta = None  # The expected duration in seconds (see Axis.estimateMoveTime), None if it can't be calculated.
+    deadline = None  # time.monotonic() when the movement times out, None if there is no deadline.
+    reached = False  # True if the position is reached.
+    timed_out = False  # True if the movement failed because it took too long.
+    error = None  # A message explaining why the movement failed, None if there is no error.
+
+    def __init__(self, axis, DPOS, value, unit):
+        self.axis = axis
+        self.DPOS = DPOS
+        self.value = value
+        self.unit = unit
+        self.start_time = time.monotonic()
+        self.end_time = None
+        self.reached = False
+        self.timed_out = False
+        self.error = None
+        self.done_event = threading.Event()
+        self.done_callbacks = []
+        self.wakeup_recorded = False
+        self.lock = threading.Lock()
+        self.eta = axis.estimateMoveTime(DPOS - axis.epos)
+        self.deadline = None
+        if self.eta is not None and MOVE_TIMEOUT_FACTOR is not None and not DEBUG_MODE:
+            self.deadline = self.start_time + self.eta * MOVE_TIMEOUT_FACTOR + MOVE_TIMEOUT_MARGIN
+        axis.data_callbacks.append(self.__onData)
+        self.__check()
+        if self.deadline is not None and not self.done_event.is_set():
+            move_watchdog.watch(self)
+
+    def __onData(self, tag, value):
+        if tag == "EPOS" or tag == "STAT":
+            self.__check()
+
+    def __check(self):
+        if self.done_event.is_set():
+            return
+        if self.axis.isDPOSReached(self.DPOS):
+            self.__finish(None)
+        else:
+            moveError = self.axis.getMoveError()
+            if moveError is not None:
+                self.__finish(moveError)
+
+    def __finish(self, error, timed_out = False):
+        with self.lock:
+            if self.done_event.is_set():
+                return
+            self.end_time = time.monotonic()
+            self.error = error
+            self.reached = error is None
+            self.timed_out = timed_out
+            self.done_event.set()
+            callbacks = list(self.done_callbacks)
+        if self.reached:
+            self.__addMetric("move", self.end_time - self.start_time)
+        if self.__onData in self.axis.data_callbacks:
+            self.axis.data_callbacks.remove(self.__onData)
+        for callback in callbacks:
+            callback(self)
+
+    def done(self):
+        """
+        :return: True if the movement is done: the position is reached or it failed.
+        """
+        return self.done_event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        :param timeout: Maximum time to wait in seconds. None waits until the movement is done, or its deadline.
+        :return: True if the position is reached. False if the movement failed (see error) or the timeout was reached.
+        """
+        self.done_event.wait(timeout)
+        if self.reached and not self.wakeup_recorded:
+            self.wakeup_recorded = True
+            self.__addMetric("wakeup", time.monotonic() - self.end_time)
+        return self.reached
+
+    def result(self, timeout=None):
+        """
+        :param timeout: Maximum time to wait in seconds. None waits until the movement is done, or its deadline.
+        :return: True if the position is reached.
+        Same as wait(), but raises an exception if the position isn't reached: TimeoutError if the movement
+        overran its deadline or the timeout was reached, an Exception with the error otherwise.
+        """
+        if self.wait(timeout):
+            return True
+        if not self.done():
+            raise TimeoutError("Axis " + str(self.axis) + ": position not reached within " + str(timeout) + " s.")
+        if self.timed_out:
+            raise TimeoutError("Axis " + str(self.axis) + ": " + str(self.error))
+        raise Exception("Axis " + str(self.axis) + ": " + str(self.error))
 
-    def __init__(self, xeryon_object, COM_port, baud):
-        self.xeryon_object = xeryon_object
-        self.COM_port = COM_port
-        self.baud = baud
-        self.readyToSend = []
-        self.thread = None
-        self.ser = None
-        pass
+    def getRemainingTime(self):
+        """
+        :return: The time in seconds until the position is expected to be reached (0 if it's overdue),
+                 None if there is no ETA.
+        """
+        if self.eta is None:
+            return None
+        return max(0.0, self.start_time + self.eta - time.monotonic())
+
+    def checkDeadline(self):
+        """
+        Fails the movement if it isn't done by its deadline. (Called by the watchdog)
+        """
+        if self.deadline is None or self.done_event.is_set() or time.monotonic() < self.deadline:
+            return
+        self.__finish("Position not reached, timeout reached. The movement takes longer than " +
+                      str(MOVE_TIMEOUT_FACTOR) + " x its ETA of " + str(round(self.eta, 3)) + " s.", True)
+
+    def __addMetric(self, kind, latency):
+        metrics = self.axis.xeryon_object.getCommunication().metrics
+        if metrics is not None:
+            letter = None if self.axis.xeryon_object.isSingleAxisSystem() else self.axis.axis_letter
+            metrics.addSample(letter, kind, latency)
+
+    def stop(self):
+        """
+        Stops this movement by sending "STOP=0" to the axis.
+        """
+        self.axis.sendCommand("STOP=0")
+        self.axis.was_valid_DPOS = False
+        self.__finish("Movement stopped.")
+
+    def addDoneCallback(self, callback):
+        """
+        :param callback: Function called as callback(handle) when the movement is done.
+        If the movement is already done, it's called immediately.
+        """
+        with self.lock:
+            if not self.done_event.is_set():
+                self.done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def getDuration(self):
+        """
+        :return: The time in seconds from sending DPOS until the movement was done. None if it isn't done yet.
+        """
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def __str__(self):
+        if not self.done():
+            state = "moving"
+            if self.eta is not None:
+                state += ", ETA " + str(round(self.getRemainingTime(), 3)) + " s"
+        elif self.reached:
+            state = "reached in " + str(round(self.getDuration(), 3)) + " s"
+        else:
+            state = "failed: " + str(self.error)
+        return "Axis " + str(self.axis) + " to " + str(self.value) + " " + str(self.unit) + " (" + state + ")"
+
+
+class MoveWatchdog:
+    """
+    Fails the movements that aren't done by their deadline (see MoveHandle.deadline).
+    One thread watches all movements: it sleeps until the first deadline, so nothing is polled.
+    It also runs the IdleChecks of the adaptive polling, anything with a deadline, done() and checkDeadline() works.
+    The deadline doesn't depend on incoming data, a movement also times out when the controller stays silent.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.deadlines = []  # Heap of (deadline, number, MoveHandle).
+        self.count = 0  # Keeps the heap order when two deadlines are the same.
+        self.thread = None
+
+    def watch(self, handle):
+        """
+        :param handle: A MoveHandle with a deadline, or an IdleCheck.
+        """
+        with self.condition:
+            heapq.heappush(self.deadlines, (handle.deadline, self.count, handle))
+            self.count += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__run)
+                self.thread.daemon = True
+                self.thread.start()
+            elif self.deadlines[0][2] is handle:
+                self.condition.notify()  # It's the first deadline now.
+
+    def __run(self):
+        with self.condition:
+            while True:
+                # The movements that are done don't need to be watched anymore.
+                while len(self.deadlines) > 0 and self.deadlines[0][2].done():
+                    heapq.heappop(self.deadlines)
+                if len(self.deadlines) == 0:
+                    self.condition.wait()
+                    continue
+                remaining = self.deadlines[0][0] - time.monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                handle = heapq.heappop(self.deadlines)[2]
+                self.condition.release()
+                try:
+                    handle.checkDeadline()
+                except Exception as e:
+                    outputConsole("An error occured while failing a movement that timed out: " + str(e), True)
+                finally:
+                    self.condition.acquire()
+
+
+class IdleCheck:
+    """
+    Checks the adaptive polling of an axis again when its idle delay is over, see Axis.enableAdaptivePolling().
+    It's watched by the MoveWatchdog like a movement, so it needs no thread or timer of its own.
+    """
+
+    def __init__(self, axis, idle_since, update):
+        self.axis = axis
+        self.idle_since = idle_since
+        self.deadline = idle_since + axis.adaptive_poli[2] + 0.001  # Just after the delay, not rounded to before it.
+        self.update = update  # Axis.__updatePolling of the axis.
+
+    def done(self):
+        """
+        :return: True if the axis became active again (or was switched to idle already) since this check was made.
+        """
+        return self.axis.idle_since != self.idle_since
+
+    def checkDeadline(self):
+        if not self.done():
+            self.update()
+
+
+move_watchdog = MoveWatchdog()  # Shared by all movements, and the idle checks of the adaptive polling.
+
+
+class WaypointStream:
+    """
+    A WaypointStream moves an axis along a list of positions, it's returned by Axis.streamWaypoints(..., blocking=False).
+    Each position is followed by a MoveHandle. When it's reached, the next DPOS is send right away from the
+    communication thread (or after the dwell time), so the host doesn't add a gap between consecutive positions.
+    """
+    axis = None  # The axis that is moving.
+    DPOS = None  # The positions in encoder units.
+    values = None  # The positions as they were specified.
+    unit = None  # The units values are specified in.
+    dwell = None  # The dwell time in seconds at each position.
+    arrival_times = None  # time.monotonic() when each position was reached.
+    handle = None  # The MoveHandle of the current position.
+    start_time = None  # time.monotonic() when the first DPOS was send.
+    end_time = None  # time.monotonic() when the stream was done.
+    error = None  # A message explaining why the stream stopped, None if there is no error.
+
+    def __init__(self, axis, DPOS, values, unit, dwell):
+        self.axis = axis
+        self.DPOS = DPOS
+        self.values = values
+        self.unit = unit
+        self.dwell = dwell
+        self.commands = ["DPOS=" + str(position) for position in DPOS]  # Ready to send.
+        self.arrival_times = []
+        self.handle = None
+        self.end_time = None
+        self.error = None
+        self.stopped = False
+        self.done_event = threading.Event()
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.__sendNext()
+
+    def __sendNext(self):
+        """
+        Sends the next DPOS. Positions that are reached right away are handled here in a loop, not recursively.
+        """
+        while True:
+            with self.lock:
+                if self.stopped:
+                    return
+                index = len(self.arrival_times)
+                # This runs on the communication, timer or watchdog thread, it must not wait for a full send queue.
+                self.axis.sendCommand(self.commands[index], block=False)
+                self.handle = MoveHandle(self.axis, self.DPOS[index], self.values[index], self.unit)
+            if not self.handle.done():
+                self.handle.addDoneCallback(self.__onArrival)
+                return
+            if not self.__arrived(self.handle):
+                return
+
+    def __onArrival(self, handle):
+        if self.__arrived(handle):
+            self.__sendNext()
+
+    def __arrived(self, handle):
+        """
+        :return: True if the next DPOS has to be send right away.
+        """
+        if handle.error is not None:
+            self.__finish(handle.error)
+            return False
+        with self.lock:
+            if self.stopped or handle is not self.handle:
+                return False
+            self.arrival_times.append(handle.end_time)
+            index = len(self.arrival_times) - 1
+        if self.dwell[index] > 0:
+            timer = threading.Timer(self.dwell[index], self.__afterDwell)
+            timer.daemon = True
+            timer.start()
+            return False
+        if len(self.arrival_times) == len(self.DPOS):
+            self.__finish(None)
+            return False
+        return True
+
+    def __afterDwell(self):
+        if len(self.arrival_times) == len(self.DPOS):
+            self.__finish(None)
+        else:
+            self.__sendNext()
+
+    def __finish(self, error):
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            self.error = error
+            self.end_time = time.monotonic()
+        self.done_event.set()
+
+    def done(self):
+        """
+        :return: True if all positions are reached, or if the stream failed or was stopped.
+        """
+        return self.done_event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        :param timeout: Maximum time to wait in seconds. None waits until the stream is done.
+        :return: True if all positions are reached. False if the stream failed (see error) or the timeout was reached.
+        """
+        self.done_event.wait(timeout)
+        return self.done_event.is_set() and self.error is None
+
+    def stop(self):
+        """
+        Stops the stream, and the current movement by sending "STOP=0" to the axis.
+        """
+        with self.lock:
+            handle = self.handle
+        self.__finish("Waypoint stream stopped.")
+        if handle is not None:
+            handle.stop()
+
+    def __len__(self):
+        return len(self.DPOS)
+
+    def __str__(self):
+        return ("Axis " + str(self.axis) + " waypoints: " + str(len(self.arrival_times)) + " of " + str(len(self.DPOS)) +
+                " reached" + ("" if self.error is None else " (" + str(self.error) + ")"))
+
+
+class IndexHandle:
+    """
+    An IndexHandle follows the index search of an axis, it's returned by findIndex(..., blocking=False).
+    It's done as soon as the index is found, the controller stops searching or an error status bit is set.
+    It can be used with waitAll() and asCompleted(), just like a MoveHandle.
+    """
+    axis = None  # The axis that is searching its index.
+    start_time = None  # time.monotonic() when INDX was send.
+    end_time = None  # time.monotonic() when the search was done.
+    reached = False  # True if the index is found.
+    error = None  # A message explaining why the search failed, None if there is no error.
+
+    def __init__(self, axis):
+        self.axis = axis
+        self.start_time = time.monotonic()
+        self.end_time = None
+        self.reached = False
+        self.error = None
+        # The status bits lag behind INDX. Until the "searching index" bit is seen, the old status is only trusted
+        # after a couple of updates (just like findIndex() waits for them).
+        self.start_update_nb = axis.update_nb
+        self.search_seen = False
+        self.done_event = threading.Event()
+        self.done_callbacks = []
+        self.lock = threading.Lock()
+        axis.data_callbacks.append(self.__onData)
+        self.__check()
+
+    def __onData(self, tag, value):
+        if tag == "EPOS" or tag == "STAT":
+            self.__check()
+
+    def __check(self):
+        if self.done_event.is_set():
+            return
+        if self.axis.stat & STAT_ERROR_MASK:
+            self.__finish(self.axis.getMoveError() or "Status error while searching the index.")
+            return
+        if not self.search_seen:
+            self.search_seen = self.axis.isSearchingIndex() or self.axis.update_nb - self.start_update_nb >= 6
+            if not self.search_seen:
+                return
+        if self.axis.isEncoderValid():
+            self.__finish(None)
+        elif not self.axis.isSearchingIndex():
+            self.__finish("Index is not found, but stopped searching for index.")
+
+    def __finish(self, error):
+        with self.lock:
+            if self.done_event.is_set():
+                return
+            self.end_time = time.monotonic()
+            self.error = error
+            self.reached = error is None
+            self.done_event.set()
+            callbacks = list(self.done_callbacks)
+        if self.__onData in self.axis.data_callbacks:
+            self.axis.data_callbacks.remove(self.__onData)
+        for callback in callbacks:
+            callback(self)
+
+    def done(self):
+        """
+        :return: True if the search is done: the index is found or the search failed.
+        """
+        return self.done_event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        :param timeout: Maximum time to wait in seconds. None waits until the search is done.
+        :return: True if the index is found. False if the search failed (see error) or the timeout was reached.
+        """
+        self.done_event.wait(timeout)
+        return self.reached
+
+    def addDoneCallback(self, callback):
+        """
+        :param callback: Function called as callback(handle) when the search is done.
+        If the search is already done, it's called immediately.
+        """
+        with self.lock:
+            if not self.done_event.is_set():
+                self.done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def getDuration(self):
+        """
+        :return: The time in seconds from sending INDX until the search was done. None if it isn't done yet.
+        """
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def __str__(self):
+        if not self.done():
+            state = "searching"
+        elif self.reached:
+            state = "found in " + str(round(self.getDuration(), 3)) + " s"
+        else:
+            state = "failed: " + str(self.error)
+        return "Index of axis " + str(self.axis) + " (" + state + ")"
+
+
+def holdSendQueues(axes):
+    """
+    :param axes: A list of axes, they can belong to different controllers.
+    :return: A context manager that holds the send queue of the controller of each axis.
+    Commands queued while it's held are written together per controller.
+    The queues are always taken in the same order, so two threads holding overlapping controllers can't deadlock.
+    """
+    stack = contextlib.ExitStack()
+    try:
+        for comm in sorted(set([axis.xeryon_object.getCommunication() for axis in axes]), key=id):
+            stack.enter_context(comm.send_condition)
+    except BaseException:
+        stack.close()
+        raise
+    return stack
+
+
+def checkThreadedAxes(axes, function, alternative):
+    """
+    :param axes: A list of axes.
+    :param function: The name of the function that is called, for the error message.
+    :param alternative: What to use instead for an AsyncXeryon, for the error message.
+    Raises an exception for the axes of an AsyncXeryon. Their blocking functions are coroutines, they can't be
+    started and followed from threads like the axes of a Xeryon.
+    """
+    for axis in axes:
+        if isinstance(axis, AsyncAxis):
+            raise Exception(function + "() can't be used for axis " + str(axis) + " of an AsyncXeryon, " +
+                            "use " + alternative + " instead.")
+
+
+def moveMany(targets, differentUnits=None, wait=True, timeout=None):
+    """
+    :param targets: A dictionary {axis: position}. The axes can belong to different controllers.
+    :param differentUnits: If the positions aren't specified in the current units of each axis, specify the correct units.
+    :type differentUnits: Units
+    :param wait: If True, this function blocks until all movements are done.
+    :param timeout: Only used if wait is True. Maximum time to wait in seconds.
+    :return: A dictionary {axis: MoveHandle}.
+    This function sends all DPOS commands at once, so all axes move at the same time.
+    The DPOS commands for axes of the same controller are written together.
+    For the axes of an AsyncXeryon, use AsyncXeryon.moveMany().
+    """
+    checkThreadedAxes(targets, "moveMany", "AsyncXeryon.moveMany() or asyncio.gather()")
+    handles = {}
+    with holdSendQueues(targets):
+        # Hold the send queue of each controller until all its DPOS commands are queued.
+        for axis, position in targets.items():
+            handles[axis] = axis.setDPOS(position, differentUnits, False, blocking=False)
+    if wait:
+        waitAll(handles, timeout)
+    return handles
+
+
+def waitAll(handles, timeout=None):
+    """
+    :param handles: A list of MoveHandles, or a dictionary {axis: MoveHandle} as returned by moveMany().
+    :param timeout: Maximum time to wait in seconds, for all movements together. None waits until all are done.
+    :return: True if all positions are reached, False if a movement failed or the timeout was reached.
+    Check the error of each handle to see which axis failed.
+    """
+    if isinstance(handles, dict):
+        handles = handles.values()
+    handles = list(handles)  # It's iterated twice, a generator would be empty the second time.
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+    for handle in handles:
+        remaining = None
+        if timeout is not None:
+            remaining = max(0, deadline - time.monotonic())
+        handle.wait(remaining)
+    return all([handle.reached for handle in handles])
+
+
+def asCompleted(handles, timeout=None):
+    """
+    :param handles: A list of MoveHandles, or a dictionary {axis: MoveHandle} as returned by moveMany().
+    :param timeout: Maximum time to wait in seconds, for all movements together. None waits until all are done.
+    :return: A generator that yields each handle as soon as its movement is done, in the order they finish.
+    Raises TimeoutError if not all movements are done within the timeout.
+    """
+    if isinstance(handles, dict):
+        handles = list(handles.values())
+    finished = queue.Queue()
+    for handle in handles:
+        handle.addDoneCallback(finished.put)
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+    for i in range(len(handles)):
+        remaining = None
+        if timeout is not None:
+            remaining = max(0, deadline - time.monotonic())
+        try:
+            yield finished.get(timeout=remaining)
+        except queue.Empty:
+            raise TimeoutError(str(len(handles) - i) + " movement(s) not done within " + str(timeout) + " s.")
+
+
+def homeAll(axes, direction=0, timeout=None):
+    """
+    :param axes: A list of axes, they can belong to different controllers.
+    :param direction: The direction to search the index in, see findIndex().
+    :param timeout: Maximum time to wait in seconds, for all axes together. None waits until all searches are done.
+    :return: A dictionary {axis: IndexHandle}. Each handle has the homing time (getDuration()) and error of its axis.
+    The index search is started on all axes at the same time, so it takes as long as the slowest axis.
+    An axis that fails is reported as soon as it fails, the other axes keep searching.
+    For the axes of an AsyncXeryon, use AsyncXeryon.homeAll().
+    """
+    checkThreadedAxes(axes, "homeAll", "AsyncXeryon.homeAll() or asyncio.gather()")
+    handles = {}
+    with holdSendQueues(axes):
+        # Hold the send queue of each controller until all its INDX commands are queued.
+        for axis in axes:
+            handles[axis] = axis.findIndex(direction=direction, blocking=False)
+
+    try:
+        for handle in asCompleted(handles, timeout):
+            outputConsole(str(handle), not handle.reached)
+    except TimeoutError:
+        for handle in handles.values():
+            if not handle.done():
+                outputConsole("Index of axis " + str(handle.axis) + " is not found, timeout reached.", True)
+    return handles
+
+
+def startAll(controllers, home=True, external_settings_default=None, force_full_upload=False, timeout=None):
+    """
+    :param controllers: A list of Xeryon objects.
+    :param home: If True, the index of all axes is searched after starting, see homeAll().
+    :param timeout: Only used if home is True. Maximum time in seconds for the index search of all axes.
+    :return: A dictionary {axis: IndexHandle} if home is True, else None.
+    Starts all controllers at the same time: each start() (reset, settings upload...) runs in its own thread.
+    Raises an exception if a controller couldn't be started, after all the others are started.
+    For AsyncXeryon objects, use asyncio.gather() on their start() and AsyncXeryon.homeAll().
+    """
+    checkThreadedAxes([axis for controller in controllers for axis in controller.getAllAxis()], "startAll",
+                      "asyncio.gather() on the start() and homeAll() coroutines of each AsyncXeryon")
+    errors = {}
+
+    def start(controller):
+        try:
+            controller.start(external_settings_default=external_settings_default, force_full_upload=force_full_upload)
+        except Exception as e:
+            errors[controller] = e
+
+    threads = [threading.Thread(target=start, args=(controller,)) for controller in controllers]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len(errors) > 0:
+        raise Exception("Could not start " + ", ".join([str(controller.getCommunication().COM_port) + " (" + str(e) + ")"
+                                                         for controller, e in errors.items()]))
+    if home:
+        return homeAll([axis for controller in controllers for axis in controller.getAllAxis()], timeout=timeout)
+    return None
+
+
+def queryMany(queries, timeout=None):
+    """
+    :param queries: A dictionary {axis: list of tags}, e.g. {x_axis: ["HLIM", "LLIM"], y_axis: ["SSPD"]}.
+                    The axes can belong to different controllers.
+    :param timeout: If specified, wait at most this many seconds for all answers, see waitForAnswers().
+    :return: A dictionary {axis: {tag: Future}}, see Axis.query().
+    All questions for the same controller are written together.
+    For the axes of an AsyncXeryon, the answers are delivered by the event loop: don't specify a timeout, await
+    asyncio.wrap_future() of the futures instead (or use AsyncAxis.queryMany()).
+    """
+    if timeout is not None:
+        checkThreadedAxes(queries, "queryMany", "AsyncAxis.queryMany() or queryMany() without a timeout")
+    futures = {}
+    with holdSendQueues(queries):
+        # Hold the send queue of each controller until all its questions are queued.
+        for axis, tags in queries.items():
+            futures[axis] = Axis.queryMany(axis, tags)  # Not axis.queryMany(), AsyncAxis.queryMany() is a coroutine.
+    if timeout is not None:
+        waitForAnswers([future for axis_futures in futures.values() for future in axis_futures.values()], timeout)
+    return futures
+
+
+def waitForAnswers(futures, timeout):
+    """
+    :param futures: A list of Futures returned by Axis.query().
+    :param timeout: Maximum time to wait in seconds, for all answers together.
+    :return: True if all questions are answered.
+    The questions that are not answered within the timeout fail with TimeoutError.
+    """
+    done, not_done = concurrent.futures.wait(futures, timeout)
+    for future in not_done:
+        try:
+            future.set_exception(TimeoutError("No answer within " + str(timeout) + " s."))
+        except concurrent.futures.InvalidStateError:
+            pass  # Answered just now.
+    return all([not future.cancelled() and future.exception() is None for future in futures])
+
+
+class MotionPlan:
+    """
+    A MotionPlan is a reusable set of steps (movements, function calls e.g. for IO, and waits), each with explicit
+    dependencies. run() starts every step as soon as the steps it depends on are done, so independent steps run at
+    the same time, on any axis of any controller. Define a plan once and run it as often as needed:
+
+        plan = MotionPlan()
+        plan.move("x_in", x_axis, 58)
+        plan.move("z_low", z_axis, 55)
+        plan.call("grab", lambda: GPIO.output(17, GPIO.HIGH), after=["x_in", "z_low"])
+        plan.wait("settle", 0.5, after="grab")
+        plan.move("z_high", z_axis, 28, after="settle")
+        timeline = plan.run()
+
+    Movements of the same axis always run in the order they are added.
+    """
+
+    def __init__(self):
+        self.steps = []  # The steps in the order they are added, each step is a dictionary.
+        self.step_dict = {}  # name => step
+        self.timeline = None  # The timeline of the last run.
+
+    def __addStep(self, name, kind, after, **kwargs):
+        if name in self.step_dict:
+            raise Exception("There is already a step named " + str(name) + ".")
+        if after is None:
+            after = []
+        elif isinstance(after, str):
+            after = [after]
+        for dependency in after:
+            if dependency not in self.step_dict:
+                raise Exception("Step " + str(name) + " depends on " + str(dependency) + ", which isn't added yet.")
+        step = dict(name=name, kind=kind, after=list(after), **kwargs)
+        self.steps.append(step)
+        self.step_dict[name] = step
+        return name
+
+    def move(self, name, axis, position, after=None, differentUnits=None):
+        """
+        :param name: Name of the step, used in after= and in the timeline.
+        :param axis: The axis that has to move.
+        :param position: The desired position, in the current units of the axis or in differentUnits.
+        :param after: Name (or list of names) of the steps that have to be done before this step starts.
+        :return: The name of the step.
+        The axes of an AsyncXeryon can't be used, their movements are awaited on the event loop.
+        """
+        checkThreadedAxes([axis], "MotionPlan.move", "the setDPOS() coroutine of the axis")
+        after = [after] if isinstance(after, str) else list(after or [])
+        for step in reversed(self.steps):  # Keep the order of the movements of one axis.
+            if step["kind"] == "move" and step["axis"] is axis:
+                if step["name"] not in after:
+                    after.append(step["name"])
+                break
+        return self.__addStep(name, "move", after, axis=axis, position=position, units=differentUnits)
+
+    def call(self, name, function, after=None):
+        """
+        :param function: Function without arguments, e.g. to set an output. It's run in its own thread.
+                         If it returns a MoveHandle, the step is done when that movement is done.
+        :return: The name of the step.
+        """
+        return self.__addStep(name, "call", after, function=function)
+
+    def wait(self, name, seconds, after=None):
+        """
+        :param seconds: The time to wait.
+        :return: The name of the step.
+        """
+        return self.__addStep(name, "wait", after, seconds=seconds)
+
+    def run(self, timeout=None):
+        """
+        :param timeout: Maximum time in seconds for the whole plan. None waits until all steps are done.
+        :return: The timeline: a list with a dictionary {"step", "kind", "start", "end", "duration", "error"} for each
+                 step that was started, in the order they started. The times are in seconds from the start of the run.
+        If a step fails (the position isn't reached or the function raises an exception) or the timeout is reached,
+        no new steps are started, the movements that are still running are stopped and an exception is raised.
+        (TimeoutError for the timeout, or for a movement that overran its deadline, see MoveHandle.)
+        The timeline of the run is kept in self.timeline.
+        """
+        start_time = time.monotonic()
+        completed = queue.Queue()  # (name, error) of each step that is done.
+        waiting_for = dict([(step["name"], set(step["after"])) for step in self.steps])
+        dependents = dict([(step["name"], []) for step in self.steps])
+        for step in self.steps:
+            for dependency in step["after"]:
+                dependents[dependency].append(step["name"])
+        timeline = []
+        entries = {}  # name => timeline entry
+        handles = {}  # name => MoveHandle of running movement steps
+
+        def onHandleDone(name):
+            return lambda handle: completed.put((name, handle.error))
+
+        def runFunction(name, function):
+            try:
+                result = function()
+            except Exception as e:
+                completed.put((name, "Step " + str(name) + " raised an exception: " + str(e)))
+                return
+            if isinstance(result, MoveHandle):
+                handles[name] = result
+                result.addDoneCallback(onHandleDone(name))
+            else:
+                completed.put((name, None))
+
+        def startStep(step):
+            name = step["name"]
+            entry = {"step": name, "kind": step["kind"], "start": time.monotonic() - start_time,
+                     "end": None, "duration": None, "error": None}
+            timeline.append(entry)
+            entries[name] = entry
+            if step["kind"] == "move":
+                handle = step["axis"].setDPOS(step["position"], step["units"], outputToConsole=False, blocking=False)
+                handles[name] = handle
+                handle.addDoneCallback(onHandleDone(name))
+            elif step["kind"] == "call":
+                thread = threading.Thread(target=runFunction, args=(name, step["function"]))
+                thread.daemon = True
+                thread.start()
+            else:
+                timer = threading.Timer(step["seconds"], completed.put, args=((name, None),))
+                timer.daemon = True
+                timer.start()
+
+        for step in self.steps:
+            if len(waiting_for[step["name"]]) == 0:
+                startStep(step)
+
+        error = None
+        running = len(timeline)
+        while running > 0:
+            remaining = None
+            if timeout is not None:
+                remaining = max(0, start_time + timeout - time.monotonic())
+            try:
+                name, step_error = completed.get(timeout=remaining)
+            except queue.Empty:
+                error = TimeoutError("The plan isn't done within " + str(timeout) + " s.")
+                break
+            running -= 1
+            entry = entries[name]
+            entry["end"] = time.monotonic() - start_time
+            entry["duration"] = entry["end"] - entry["start"]
+            entry["error"] = step_error
+            handle = handles.pop(name, None)
+            if step_error is not None:
+                if handle is not None and handle.timed_out:
+                    error = TimeoutError("Step " + str(name) + " failed: " + str(step_error))
+                else:
+                    error = Exception("Step " + str(name) + " failed: " + str(step_error))
+                break
+            for dependent in dependents[name]:
+                waiting_for[dependent].discard(name)
+                if len(waiting_for[dependent]) == 0:
+                    startStep(self.step_dict[dependent])
+                    running += 1
+
+        self.timeline = timeline
+        if error is not None:
+            for handle in list(handles.values()):
+                handle.stop()
+            raise error
+        return timeline
+
+    @staticmethod
+    def formatTimeline(timeline):
+        """
+        :param timeline: A timeline as returned by run().
+        :return: The timeline as text, one line per step.
+        """
+        lines = []
+        for entry in timeline:
+            end = "-" if entry["end"] is None else "%.3f" % entry["end"]
+            line = "%-20s %-5s %8.3f s -> %8s s" % (entry["step"], entry["kind"], entry["start"], end)
+            if entry["error"] is not None:
+                line += "  " + str(entry["error"])
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class CommandMetrics:
+    """
+    Latency instrumentation of the communication, enabled with Xeryon.enableMetrics().
+    Each command is timestamped when it's queued, when it's written and when the first telemetry that confirms it arrives:
+    a frame with the same tag from the same axis, with the same value (or any value for a "TAG=?" query).
+    Queuing a command only appends it to a list, the commands are parsed when they are written.
+    Incoming frames cost one dictionary lookup. The percentiles are calculated in snapshot().
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.queued = []  # (command, queued time) of the commands that are still in the queue.
+        self.taken = []  # Same, for the commands that are taken from the queue but not written yet.
+        self.pending = {}  # tag => {axis_letter: (value, queued time, written time)} of the unconfirmed commands.
+        self.max_queue_depth = 0
+        self.frames = 0  # Number of received frames.
+        self.samples = {}  # (axis_letter, kind) => deque of latencies in seconds
+        self.maxima = {}  # (axis_letter, kind) => largest latency in seconds
+        self.previous_snapshot = (self.start_time, 0)
+
+    def commandQueued(self, command, queue_depth):
+        """
+        Called by the communication when a command is added to the queue (while holding send_condition).
+        """
+        self.queued.append((command, time.perf_counter()))
+        if queue_depth > self.max_queue_depth:
+            self.max_queue_depth = queue_depth
+
+    def commandsTaken(self, count = None):
+        """
+        :param count: The number of commands taken from the front of the queue. None if the whole queue is taken.
+        Called by the communication when the queue is taken to be written (while holding send_condition).
+        """
+        if count is None or count >= len(self.queued):
+            self.taken += self.queued
+            self.queued = []
+        else:
+            self.taken += self.queued[:count]
+            del self.queued[:count]
+
+    def commandsWritten(self):
+        """
+        Called by the communication right after the commands that were taken from the queue are written.
+        """
+        now = time.perf_counter()
+        taken, self.taken = self.taken, []
+        pending = self.pending
+        for command, queued_time in taken:
+            key, _, value = command.partition("=")
+            letter, _, tag = key.rpartition(":")
+            commands = pending.get(tag)
+            if commands is None:
+                commands = pending[tag] = {}
+            commands[letter or None] = (value.rstrip("\n\r"), queued_time, now)
+
+    def frameReceived(self, letter, tag, value, commands):
+        """
+        Called by the communication for a received frame with the same tag as an unconfirmed command.
+        :param commands: self.pending[tag]
+        """
+        entry = commands.get(letter)
+        if entry is None or (entry[0] != "?" and entry[0] != value):
+            return
+        del commands[letter]
+        now = time.perf_counter()
+        self.addSample(letter, "queue", entry[2] - entry[1])
+        self.addSample(letter, "response", now - entry[2])
+        self.addSample(letter, "total", now - entry[1])
+
+    def addSample(self, letter, kind, latency):
+        """
+        :param kind: "queue" (queued => written), "response" (written => confirmed), "total" (queued => confirmed),
+                     "move" (DPOS send => position reached) or "wakeup" (position reached => setDPOS returns).
+        """
+        key = (letter, kind)
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = collections.deque(maxlen=METRICS_SAMPLES)
+            self.maxima[key] = latency
+        samples.append(latency)
+        if latency > self.maxima[key]:
+            self.maxima[key] = latency
+
+    def snapshot(self):
+        """
+        :return: A tuple (frames, fps, latencies). fps is calculated since the previous snapshot.
+                 latencies is a dictionary {axis_letter: {kind: {"count", "p50", "p99", "max"}}} in seconds,
+                 axis_letter is None for commands without axis.
+        """
+        now = time.perf_counter()
+        previous_time, previous_frames = self.previous_snapshot
+        frames = self.frames
+        self.previous_snapshot = (now, frames)
+
+        latencies = {}
+        for (letter, kind), samples in list(self.samples.items()):
+            values = sorted(samples)
+            if len(values) == 0:
+                continue
+            latencies.setdefault(letter, {})[kind] = {
+                "count": len(values),
+                "p50": values[len(values) // 2],
+                "p99": values[min(len(values) - 1, int(len(values) * 0.99))],
+                "max": self.maxima[(letter, kind)],
+            }
+        return frames, (frames - previous_frames) / max(now - previous_time, 1e-9), latencies
+
+
+class CommandWindow:
+    """
+    Flow control of the acknowledged mode, see Xeryon.enableAcknowledgedMode().
+    With ECHO=1 the controller repeats every command it has processed. A command is "in flight" from the moment it's
+    written until its echo (or for "TAG=?" the answer) is received. At most depth commands are in flight, the others
+    stay in the send queue. A command that isn't echoed in time is written again.
+    Only the commands for an axis that has ECHO on are tracked (the ECHO and RSET commands are followed for this),
+    all other commands are written right away.
+    The round trip time of each axis is smoothed like TCP does, the timeout is derived from it.
+    All functions are called while holding send_condition of the communication.
+    """
+
+    def __init__(self, depth = ACK_WINDOW):
+        self.depth = depth
+        self.pending = {}  # tag => {axis_letter: deque of [value, command, written time, times written]}, oldest first
+        self.in_flight = 0  # Number of commands in pending.
+        self.echo = {}  # axis_letter => True if ECHO is on for that axis.
+        self.rtt = {}  # axis_letter => (smoothed round trip time, mean deviation) in seconds
+        self.retransmissions = 0  # Number of commands that were written again.
+        self.failures = 0  # Number of commands that were given up on.
+
+    def take(self, commands):
+        """
+        :param commands: The send queue (a deque). The commands that can be written are removed from it.
+        :return: A list with the commands to write now: first the ones that are written again,
+                 then as many queued commands as the window allows.
+        """
+        now = time.perf_counter()
+        taken = self.__retransmissions(now) if self.in_flight > 0 else []
+        stops = None  # Number of STOP commands in the queue, counted once when the window is full.
+        while len(commands) > 0:
+            command = commands[0].rstrip("\n\r")
+            key, _, value = command.partition("=")
+            letter, _, tag = key.rpartition(":")
+            letter = letter or None
+            if tag == "ECHO":
+                self.echo[letter] = value.strip() != "0"
+            elif tag == "RSET":
+                self.reset()  # The controller restarts with its saved settings, ECHO included.
+            elif self.echo.get(letter):
+                if self.in_flight >= self.depth:
+                    if stops is None:
+                        stops = sum(1 for queued in commands if "STOP=" in queued)
+                    if stops == 0:
+                        break  # Full. A STOP is never held back, it takes everything before it along.
+                self.pending.setdefault(tag, {}).setdefault(letter, collections.deque()).append(
+                    [value.replace(" ", ""), command, now, 1])
+                self.in_flight += 1
+            if stops and "STOP=" in command:
+                stops -= 1
+            commands.popleft()
+            taken.append(command)
+        return taken
+
+    def hasDataToWrite(self, commands):
+        """
+        :return: True if take() would return commands right now.
+        """
+        if len(commands) > 0 and self.in_flight < self.depth:
+            return True
+        retransmission = self.nextRetransmission()
+        return retransmission is not None and retransmission <= 0
+
+    def frameReceived(self, letter, tag, value):
+        """
+        :return: True if the frame confirmed a command in flight.
+        """
+        axes = self.pending.get(tag)
+        entries = axes.get(letter) if axes is not None else None
+        if not entries:
+            return False
+        for confirmed, entry in enumerate(entries):
+            if entry[0] == value or entry[0] == "?":
+                break
+        else:
+            return False
+        # The controller processes the commands in order, the older ones with this tag are processed as well.
+        # Unless they got lost, which matters for the commands that can't just be replaced by a newer one.
+        for _ in range(confirmed):
+            skipped = entries.popleft()
+            if tag in NOT_RETRANSMITTED_COMMANDS:
+                self.failures += 1
+                outputConsole("The controller didn't confirm \"" + skipped[1] + "\".", True)
+        entries.popleft()
+        self.in_flight -= confirmed + 1
+        if entry[3] == 1:  # The echo of a command that is written again can belong to either write, no sample.
+            self.__addSample(letter, time.perf_counter() - entry[2])
+        if len(entries) == 0:
+            self.__remove(tag, letter)
+        return True
+
+    def timeout(self, letter):
+        """
+        :return: The time in seconds to wait for the echo of a command for this axis, before it's written again.
+        """
+        rtt = self.rtt.get(letter)
+        if rtt is None:
+            return ACK_TIMEOUT
+        return max(ACK_MIN_TIMEOUT, rtt[0] + 4 * rtt[1])
+
+    def nextRetransmission(self):
+        """
+        :return: The time in seconds until the first command has to be written again, None if nothing is in flight.
+        """
+        first = None
+        now = time.perf_counter()
+        for axes in self.pending.values():
+            for letter, entries in axes.items():
+                entry = entries[0]
+                remaining = entry[2] + self.timeout(letter) * 2 ** (entry[3] - 1) - now
+                if first is None or remaining < first:
+                    first = remaining
+        return first
+
+    def reset(self):
+        """
+        Forgets all commands in flight, after a reset of the controller.
+        """
+        self.pending = {}
+        self.in_flight = 0
+        self.echo = {}
+
+    def __retransmissions(self, now):
+        # Each time a command is written again, the timeout doubles (like TCP).
+        commands = []
+        for tag, axes in list(self.pending.items()):
+            for letter, entries in list(axes.items()):
+                timeout = self.timeout(letter)
+                while len(entries) > 0 and now - entries[0][2] > timeout * 2 ** (entries[0][3] - 1):
+                    entry = entries[0]
+                    if len(entries) > 1 and tag not in NOT_RETRANSMITTED_COMMANDS:
+                        entries.popleft()  # Replaced by a newer command with the same tag, e.g. a newer DPOS.
+                        self.in_flight -= 1
+                    elif entry[3] > ACK_RETRIES or tag in NOT_RETRANSMITTED_COMMANDS:
+                        entries.popleft()
+                        self.in_flight -= 1
+                        self.failures += 1
+                        outputConsole("The controller didn't confirm \"" + entry[1] + "\".", True)
+                    else:
+                        entry[2] = now
+                        entry[3] += 1
+                        self.retransmissions += 1
+                        commands.append(entry[1])
+                        break
+                if len(entries) == 0:
+                    self.__remove(tag, letter)
+        return commands
+
+    def __remove(self, tag, letter):
+        # Removes an empty entry, so incoming frames with this tag don't have to be checked anymore.
+        axes = self.pending[tag]
+        del axes[letter]
+        if len(axes) == 0:
+            del self.pending[tag]
+
+    def __addSample(self, letter, rtt):
+        previous = self.rtt.get(letter)
+        if previous is None:
+            self.rtt[letter] = (rtt, rtt / 2)
+        else:
+            smoothed, deviation = previous
+            self.rtt[letter] = (0.875 * smoothed + 0.125 * rtt, 0.75 * deviation + 0.25 * abs(smoothed - rtt))
+
+
+class Communication:
+    ser = None  # Holds the serial connection.
+    readyToSend = None  # Deque that contains commands that are ready to send.
+    send_condition = None  # Guards readyToSend, notified when commands are added or written.
+    read_buffer = None  # Bytes received from the controller that don't form a complete line yet.
+    stop_thread = False  # Boolean for stopping the thread.
+    thread = None  # Thread that reads the incoming data.
+    reader_ident = None  # threading.get_ident() of the thread that last processed incoming data, e.g. an external loop.
+    write_thread = None  # Thread that writes the queued commands.
+    write_buffer = None  # Bytes that could not be written yet on a non-blocking serial port.
+    io_hub = None  # If set, this IOHub services the serial port instead of the threads above.
+    metrics = None  # CommandMetrics, if enabled with Xeryon.enableMetrics().
+    window = None  # CommandWindow, if enabled with Xeryon.enableAcknowledgedMode().
+    ports_in_use = set()  # The ports that are opened by a Communication object, discovery doesn't probe them.
+    ports_probing = set()  # The ports that are opened by probeSerialNumber() right now.
+    ports_condition = threading.Condition()  # Protects ports_in_use and ports_probing.
+    xeryon_object = None  # Link to the "Xeryon" object.
+
+    def __init__(self, xeryon_object, COM_port, baud, io_hub = None):
+        self.xeryon_object = xeryon_object
+        self.COM_port = COM_port
+        self.baud = baud
+        self.readyToSend = collections.deque()
+        self.send_condition = threading.Condition()
+        self.read_buffer = bytearray()
+        self.write_buffer = b""
+        self.thread = None
+        self.reader_ident = None
+        self.write_thread = None
+        self.io_hub = io_hub
+        self.metrics = None
+        self.window = None
+        self.ser = None
+        pass
+
+    def openSerialPort(self, **kwargs):
+        """
+        Opens COM_port and marks it as in use, under the same lock discovery uses to check the ports.
+        If discovery is probing the port, this waits until the probe closed it.
+        :param kwargs: Passed to serial.Serial(), e.g. timeout.
+        :return: The opened serial.Serial object.
+        """
+        with Communication.ports_condition:
+            Communication.ports_condition.wait_for(lambda: self.COM_port not in Communication.ports_probing)
+            ser = serial.Serial(self.COM_port, self.baud, **kwargs)
+            Communication.ports_in_use.add(self.COM_port)
+        return ser
 
     def start(self, external_communication_thread = False):
         """
         :return: None
         This starts the serial communication on the specified COM port and baudrate in a seperate thread.
+        Reading and writing each get their own thread, so incoming data never delays an outgoing command.
+        If an IOHub is used, the serial port is registered with the IOHub and no threads are started.
         """
         if self.COM_port is None:
             self.xeryon_object.findCOMPort()
@@ -1183,13 +3598,30 @@ class Communication:
             raise Exception("No COM_port could automatically be found. You should provide it manually.")
         
 
+        if self.io_hub is not None and external_communication_thread is not False:
+            raise Exception("An external communication thread can't be used together with an IOHub.")
+
         try:
-            self.ser = serial.Serial(self.COM_port, self.baud, timeout=0.01)
+            if self.io_hub is not None:
+                # timeout=0 and write_timeout=0 make reading and writing non-blocking.
+                self.ser = self.openSerialPort(timeout=0, write_timeout=0)
+            else:
+                self.ser = self.openSerialPort(timeout=0.01)
             self.ser.flush()
             self.ser.reset_input_buffer()
             self.ser.reset_output_buffer()
-            if external_communication_thread is False:
+            self.read_buffer = bytearray()
+            self.write_buffer = b""
+            self.reader_ident = None
+            if self.io_hub is not None:
                 self.stop_thread = False
+                self.io_hub.register(self)
+                self.thread = self.io_hub.thread
+            elif external_communication_thread is False:
+                self.stop_thread = False
+                self.write_thread = threading.Thread(target=self.__writeData)
+                self.write_thread.daemon = True
+                self.write_thread.start()
                 self.thread = threading.Thread(target=self.__processData)
                 self.thread.daemon = True
                 self.thread.start()
@@ -1201,66 +3633,255 @@ class Communication:
             raise Exception("Could not conect to COM " + str(self.COM_port))
         
 
-    def sendCommand(self, command):
+    def sendCommand(self, command, block=True):
         """
         :param command: The command that needs to be send.
+        :param block: If False, the command is added even if the queue is full, instead of waiting for room.
+                      For threads that must not wait, e.g. a timer that sends the next waypoint.
+        :return: None
+        This function adds the command to the readyToSend queue.
+        If the queue is full (MAX_QUEUED_COMMANDS), it waits until the communication thread has written the queue.
+        """
+        with self.send_condition:
+            if len(self.readyToSend) >= MAX_QUEUED_COMMANDS and block and self.__mayWaitForQueue():
+                if not self.send_condition.wait_for(lambda: len(self.readyToSend) < MAX_QUEUED_COMMANDS,
+                                                    SEND_QUEUE_TIMEOUT):
+                    raise Exception("The send queue is full, the controller on " + str(self.COM_port) +
+                                    " doesn't accept commands fast enough.")
+            self.readyToSend.append(command)
+            if self.metrics is not None:
+                self.metrics.commandQueued(command, len(self.readyToSend))
+            self.send_condition.notify_all()
+        if self.io_hub is not None:
+            self.io_hub.wake()
+
+    def __mayWaitForQueue(self):
+        """
+        :return: False if the current thread must never wait for room in the queue.
+        The reading thread has to keep processing incoming data. With an external communication thread, the thread
+        that runs the loop is the only one that empties the queue, it would wait for itself.
+        As long as that loop didn't run yet, it's unknown which thread runs it, so nobody waits.
+        """
+        if threading.current_thread() is self.thread:
+            return False
+        if self.thread is None and self.write_thread is None:
+            return self.reader_ident is not None and threading.get_ident() != self.reader_ident
+        return threading.get_ident() != self.reader_ident
+
+    def takeQueuedCommands(self):
+        """
+        :return: All queued commands joined in one buffer, ready to be written. None if the queue is empty.
+        It strips all the new lines from the commands and adds it's own.
+        """
+        with self.send_condition:
+            if len(self.readyToSend) == 0 and (self.window is None or self.window.in_flight == 0):
+                return None
+            if self.window is None:
+                data = "".join([command.rstrip("\n\r") + "\n" for command in self.readyToSend])
+                count = len(self.readyToSend)
+                self.readyToSend.clear()
+            else:
+                # Only as many commands as the window allows, see CommandWindow.
+                count = len(self.readyToSend)
+                commands = self.window.take(self.readyToSend)
+                count -= len(self.readyToSend)
+                if len(commands) == 0:
+                    return None
+                data = "".join([command + "\n" for command in commands])
+            if self.metrics is not None:
+                self.metrics.commandsTaken(count)
+            self.send_condition.notify_all()  # Wake up everything waiting for space in the queue.
+        return str.encode(data)
+
+    def __writeQueuedCommands(self):
+        """
+        Writes everything in the readyToSend queue to the controller in a single write.
+        """
+        dataToSend = self.takeQueuedCommands()
+        if dataToSend is not None:
+            self.ser.write(dataToSend)
+            if self.metrics is not None:
+                self.metrics.commandsWritten()
+
+    def writeNonBlocking(self):
+        """
+        :return: True if everything is written, False if some data has to wait until the serial port is writable again.
+        Writes the queued commands on a non-blocking serial port (write_timeout=0).
+        What doesn't fit in the port's buffer is kept in write_buffer and written first next time.
+        """
+        dataToSend = self.takeQueuedCommands()
+        if dataToSend is not None:
+            self.write_buffer += dataToSend
+        if len(self.write_buffer) > 0:
+            written = self.ser.write(self.write_buffer)
+            self.write_buffer = self.write_buffer[written or 0:]
+            if self.metrics is not None:
+                self.metrics.commandsWritten()
+        return len(self.write_buffer) == 0
+
+    def hasDataToWrite(self):
+        """
+        :return: True if there are commands in the queue or bytes waiting in write_buffer.
+        In acknowledged mode, only the commands the window allows to write now count.
+        """
+        if len(self.write_buffer) > 0:
+            return True
+        if self.window is None:
+            return len(self.readyToSend) > 0
+        with self.send_condition:
+            return self.window.hasDataToWrite(self.readyToSend)
+
+    def nextRetransmission(self):
+        """
+        :return: The time in seconds until a command has to be written again (acknowledged mode), None if there is none.
+        """
+        if self.window is None:
+            return None
+        with self.send_condition:
+            return self.window.nextRetransmission()
+
+    def wakeWriter(self):
+        """
+        Wakes up whatever writes the queued commands, e.g. when the window has room again.
+        """
+        with self.send_condition:
+            self.send_condition.notify_all()
+        if self.io_hub is not None:
+            self.io_hub.wake()
+
+    def confirmFrame(self, letter, tag, value):
+        """
+        Passes a received frame to the window of the acknowledged mode. (Called by feedData)
+        """
+        with self.send_condition:
+            confirmed = self.window is not None and self.window.frameReceived(letter, tag, value)
+        if confirmed and len(self.readyToSend) > 0:
+            self.wakeWriter()
+
+    def readNonBlocking(self, max_bytes = None):
+        """
+        :param max_bytes: Maximum number of bytes to read. None reads everything that is available.
         :return: None
-        This function adds the command to the readyToSend list.
+        Reads the available bytes from a non-blocking serial port (timeout=0) and passes them to feedData.
         """
-        self.readyToSend.append(command)
+        waiting = max(1, self.ser.in_waiting)
+        if max_bytes is not None:
+            waiting = min(waiting, max_bytes)
+        data = self.ser.read(waiting)
+        if data:
+            self.feedData(data)
 
     def setCOMPort(self, com_port):
         self.COM_port = com_port
 
+    def __writeData(self):
+        """
+        :return: None
+        This function is ran in a seperate thread.
+        It sleeps until commands are added to the readyToSend queue and writes them immediately.
+        When the communication is stopped, the remaining commands (e.g. "STOP=0") are still written.
+        """
+        try:
+            while self.stop_thread is False and self.ser.is_open:
+                with self.send_condition:
+                    if self.window is None:
+                        self.send_condition.wait_for(lambda: len(self.readyToSend) > 0 or self.stop_thread, 0.1)
+                    else:
+                        # Also wake up when a command has to be written again.
+                        timeout = min(0.1, max(0, self.window.nextRetransmission() or 0.1))
+                        self.send_condition.wait_for(lambda: self.hasDataToWrite() or self.stop_thread, timeout)
+                self.__writeQueuedCommands()
+            if self.ser.is_open:
+                self.__writeQueuedCommands()
+        except Exception as e:
+            print("An error has occured that crashed the communication thread.")
+            print(str(e))
+            raise OSError("An error has occurred that crashed the communicaiton thread. \n" + str(e))
+
+    def __readData(self, block=True):
+        """
+        :param block: If True, wait for the first byte (up to the serial timeout) when nothing is available.
+        :return: None
+        Reads all the bytes that are available and passes them to feedData.
+        """
+        waiting = self.ser.in_waiting
+        if waiting == 0 and not block:
+            return
+        data = self.ser.read(waiting if waiting > 0 else 1)
+        if data:
+            self.feedData(data)
+
+    def feedData(self, data):
+        """
+        :param data: Bytes received from the controller.
+        :return: None
+        Adds the data to read_buffer. Every complete line in the buffer is passed to the correct axis.
+        An incomplete line stays in the buffer until the rest of it is received.
+        """
+        self.reader_ident = threading.get_ident()
+        buffer = self.read_buffer
+        buffer += data
+        end = buffer.rfind(b"\n")
+        if end < 0:
+            return  # No complete line yet.
+
+        # Decode all complete lines at once, without copying them out of the buffer first.
+        with memoryview(buffer) as view:
+            frames = str(view[:end], "ascii", "replace").split("\n")
+        del buffer[:end + 1]
+
+        # Determine the correct axis for each line and pass the tag and value to that axis.
+        axis_dict = self.xeryon_object.axis_dict
+        default_axis = self.xeryon_object.axis_list[0]  # Single axis system, or the axis isn't known.
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.frames += len(frames)
+            pending = metrics.pending
+        window = self.window
+        for frame in frames:
+            parsed = parseFrame(frame)
+            if parsed is None:
+                continue  # Line doesn't contain a command.
+            if metrics is not None and parsed[1] in pending:
+                metrics.frameReceived(parsed[0], parsed[1], parsed[2], pending[parsed[1]])
+            if window is not None and parsed[1] in window.pending:
+                self.confirmFrame(parsed[0], parsed[1], parsed[2])
+            try:
+                axis_dict.get(parsed[0], default_axis).receiveValue(parsed[1], parsed[2])
+            except Exception as e:
+                print(str(e))
 
     def __processData(self, external_while_loop = False):
         """
         :return: None
         This function is ran in a seperate thread.
         It continously listens for:
-        1. If there is data to send
-            Than it just writes the command.
-            It strips all the new lines from the command and adds it's own.
-        2. If there is data to read
-            It reads the data line per line and checks if it contains "=".
-            It determines the correct axis and passes that data to that axis class.
+        1. If there is data to read
+            It reads all available data and splits it into lines.
+            It determines the correct axis and passes each line to that axis class.
+        2. If there is data to send (only if there is no seperate writing thread, e.g. in an external loop)
+            Than it writes all queued commands in one go.
         3. Thread stop command.
         """
+        if external_while_loop is True:
+            self.reader_ident = threading.get_ident()
         try:
             while self.stop_thread is False and self.ser.is_open:  # Infinite loop
+                if self.write_thread is None:
+                    self.__writeQueuedCommands()
 
-                # SEND 10 LINES, then go further to reading.
-                dataToSend = list(self.readyToSend[0:10])
-                self.readyToSend = self.readyToSend[10:]
-
-                for command in dataToSend:  # Send commands.
-                    self.ser.write(str.encode(command.rstrip("\n\r") + "\n"))
-
-                max_to_read = 10
-                try:
-                    while self.ser.in_waiting > 0 and max_to_read >0:  # While there is data to read
-                        reading = self.ser.readline().decode()  # Read a single line
-                
-                        if "=" in reading:  # Line contains a command.
-
-                            if len(reading.split(":")) == 2: #check if an axis is specified
-                                axis = self.xeryon_object.getAxis(reading.split(":")[0])
-                                reading = reading.split(":")[1]
-                                if axis is None:
-                                    axis = self.xeryon_object.axis_list[0]
-                                axis.receiveData(reading)
-
-                            else:
-                                # It's a single axis system
-                                axis = self.xeryon_object.axis_list[0]
-                                axis.receiveData(reading)
-
-                        max_to_read -= 1
-                except Exception as e:
-                    print(str(e))
+                self.__readData(block=external_while_loop is False)
 
                 if external_while_loop is True:
                     return None
+
+            # Let the writing thread send what is left before closing.
+            if self.write_thread is not None:
+                with self.send_condition:
+                    self.send_condition.notify_all()
+                self.write_thread.join()
+            else:
+                self.__writeQueuedCommands()
             # Close the serial communication here, so we have a clean exit.     
             self.ser.reset_input_buffer()
             self.ser.reset_output_buffer()
@@ -1274,6 +3895,699 @@ class Communication:
 
     def closeCommunication(self):
         self.stop_thread = True
+        with Communication.ports_condition:
+            Communication.ports_in_use.discard(self.COM_port)
+        with self.send_condition:
+            self.send_condition.notify_all()
+        if self.io_hub is not None:
+            self.io_hub.unregister(self)
+
+class IOHub:
+    """
+    Services the serial ports of many Xeryon controllers from one thread.
+    Instead of two threads per controller, one thread waits (with a selector) until any of the ports has data
+    to read or can be written to. Each round, the queued commands of every port are written first, then every port
+    gets to read at most IO_HUB_READ_CHUNK bytes, starting with a different port each round.
+    Usage:
+        hub = IOHub()
+        x = Xeryon("/dev/ttyACM0", 115200, io_hub=hub)
+        y = Xeryon("/dev/ttyACM1", 115200, io_hub=hub)
+    NOTE: This needs selectable serial ports (Linux, macOS).
+    """
+    selector = None
+    communications = None  # All registered Communication objects.
+    closing = None  # Communication objects that need to be closed by the IOHub thread.
+    lock = None
+    thread = None
+    stop_thread = False
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.communications = []
+        self.closing = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_thread = False
+        self.wake_pending = False
+        # Writing to this pipe wakes up the IOHub thread, e.g. when a command is queued.
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ, None)
+
+    def register(self, comm):
+        """
+        :param comm: The Communication object (with an open, non-blocking serial port) that needs to be serviced.
+        This is done by Communication.start(), it also starts the IOHub thread if it isn't running yet.
+        """
+        with self.lock:
+            self.communications.append(comm)
+            self.selector.register(comm.ser.fileno(), selectors.EVENT_READ, comm)
+            if self.thread is None:
+                self.stop_thread = False
+                self.thread = threading.Thread(target=self.__run)
+                self.thread.daemon = True
+                self.thread.start()
+        self.wake()
+
+    def unregister(self, comm):
+        """
+        :param comm: The Communication object that needs to be closed.
+        The IOHub thread writes what is left in its queue, then closes the serial port.
+        """
+        with self.lock:
+            if comm in self.communications and comm not in self.closing:
+                self.closing.append(comm)
+        self.wake()
+
+    def wake(self):
+        """
+        Wakes up the IOHub thread, so it writes the queued commands immediately.
+        """
+        if self.wake_pending or threading.current_thread() is self.thread:
+            return  # It's already awake.
+        self.wake_pending = True
+        try:
+            os.write(self.wake_write, b"\0")
+        except BlockingIOError:
+            pass
+
+    def stop(self):
+        """
+        Closes all registered controllers and stops the IOHub thread.
+        """
+        with self.lock:
+            for comm in self.communications:
+                comm.stop_thread = True
+                if comm not in self.closing:
+                    self.closing.append(comm)
+            self.stop_thread = True
+        self.wake()
+
+    def __run(self):
+        """
+        :return: None
+        This function is ran in the IOHub thread.
+        """
+        first = 0  # Index of the port that gets to read first, rotates each round.
+        while True:
+            with self.lock:
+                communications = list(self.communications)
+                closing = list(self.closing)
+                self.closing = []
+            for comm in closing:
+                self.__close(comm)
+            if self.stop_thread and len(communications) == len(closing):
+                break
+            communications = [comm for comm in communications if comm not in closing]
+
+            # 1. Write. Ports that can't take all data are selected for writing as well.
+            for comm in communications:
+                try:
+                    events = selectors.EVENT_READ
+                    if not comm.writeNonBlocking():
+                        events |= selectors.EVENT_WRITE
+                    if self.selector.get_key(comm.ser.fileno()).events != events:
+                        self.selector.modify(comm.ser.fileno(), events, comm)
+                except Exception as e:
+                    outputConsole("An error has occured while writing to COM " + str(comm.COM_port) + ": " + str(e), True)
+                    self.unregister(comm)
+
+            # 2. Wait until a port is readable or writable, or until the IOHub is woken up.
+            #    In acknowledged mode, also until a command has to be written again.
+            retransmissions = [comm.nextRetransmission() for comm in communications if comm.window is not None]
+            retransmissions = [max(0, retransmission) for retransmission in retransmissions if retransmission is not None]
+            ready = []
+            for key, events in self.selector.select(min(retransmissions) if len(retransmissions) > 0 else None):
+                if key.data is None:
+                    try:
+                        while os.read(self.wake_read, 512):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    # Cleared after emptying the pipe: commands queued before this are written in the next round.
+                    self.wake_pending = False
+                elif events & selectors.EVENT_READ:
+                    ready.append(key.data)
+
+            # 3. Read, a limited amount per port. What's left is read in the next round.
+            if len(ready) > 0:
+                first = (first + 1) % len(ready)
+                for comm in ready[first:] + ready[:first]:
+                    try:
+                        comm.readNonBlocking(IO_HUB_READ_CHUNK)
+                    except Exception as e:
+                        outputConsole("An error has occured while reading from COM " + str(comm.COM_port) + ": " + str(e), True)
+                        self.unregister(comm)
+        with self.lock:
+            self.thread = None
+
+    def __close(self, comm):
+        """
+        Writes the remaining commands (e.g. "STOP=0") and closes the serial port of comm.
+        """
+        try:
+            self.selector.unregister(comm.ser.fileno())
+        except (KeyError, ValueError):
+            pass
+        with self.lock:
+            if comm in self.communications:
+                self.communications.remove(comm)
+        try:
+            if comm.ser.is_open:
+                comm.ser.write_timeout = 1  # Blocking from now on, to make sure everything is written.
+                comm.writeNonBlocking()
+                comm.ser.reset_input_buffer()
+                comm.ser.close()
+            print("Communication has stopped. ")
+        except Exception as e:
+            outputConsole("An error has occured while closing COM " + str(comm.COM_port) + ": " + str(e), True)
+
+
+class AsyncCommunication(Communication):
+    """
+    Communication for AsyncXeryon.
+    Instead of running threads, the serial port is opened non-blocking and serviced by the asyncio event loop.
+    One event loop can drive many controllers this way.
+    NOTE: This needs an event loop that supports add_reader()/add_writer() on the serial port (Linux, macOS).
+    """
+    loop = None  # The asyncio event loop servicing this serial port.
+    flush_scheduled = False  # True when a flush of the readyToSend queue is already scheduled on the loop.
+    retransmission_timer = None  # In acknowledged mode: flushes again when a command has to be written again.
+    drained = None  # asyncio.Event, set by the flush that has written everything, see drain().
+
+    def __init__(self, xeryon_object, COM_port, baud):
+        super().__init__(xeryon_object, COM_port, baud)
+        self.loop = None
+        self.flush_scheduled = False
+        self.retransmission_timer = None
+        self.drained = None
+
+    async def start(self):
+        """
+        :return: None
+        This opens the serial port in non-blocking mode and registers it with the running event loop.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.drained = asyncio.Event()
+        self.stop_thread = False
+        if self.COM_port is None:
+            # Probing the ports blocks, so it's done in a thread.
+            await self.loop.run_in_executor(None, self.xeryon_object.findCOMPort)
+        if self.COM_port is None: #No com port found
+            raise Exception("No COM_port could automatically be found. You should provide it manually.")
+
+        try:
+            # timeout=0 and write_timeout=0 make reading and writing non-blocking.
+            # A probe of discovery can hold the port for a moment, so the open is done in a thread.
+            self.ser = await self.loop.run_in_executor(None, lambda: self.openSerialPort(timeout=0, write_timeout=0))
+            self.ser.reset_input_buffer()
+            self.ser.reset_output_buffer()
+            self.read_buffer = bytearray()
+            self.loop.add_reader(self.ser.fileno(), self.__readAvailable)
+        except Exception as e:
+            outputConsole("An error occured while trying to connect to COM: " + str(self.COM_port), True, True)
+            outputConsole(str(e), True, True)
+            raise Exception("Could not conect to COM " + str(self.COM_port))
+        self.__scheduleFlush()  # Commands that were queued before starting.
+
+    def sendCommand(self, command, block=True):
+        """
+        :param command: The command that needs to be send.
+        :param block: Not used, this function never blocks.
+        :return: None
+        This function adds the command to the readyToSend queue and schedules a write on the event loop.
+        It never blocks: if the queue is full (MAX_QUEUED_COMMANDS), an exception is raised.
+        """
+        with self.send_condition:
+            if len(self.readyToSend) >= MAX_QUEUED_COMMANDS:
+                raise Exception("The send queue is full, the controller on " + str(self.COM_port) +
+                                " doesn't accept commands fast enough.")
+            self.readyToSend.append(command)
+            if self.metrics is not None:
+                self.metrics.commandQueued(command, len(self.readyToSend))
+        self.__scheduleFlush()
+
+    def __scheduleFlush(self):
+        if self.loop is None or self.flush_scheduled:
+            return
+        self.flush_scheduled = True
+        self.loop.call_soon_threadsafe(self.__flush)
+
+    def __flush(self):
+        """
+        Writes the queued commands together with what is left from a previous write.
+        If the serial port can't take everything, the rest is written as soon as the port is writable again.
+        """
+        self.flush_scheduled = False
+        if self.ser is None or not self.ser.is_open:
+            return
+        if self.writeNonBlocking():
+            self.loop.remove_writer(self.ser.fileno())
+        else:
+            self.loop.add_writer(self.ser.fileno(), self.__flush)
+        if not self.hasDataToWrite():
+            self.drained.set()
+        if self.window is not None:
+            if self.retransmission_timer is not None:
+                self.retransmission_timer.cancel()
+                self.retransmission_timer = None
+            retransmission = self.nextRetransmission()
+            if retransmission is not None:
+                self.retransmission_timer = self.loop.call_later(max(0, retransmission), self.__flush)
+
+    def wakeWriter(self):
+        """
+        Schedules a flush on the event loop, e.g. when the window has room again.
+        """
+        self.__scheduleFlush()
+
+    def __readAvailable(self):
+        """
+        Called by the event loop when there is data to read.
+        """
+        try:
+            self.readNonBlocking()
+        except Exception as e:
+            outputConsole("An error has occured while reading from COM " + str(self.COM_port) + ": " + str(e), True)
+            self.closeCommunication()
+
+    async def drain(self, timeout=None):
+        """
+        :param timeout: Maximum time in seconds to wait. None waits forever.
+        :return: True if all queued commands are written, False if the timeout was reached or the port is closed.
+        Every queued command has a flush scheduled, the flush that writes the last one wakes this up.
+        """
+        async def waitUntilWritten():
+            while self.hasDataToWrite() and not self.stop_thread:
+                self.drained.clear()
+                await self.drained.wait()
+        try:
+            await asyncio.wait_for(waitUntilWritten(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return not self.hasDataToWrite()
+
+    def closeCommunication(self):
+        self.stop_thread = True
+        with Communication.ports_condition:
+            Communication.ports_in_use.discard(self.COM_port)
+        if self.drained is not None:
+            self.drained.set()  # Nothing will be written anymore.
+        if self.retransmission_timer is not None:
+            self.retransmission_timer.cancel()
+            self.retransmission_timer = None
+        if self.ser is not None and self.ser.is_open:
+            self.loop.remove_reader(self.ser.fileno())
+            self.loop.remove_writer(self.ser.fileno())
+            self.ser.close()
+            print("Communication has stopped. ")
+
+
+class AsyncXeryon(Xeryon):
+    """
+    Asyncio version of the Xeryon class.
+    The serial port is serviced by the event loop instead of a thread, and all blocking functions can be awaited.
+    Many AsyncXeryon objects can be driven from one event loop, e.g.:
+        controllers = [AsyncXeryon("/dev/ttyACM0"), AsyncXeryon("/dev/ttyACM1")]
+        ...
+        await asyncio.gather(*[controller.start() for controller in controllers])
+    """
+
+    def __init__(self, COM_port = None, baudrate = 115200, serial_number = None):
+        """
+            :param COM_port: Specify the COM port used
+            :type COM_port: string
+            :param baudrate: Specify the baudrate
+            :type baudrate: int
+            :param serial_number: Serial number (SRNO) of the controller, see Xeryon.
+            :return: Return an AsyncXeryon object.
+        """
+        super().__init__(COM_port, baudrate, serial_number=serial_number)
+        self.comm = AsyncCommunication(self, COM_port, baudrate)
+
+    def addAxis(self, stage, axis_letter):
+        """
+        :param stage: Specify the type of stage that is connected.
+        :type stage: Stage
+        :return: Returns an AsyncAxis object
+        """
+        newAxis = AsyncAxis(self, axis_letter, stage)
+        self.axis_list.append(newAxis)  # Add axis to axis list.
+        self.axis_letter_list.append(axis_letter)
+        self.axis_dict[axis_letter] = newAxis
+        return newAxis
+
+    async def start(self, external_settings_default = None, force_full_upload = False):
+        """
+        :param force_full_upload: If True, all settings are send, even the ones that didn't change since the last start.
+        :return: Nothing.
+        This functions NEEDS to be awaited before any commands are executed.
+        Sending only the settings that changed is opt-in, see SAVE_UPLOADED_SETTINGS and Xeryon.start().
+        """
+        if len(self.getAllAxis()) <= 0:
+            raise Exception(
+                "Cannot start the system without stages. The stages don't have to be connnected, only initialized in the software.")
+
+        await self.getCommunication().start()
+
+        for axis in self.getAllAxis():
+            axis.reset()
+
+        await asyncio.sleep(0.2)
+
+        identity = None
+        if AUTO_SEND_SETTINGS and SAVE_UPLOADED_SETTINGS and SETTINGS_CACHE_FILENAME is not None:
+            identity = await self.readIdentity()
+        answers = self.configureAxes(external_settings_default, force_full_upload, identity)
+        await self.getCommunication().drain()
+        done, not_done = await asyncio.wait([asyncio.wrap_future(answer) for answer in answers], timeout=QUERY_TIMEOUT)
+        if not_done:
+            for answer in answers:
+                answer.cancel()
+            outputConsole("The controller didn't answer all questions for the limits (HLIM, LLIM, SSPD, PTO2, PTOL).", True)
+
+    async def moveMany(self, targets, differentUnits=None, timeout=None):
+        """
+        :param targets: A dictionary {axis: position} for the axes of this controller.
+        :param differentUnits: If the positions aren't specified in the current units of each axis, specify the correct units.
+        :param timeout: Maximum time to wait in seconds. None waits until all movements are done.
+        :return: A dictionary {axis: True if the position is reached}.
+        All axes start moving at the same time, their DPOS commands are written together.
+        For axes of different controllers, use asyncio.gather() on their setDPOS().
+        """
+        for axis in targets:
+            if axis not in self.getAllAxis():
+                raise Exception("Axis " + str(axis) + " doesn't belong to this controller.")
+        # All DPOS commands are queued before the event loop gets to write them.
+        reached = await asyncio.gather(*[axis.setDPOS(position, differentUnits, False, timeout=timeout)
+                                         for axis, position in targets.items()])
+        return dict(zip(targets, reached))
+
+    async def homeAll(self, direction=0, timeout=None):
+        """
+        :param direction: The direction to search the index in, see findIndex().
+        :param timeout: Maximum time to wait in seconds. None waits until all searches are done.
+        :return: A dictionary {axis: True if the index is found}.
+        The index search is started on all axes of this controller at the same time.
+        For axes of different controllers, use asyncio.gather() on their homeAll().
+        """
+        axes = self.getAllAxis()
+        # All INDX commands are queued before the event loop gets to write them.
+        found = await asyncio.gather(*[axis.findIndex(direction=direction, timeout=timeout) for axis in axes])
+        return dict(zip(axes, [result is True for result in found]))
+
+    async def readIdentity(self, timeout = 1):
+        """
+        :param timeout: Maximum time in seconds to wait for the answers.
+        :return: A tuple (SRNO, SOFT) with the serial number and software version of the controller.
+                 None if the controller doesn't answer within the timeout.
+        """
+        answers = {}
+        answered = asyncio.get_running_loop().create_future()
+
+        def onData(tag, value):
+            if tag == "SRNO" or tag == "SOFT":
+                answers[tag] = value
+                if len(answers) == 2 and not answered.done():
+                    answered.set_result(True)
+
+        for axis in self.getAllAxis():
+            axis.data_callbacks.append(onData)
+        try:
+            self.comm.sendCommand("SRNO=?")
+            self.comm.sendCommand("SOFT=?")
+            await asyncio.wait_for(answered, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for axis in self.getAllAxis():
+                axis.data_callbacks.remove(onData)
+        if "SRNO" not in answers:
+            return None
+        return answers["SRNO"], answers.get("SOFT", "")
+
+    async def stop(self):
+        """
+        :return: None
+        This function sends STOP to the controller and closes the communication.
+        """
+        for axis in self.getAllAxis():  # Send STOP to each axis.
+            axis.sendCommand("ZERO=0")
+            axis.sendCommand("STOP=0")
+            axis.was_valid_DPOS = False
+        await self.getCommunication().drain(1)
+        self.getCommunication().closeCommunication()  # Close communication
+        outputConsole("Program stopped running.")
+
+    async def reset(self, force_full_upload = False):
+        """
+        :param force_full_upload: If True, all settings are send, even the ones that didn't change since the last start.
+        :return: None
+        This function sends RESET to the controller, and configures it again like start() does. See Xeryon.reset().
+        """
+        for axis in self.getAllAxis():
+            axis.reset()
+        await asyncio.sleep(0.2)
+
+        identity = None
+        if AUTO_SEND_SETTINGS and SAVE_UPLOADED_SETTINGS and SETTINGS_CACHE_FILENAME is not None:
+            identity = await self.readIdentity()
+        self.configureAxes(None, force_full_upload, identity)  # Read settings file again, and send it.
+
+
+class AsyncAxis(Axis):
+    """
+    Asyncio version of the Axis class, created by AsyncXeryon.addAxis().
+    The functions that block in Axis (setDPOS, step, findIndex, startScan, startLogging, streamWaypoints) are coroutines here.
+    """
+
+    async def waitFor(self, condition, timeout=None):
+        """
+        :param condition: A function without arguments, e.g. axis.isPositionReached.
+        :param timeout: Maximum time to wait in seconds. None waits forever.
+        :return: True if the condition became True, False if the timeout was reached.
+        The condition is checked again each time data is received from the controller.
+        """
+        if condition():
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+
+        def check(tag, value):
+            if not future.done() and condition():
+                future.set_result(True)
+
+        self.data_callbacks.append(check)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.data_callbacks.remove(check)
+
+    async def waitForUpdate(self):
+        """
+        This function waits a couple of update messages.
+        """
+        wait_nb = 3  # This number defines how much updates need to be passed.
+
+        # The wait number needs to adjust to POLI.
+        if self.getSetting("POLI") is not None:
+            wait_nb = wait_nb / int(self.def_poli_value) * int(self.getSetting("POLI"))
+
+        start_nb = int(self.update_nb)
+        await self.waitFor(lambda: (int(self.update_nb) - start_nb) >= wait_nb)
+
+    async def query(self, tag, timeout=1):
+        """
+        :param tag: The tag of the setting or data, e.g. "HLIM" or "SRNO".
+        :param timeout: Maximum time to wait for the answer, in seconds.
+        :return: The value the controller answered, as an integer (or a string if it isn't numeric) like Axis.query().
+                 None if there was no answer in time.
+        This function sends "TAG=?" and waits for the answer.
+        """
+        future = super().query(tag)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def queryMany(self, tags, timeout=1):
+        """
+        :param tags: A list of tags, e.g. ["HLIM", "LLIM"].
+        :param timeout: Maximum time to wait for all answers together, in seconds.
+        :return: A dictionary {tag: value}, with the values like query(). None for a tag that wasn't answered in time.
+        All questions are written to the controller at once.
+        """
+        futures = Axis.queryMany(self, tags)
+        if len(futures) > 0:
+            await asyncio.wait([asyncio.wrap_future(future) for future in futures.values()], timeout=timeout)
+        answers = {}
+        for tag, future in futures.items():
+            try:
+                future.set_exception(TimeoutError("No answer within " + str(timeout) + " s."))
+            except concurrent.futures.InvalidStateError:
+                pass  # Answered.
+            answers[tag] = future.result() if future.exception() is None else None
+        return answers
+
+    async def findIndex(self, forceWaiting = False, direction=0, timeout=None):
+        """
+        :param timeout: Maximum time in seconds to wait for the index. None waits until the controller stops searching.
+        :return: True if the index is found.
+        This function finds the index, after finding the index it goes to the index position.
+        """
+        self.sendCommand("INDX=" + str(direction))
+        self.was_valid_DPOS = False
+
+        if DISABLE_WAITING is False or forceWaiting is True:
+            await self.waitForUpdate()  # Waits a couple of updates, so the EncoderValid flag is valid and doesn't lagg behind.
+            await self.waitForUpdate()
+            outputConsole("Searching index for axis " + str(self) + ".")
+            if not await self.waitFor(lambda: self.isEncoderValid() or not self.isSearchingIndex(), timeout):
+                outputConsole("Index is not found, timeout reached.", True)
+                return False
+            if not self.isEncoderValid():
+                outputConsole("Index is not found, but stopped searching for index.", True)
+                return False
+
+        if self.isEncoderValid():
+            outputConsole("Index of axis " + str(self) + " found.")
+            return True
+
+    async def setDPOS(self, value, differentUnits=None, outputToConsole=True, forceWaiting = False, timeout=None):
+        """
+        :param value: The new value DPOS has to become.
+        :param differentUnits: If the value isn't specified in the current units, specify the correct units.
+        :type differentUnits: Units
+        :param outputToConsole: Default set to True. If set to False, this function won't output text to the console.
+        :param timeout: Maximum time in seconds to wait for the position. None waits until the controller reports it,
+                        or until the deadline of the movement (MOVE_TIMEOUT_FACTOR times its ETA), like a MoveHandle.
+        :return: True if the position is reached, False if not.
+        """
+        unit = self.units  # Current units
+        if differentUnits is not None:  # If the value given are in different units than the current units:
+            unit = differentUnits  # Then specify the unit in differentUnits argument.
+
+        DPOS = int(self.convertUnitsToEncoder(value, unit))  # Convert into encoder units.
+
+        eta = self.estimateMoveTime(DPOS - self.epos)
+        self.sendCommand("DPOS=" + str(DPOS))
+        self.was_valid_DPOS = True # And keep it True in order to avoid an accumulating error.
+
+        if DEBUG_MODE is False and DISABLE_WAITING is False or forceWaiting is True:
+            # The deadline is a timer of the event loop, so it also fails when the controller doesn't send anything.
+            deadline = None
+            if eta is not None and MOVE_TIMEOUT_FACTOR is not None and not DEBUG_MODE:
+                deadline = eta * MOVE_TIMEOUT_FACTOR + MOVE_TIMEOUT_MARGIN
+            watchdog = deadline is not None and (timeout is None or deadline < timeout)
+            wait_time = deadline if watchdog else timeout
+            # Wait until the position is reached, or an error status bit is set.
+            if not await self.waitFor(lambda: self.isDPOSReached(DPOS) or self.getMoveError() is not None, wait_time):
+                if watchdog:
+                    outputConsole("Position not reached, timeout reached. The movement takes longer than " +
+                                  str(MOVE_TIMEOUT_FACTOR) + " x its ETA of " + str(round(eta, 3)) + " s. " +
+                                  getDposEposString(value, self.getEPOS(), unit), True)
+                else:
+                    outputConsole(
+                        "Position not reached, timeout reached. (4) " + getDposEposString(value, self.getEPOS(), unit),
+                        True)
+                return False
+            if not self.isDPOSReached(DPOS):
+                outputConsole(self.getMoveError() + " " + getDposEposString(value, self.getEPOS(), unit), True)
+                return False
+
+        if outputToConsole and DISABLE_WAITING is False:  # Output new DPOS & EPOS if necessary
+            outputConsole(getDposEposString(value, self.getEPOS(), unit))
+        return True
+
+    async def streamWaypoints(self, positions, differentUnits=None, dwell=None, timeout=None, blocking=True):
+        """
+        :param positions: The positions to go to, one after the other (a list, NumPy array...).
+        :param differentUnits: If the positions aren't specified in the current units, specify the correct units.
+        :type differentUnits: Units
+        :param dwell: Time in seconds to stay at each position before going to the next one, see Axis.streamWaypoints().
+        :param timeout: Maximum time in seconds to wait for all positions. None waits until the last one is reached.
+        :param blocking: If False, this returns the WaypointStream right after sending the first DPOS.
+        :return: True if all positions are reached, False if not. A WaypointStream if blocking is False.
+        """
+        stream = super().streamWaypoints(positions, differentUnits, dwell, blocking=False)
+        if not blocking:
+            return stream
+        # The stream is done from a data update, or from the dwell timer or the watchdog: then the next update wakes this.
+        if not await self.waitFor(stream.done, timeout):
+            outputConsole("Waypoints not reached, timeout reached. (4) " + str(len(stream.arrival_times)) + " of " +
+                          str(len(stream)) + " reached.", True)
+            return False
+        if stream.error is not None:
+            outputConsole(stream.error + " " + getDposEposString(stream.values[len(stream.arrival_times)], self.getEPOS(),
+                                                                 stream.unit), True)
+            return False
+        return True
+
+    async def step(self, value, forceWaiting = False):
+        """
+        :param value: The amount it needs to step (specified in the current units)
+        :return: True if the position is reached, False if not.
+        """
+        step = self.convertUnitsToEncoder(value, self.units)
+        new_DPOS = self.getStepDPOS(step)
+
+        reached = await self.setDPOS(new_DPOS, Units.enc, False, forceWaiting=forceWaiting)
+        if DISABLE_WAITING is False:
+            await self.waitForUpdate()  # Waits a couple of updates, so the EPOS is valid and doesn't lagg behind.
+            outputConsole("Stepped: " + str(self.convertEncoderUnitsToUnits(step, self.units)) + " " + str(
+                self.units) + " " + getDposEposString(self.getDPOS(), self.getEPOS(), self.units))
+        return reached
+
+    async def startScan(self, direction, execTime=None, untilLimit=False, timeout=None):
+        """
+        :param direction: Positive or negative number.
+        :param execTime: Specify the execution time in seconds. If no time is specified, it scans until scanStop() is used.
+        :param untilLimit: If True, wait until the end stop in the scanning direction is reached.
+        :param timeout: Only used with untilLimit. Maximum time in seconds to wait for the limit.
+        """
+        self.sendCommand("SCAN=" + str(int(direction)))
+        self.was_valid_DPOS = False
+
+        if execTime is not None:
+            await asyncio.sleep(execTime)
+            self.sendCommand("SCAN=0")
+
+        if untilLimit: # Wait until the software limit is hit.
+            await self.waitForUpdate()
+            if int(direction) > 0:
+                limitReached = await self.waitFor(self.isAtRightEnd, timeout)
+            else:
+                limitReached = await self.waitFor(self.isAtLeftEnd, timeout)
+            if not limitReached:
+                outputConsole("Limit not reached, timeout reached.", True)
+            return limitReached
+
+    async def startLogging(self, increase_poli = True, capacity = None, filename = None):
+        """
+        :param capacity: The maximum number of samples to keep, default LOG_CAPACITY. Older samples are overwritten.
+        :param filename: If specified, the data is streamed to this file instead of kept in memory. (See LogFileSink)
+        This function starts logging all data that the controller sends.
+        It updates the POLI (Polling Interval) to get more data.
+        """
+        self.isLogging = False
+        if self.log_buffer is not None:
+            self.log_buffer.close()  # A previous log to a file is written and closed, even if endLogging() wasn't called.
+        if filename is not None:
+            self.log_buffer = LogFileSink(filename)
+        else:
+            self.log_buffer = LogBuffer(LOG_CAPACITY if capacity is None else capacity)
+        self.isLogging = True
+        if increase_poli:
+            self.xeryon_object.getAllAxis()[0].logging_poli = True
+            self.logging_poli = True
+            self.xeryon_object.getAllAxis()[0].setSetting("POLI", "1") #also adapt it for the master
+            self.setSetting("POLI", "1")
+        await self.waitForUpdate()  # To make sure the POLI is set.
+
 
 class Stage(Enum):
     XLS_312 = (True,  # isLineair (True/False)
@@ -1550,6 +4864,23 @@ def outputConsole(message, error=False, force=True):
         else:
             print(message)
 
+def parseFrame(frame):
+    """
+    :param frame: A single line received from the controller, e.g. "X:EPOS=1234".
+    :return: A tuple (axis_letter, tag, value), e.g. ("X", "EPOS", "1234").
+             axis_letter is None if no axis is specified. Returns None if the line doesn't contain "=".
+    """
+    tag, separator, value = frame.partition("=")
+    if not separator:
+        return None
+    if " " in value or "\r" in value:
+        value = value.rstrip("\r").replace(" ", "")
+    letter, separator, axis_tag = tag.partition(":")
+    if separator and ":" not in axis_tag:
+        return letter, axis_tag, value
+    return None, tag, value
+
+
 def is_numeric(value):
     try:
         int(value)
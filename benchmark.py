@@ -0,0 +1,331 @@
+"""
+Benchmarks for the hot paths of the Xeryon library.
+
+    python benchmark.py --output baseline.json
+    ... change Xeryon.py ...
+    python benchmark.py --compare baseline.json
+
+Every benchmark runs against an in-process fake serial port, no controller is needed.
+The results are written as JSON. With --compare, each result is compared to the baseline and the
+script exits with 1 if one of them got worse than --threshold.
+"""
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import statistics
+
+import Xeryon
+from Xeryon import Stage, Units
+
+ENABLE_METRICS = False  # Run the benchmarks with Xeryon.enableMetrics(), to measure the cost of the instrumentation.
+
+
+class FakeSerial:
+    """
+    Replaces serial.Serial during the benchmarks.
+    It answers "DPOS=..." right away with EPOS=DPOS and the "position reached" flag.
+    Everything else is only counted.
+    """
+    STAT_REACHED = (1 << 5) | (1 << 6) | (1 << 8) | (1 << 10)  # Motor on, closed loop, encoder valid, position reached.
+
+    def __init__(self, port = None, baudrate = 115200, timeout = None, write_timeout = None):
+        self.port = port
+        self.timeout = timeout
+        self.is_open = True
+        self.input = bytearray()
+        self.condition = threading.Condition()
+        self.lines_written = 0
+
+    def write(self, data):
+        replies = []
+        for line in bytes(data).split(b"\n"):
+            if not line:
+                continue
+            self.lines_written += 1
+            prefix, _, command = line.rpartition(b":")
+            if command.startswith(b"DPOS="):
+                if prefix:
+                    prefix += b":"
+                replies.append(prefix + b"EPOS=" + command[5:] + b"\n" +
+                               prefix + b"STAT=" + str(self.STAT_REACHED).encode() + b"\n")
+        with self.condition:
+            if replies:
+                self.input += b"".join(replies)
+            self.condition.notify_all()
+        return len(data)
+
+    def waitForLines(self, count, timeout = 10):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.lines_written >= count, timeout)
+
+    @property
+    def in_waiting(self):
+        return len(self.input)
+
+    def read(self, size = 1):
+        with self.condition:
+            if not self.input and self.timeout:
+                self.condition.wait_for(lambda: len(self.input) > 0 or not self.is_open, self.timeout)
+            data = bytes(self.input[:size])
+            del self.input[:size]
+        return data
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self.condition:
+            self.input.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        with self.condition:
+            self.is_open = False
+            self.condition.notify_all()
+
+
+class FakeController:
+    """
+    A Xeryon object with one axis, connected to a FakeSerial.
+    """
+
+    def __init__(self, start_communication = False):
+        self.original_serial = Xeryon.serial.Serial
+        Xeryon.serial.Serial = FakeSerial
+        self.controller = Xeryon.Xeryon("fake")
+        self.axis = self.controller.addAxis(Stage.XLA_1250, "X")
+        self.axis.setUnits(Units.mm)
+        self.axis.setSetting("PTOL", "2", doNotSendThrough=True)
+        self.axis.setSetting("PTO2", "4", doNotSendThrough=True)
+        if ENABLE_METRICS:
+            self.controller.enableMetrics()
+        self.serial = None
+        if start_communication:
+            self.controller.getCommunication().start()
+            self.serial = self.controller.getCommunication().ser
+
+    def close(self):
+        if self.serial is not None:
+            self.controller.getCommunication().closeCommunication()
+            self.controller.getCommunication().thread.join()
+        Xeryon.serial.Serial = self.original_serial
+
+
+def bestOf(repeat, function):
+    """
+    :return: The shortest duration of repeat runs of function, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmarkParser(repeat):
+    """
+    Frames per second through Axis.receiveData and through Communication.feedData.
+    """
+    fake = FakeController()
+    frames = []
+    for i in range(1000):
+        frames += ["EPOS=" + str(i), "DPOS=1000", "STAT=" + str(FakeSerial.STAT_REACHED), "TIME=" + str(i * 7 % 65536)]
+    receive = fake.axis.receiveData
+
+    def receiveAll():
+        for frame in frames:
+            receive(frame)
+
+    chunk = ("\n".join(frames) + "\n").encode()
+    feed = fake.controller.getCommunication().feedData
+
+    def feedAll():
+        feed(chunk)
+
+    receive_time = bestOf(repeat, receiveAll)
+    feed_time = bestOf(repeat, feedAll)
+    fake.close()
+    return {
+        "parser_receive_data": (len(frames) / receive_time, "frames/s", True),
+        "parser_feed_data": (len(frames) / feed_time, "frames/s", True),
+    }
+
+
+def benchmarkQueueDrain(repeat):
+    """
+    Commands per second from Communication.sendCommand until they are written to the serial port.
+    """
+    fake = FakeController(start_communication=True)
+    comm = fake.controller.getCommunication()
+    count = 5000
+
+    def sendAll():
+        target = fake.serial.lines_written + count
+        for i in range(count):
+            comm.sendCommand("X:SSPD=" + str(i))
+        if not fake.serial.waitForLines(target):
+            raise Exception("The commands were not written in time.")
+
+    drain_time = bestOf(repeat, sendAll)
+    fake.close()
+    return {"queue_drain": (count / drain_time, "commands/s", True)}
+
+
+def benchmarkStatusCheck(repeat):
+    """
+    Cost of a status check (isPositionReached) and of a full move check (isDPOSReached).
+    """
+    fake = FakeController()
+    axis = fake.axis
+    axis.receiveData("STAT=" + str(FakeSerial.STAT_REACHED))
+    axis.receiveData("EPOS=1000")
+    count = 100000
+
+    def statusChecks():
+        for _ in range(count):
+            axis.isPositionReached()
+
+    def moveChecks():
+        for _ in range(count):
+            axis.isDPOSReached(1000)
+
+    status_time = bestOf(repeat, statusChecks)
+    move_time = bestOf(repeat, moveChecks)
+    fake.close()
+    return {
+        "status_check": (status_time / count * 1e9, "ns", False),
+        "dpos_reached_check": (move_time / count * 1e9, "ns", False),
+    }
+
+
+def benchmarkUnitConversion(repeat):
+    """
+    Cost of converting a value from and to encoder units.
+    """
+    fake = FakeController()
+    axis = fake.axis
+    values = [i * 0.013 for i in range(10000)]
+
+    def toEncoder():
+        for value in values:
+            axis.convertUnitsToEncoder(value, Units.mm)
+
+    def fromEncoder():
+        for value in values:
+            axis.convertEncoderUnitsToUnits(value, Units.mm)
+
+    to_time = bestOf(repeat, toEncoder)
+    from_time = bestOf(repeat, fromEncoder)
+    fake.close()
+    return {
+        "units_to_encoder": (to_time / len(values) * 1e9, "ns", False),
+        "encoder_to_units": (from_time / len(values) * 1e9, "ns", False),
+    }
+
+
+def benchmarkMoveLatency(repeat):
+    """
+    Time from setDPOS until it returns, when the (fake) controller reports the position right away.
+    This is the overhead of the library: queue, write, read, parse and wake up the waiting thread.
+    """
+    fake = FakeController(start_communication=True)
+    axis = fake.axis
+    latencies = []
+    for i in range(repeat * 100):
+        start = time.perf_counter()
+        if not axis.setDPOS(1 + (i % 2), outputToConsole=False, timeout=5):
+            raise Exception("setDPOS did not complete.")
+        latencies.append(time.perf_counter() - start)
+    fake.close()
+    latencies.sort()
+    return {
+        "move_latency_p50": (statistics.median(latencies) * 1e6, "us", False),
+        "move_latency_p99": (latencies[int(len(latencies) * 0.99)] * 1e6, "us", False),
+    }
+
+
+BENCHMARKS = {
+    "parser": benchmarkParser,
+    "queue_drain": benchmarkQueueDrain,
+    "status_check": benchmarkStatusCheck,
+    "unit_conversion": benchmarkUnitConversion,
+    "move_latency": benchmarkMoveLatency,
+}
+
+
+def runBenchmarks(names = None, repeat = 10):
+    """
+    :param names: The benchmarks to run (keys of BENCHMARKS), None runs all of them.
+    :return: A dictionary that can be written as JSON.
+    """
+    Xeryon.OUTPUT_TO_CONSOLE = False
+    results = {}
+    for name in (names or BENCHMARKS.keys()):
+        for result, (value, unit, higher_is_better) in BENCHMARKS[name](repeat).items():
+            results[result] = {"value": round(value, 3), "unit": unit, "higher_is_better": higher_is_better}
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": Xeryon.np is not None,
+        "metrics": ENABLE_METRICS,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    :return: A list of (name, baseline value, new value, relative change, is regression) for the results in both.
+    The relative change is positive if the result got better.
+    """
+    comparison = []
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]["value"]
+        new = result["value"]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        if not result["higher_is_better"]:
+            change = -change
+        comparison.append((name, old, new, change, change < -threshold))
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the hot paths of the Xeryon library.")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", default=None, help="Compare the results to this JSON file (a previous --output).")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change that counts as a regression. (default: 0.10)")
+    parser.add_argument("--repeat", type=int, default=10, help="Number of repetitions, the best one counts. (default: 10)")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS.keys()), help="Only run these benchmarks.")
+    parser.add_argument("--metrics", action="store_true", help="Enable the latency instrumentation (enableMetrics).")
+    args = parser.parse_args()
+    ENABLE_METRICS = args.metrics
+
+    report = runBenchmarks(args.only, args.repeat)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare is None:
+        for name, result in report["results"].items():
+            print("%-22s %14.3f %s" % (name, result["value"], result["unit"]))
+        sys.exit(0)
+
+    with open(args.compare, "r") as file:
+        baseline = json.load(file)
+    regressions = 0
+    print("%-22s %14s %14s %9s" % ("benchmark", "baseline", "new", "change"))
+    for name, old, new, change, is_regression in compare(report, baseline, args.threshold):
+        print("%-22s %14.3f %14.3f %+8.1f%%%s" % (name, old, new, change * 100, "  REGRESSION" if is_regression else ""))
+        regressions += is_regression
+    sys.exit(1 if regressions else 0)
@@ -38,10 +38,10 @@ class XAxisController:
         self.axis.startLogging()
         self.axis.setUnits(Units.mm)
         self.axis.setSpeed(20)
-        self.axis.setDPOS(pos_mm)
-
-        while not self.axis.isPositionReached():
-            time.sleep(0.1)
+        # Waits on the telemetry until the position is reached, or fails when the move overruns its ETA.
+        handle = self.axis.setDPOS(pos_mm, blocking=False)
+        if not handle.wait():
+            print(f"\033[91m[{self.name}] Position not reached: {handle.error}\033[0m")
 
         logs = self.axis.endLogging()
 
@@ -149,9 +149,8 @@ def setup_gpio():
         return False
 
 def main():
-    # Start all controllers
-    for axis in [x_axis, y_axis, z_axis]:
-        axis.start()
+    # Start all controllers and find the index of all axes at the same time
+    startAll([axis.controller for axis in [x_axis, y_axis, z_axis]])
 
     # Initial position
     while True:
@@ -132,9 +132,8 @@ def setup_gpio():
         print(f"Failed to setup GPIO: {e}")
         return False
 def main():
-    # Start all controllers
-    for axis in [x_axis, y_axis, z_axis]:
-        axis.start()
+    # Start all controllers and find the index of all axes at the same time
+    startAll([axis.controller for axis in [x_axis, y_axis, z_axis]])
 
     # Initial position
     move_to_3d(Xout, Y0, Zlow)
@@ -27,7 +27,10 @@ class XAxisController:
         self.controller.stop()
 
     def move_to(self, pos_mm):
+        self.finish_move(self.start_move(pos_mm))
 
+    def prepare(self):
+        # Waits out the error limit, enables the axis and sets the units and speed used for every move.
         while self.axis.isErrorLimit():
             print(f"[{self.name}] ⚠️ Thermal protection triggered. Cooling down...")
             time.sleep(2)
@@ -36,16 +39,21 @@ class XAxisController:
 
         self.axis.setUnits(Units.mm)
         self.axis.setSpeed(20)
-        self.axis.setDPOS(pos_mm)
-
-        while not self.axis.isPositionReached():
-            time.sleep(0.5)
-
-
-        print(f"[{self.name}] ✅ Reached {pos_mm} mm with EPOS: {self.axis.getEPOS()} mm")
 
+    def start_move(self, pos_mm):
+        # Sends the new position and returns immediately with a MoveHandle.
+        self.prepare()
+        return self.axis.setDPOS(pos_mm, blocking=False)
 
+    def finish_move(self, handle):
+        # Waits for the move started with start_move() and reports the result.
+        if not handle.wait():
+            print(f"\033[91m[{self.name}] Position not reached: {handle.error}\033[0m")
+        else:
+            print(f"[{self.name}] ✅ Reached {handle.value} mm with EPOS: {self.axis.getEPOS()} mm")
+        self.report_errors()
 
+    def report_errors(self):
         errors = [msg for msg, chk in self.error_checks if chk()]
         if errors:
             print(f"\033[91m[{self.name}] Errors detected:\033[0m")
@@ -81,49 +89,61 @@ except Exception as e:
 
 def move_to_3d(x, y, z):
     print(f"🔄 Moving to 3D coordinate: ({x}, {y}, {z}) mm")
-    # Start all moves in parallel (sequentially here, could be threaded if needed)
-    x_axis.move_to(x)
-    y_axis.move_to(y)
-    z_axis.move_to(z)
+    # Start all moves at once, so it takes as long as the slowest axis instead of the sum of all three.
+    moves = [(axis, axis.start_move(pos)) for axis, pos in ((x_axis, x), (y_axis, y), (z_axis, z))]
+    waitAll([handle for axis, handle in moves])
+    for axis, handle in moves:
+        axis.finish_move(handle)
 
 
 
 
-def takefromdown_leaveintheup():
-    # Go to Z low, X in
-    move_to_3d(Xin, Y0, Zlow)
+def plate_transfer_plan(z_take, z_leave, settle=0):
+    # The plan is made once and run for every cycle. Each step starts as soon as the steps it depends on are done,
+    # e.g. Y only has to be in place before grabbing, it doesn't wait for X and Z.
+    # settle: seconds to wait after pulling the plate out, before Z moves.
+    # Movements are move steps, so the movements of one axis always run in the order they are added.
+    plan = MotionPlan()
+    plan.move("x_in", x_axis.axis, Xin)
+    plan.move("y0", y_axis.axis, Y0)
+    plan.move("z_take", z_axis.axis, z_take)
     # Grab the wellplate
-    GPIO.output(17, GPIO.HIGH)
-    # Go Back to Z low, X out
-    move_to_3d(Xout, Y0, Zlow)
-    time.sleep(2)
-    # Go to Z high, X out
-    move_to_3d(Xout, Y0, Zhigh)
-    # Go to Z high, X in
-    move_to_3d(Xin, Y0, Zhigh)
+    plan.call("grab", lambda: GPIO.output(17, GPIO.HIGH), after=["x_in", "y0", "z_take"])
+    plan.move("x_out", x_axis.axis, Xout, after="grab")
+    if settle > 0:
+        plan.wait("settle", settle, after="x_out")
+    plan.move("z_leave", z_axis.axis, z_leave, after="settle" if settle > 0 else "x_out")
+    plan.move("x_in_leave", x_axis.axis, Xin, after="z_leave")
     # Release the wellplate
-    GPIO.output(17, GPIO.LOW)
-    # Go back to Z high, X in1
-    move_to_3d(Xin1, Y0, Zhigh)
- 
+    plan.call("release", lambda: GPIO.output(17, GPIO.LOW), after="x_in_leave")
+    plan.move("x_in1", x_axis.axis, Xin1, after="release")
+    return plan
+
+
+down_to_up_plan = plate_transfer_plan(Zlow, Zhigh, settle=2)
+up_to_down_plan = plate_transfer_plan(Zhigh, Zlow)
+
+
+def run_plan(plan):
+    for axis in [x_axis, y_axis, z_axis]:
+        axis.prepare()
+    try:
+        plan.run()
+    finally:
+        if plan.timeline is not None:
+            print(MotionPlan.formatTimeline(plan.timeline))
+        print("=========================================")
+        # Same error report per axis as after a single move (force, encoder, thermal protection...).
+        for axis in [x_axis, y_axis, z_axis]:
+            axis.report_errors()
 
 
+def takefromdown_leaveintheup():
+    run_plan(down_to_up_plan)
+
 
 def take_from_up_leaveindown():
-    # Go back to Z high, X in
-    move_to_3d(Xin, Y0, Zhigh)
-    # Grab the wellplate
-    GPIO.output(17, GPIO.HIGH)
-    # Go Back to Z high, X out
-    move_to_3d(Xout, Y0, Zhigh)
-    # Go to Z low, X out
-    move_to_3d(Xout, Y0, Zlow)
-    # Go to Z low, X in
-    move_to_3d(Xin, Y0, Zlow)
-    # Leave the wellplate
-    GPIO.output(17, GPIO.LOW)
-    # Go to Z low, X out
-    move_to_3d(Xin1, Y0, Zlow)
+    run_plan(up_to_down_plan)
 
 
 def setup_gpio():
@@ -142,9 +162,8 @@ def setup_gpio():
         print(f"Failed to setup GPIO: {e}")
         return False
 def main():
-    # Start all controllers
-    for axis in [x_axis, y_axis, z_axis]:
-        axis.start()
+    # Start all controllers and find the index of all axes at the same time
+    startAll([axis.controller for axis in [x_axis, y_axis, z_axis]])
 
     # Initial position
     move_to_3d(Xout, Y0, Zlow)
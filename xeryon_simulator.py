@@ -0,0 +1,419 @@
+"""
+Virtual Xeryon controller, for testing and benchmarking without a stage connected.
+
+The simulator opens a pseudo-terminal (Linux/macOS) and speaks the controller's line protocol on it,
+so the Xeryon library can connect to it like to a real controller:
+
+    python xeryon_simulator.py --axes X
+    > Xeryon simulator listening on /dev/pts/3
+
+    controller = Xeryon("/dev/pts/3")
+
+Or from Python:
+
+    simulator = XeryonSimulator("XYZ")
+    controller = Xeryon(simulator.start())
+    ...
+    simulator.stop()
+
+Supported: DPOS, INDX, SCAN, MOVE, STOP, RSET, ENBL, POLI, ZERO, SAVE, ECHO and "TAG=?" queries.
+Every other "TAG=VALUE" is stored as a setting.
+With more than one axis, commands are prefixed with the axis letter ("X:DPOS=100"); commands without
+a prefix are for the master.
+Each axis sends EPOS, DPOS, STAT and TIME every POLI milliseconds. The movement follows a trapezoidal profile
+(SSPD, ACCE, DECE), stops at LLIM/HLIM and sets the "position reached" flag within PTOL (kept within PTO2).
+"""
+import os
+import tty
+import time
+import math
+import select
+import argparse
+import threading
+
+# Status bits, see Xeryon.StatusFlags.
+BIT_MOTOR_ON = 1 << 5
+BIT_CLOSED_LOOP = 1 << 6
+BIT_ENCODER_AT_INDEX = 1 << 7
+BIT_ENCODER_VALID = 1 << 8
+BIT_SEARCHING_INDEX = 1 << 9
+BIT_POSITION_REACHED = 1 << 10
+BIT_SCANNING = 1 << 13
+BIT_LEFT_END_STOP = 1 << 14
+BIT_RIGHT_END_STOP = 1 << 15
+# Error bits, cleared by ENBL=1: thermal protection 1 & 2, error limit, safety timeout, position fail.
+ERROR_BITS = (1 << 2) | (1 << 3) | (1 << 16) | (1 << 18) | (1 << 21)
+
+# The settings every axis starts with (and returns to after RSET, unless they are saved).
+# Speeds are in um/s, ACCE/DECE in 100 um/s^2 and positions in encoder units, like the controller expects them.
+DEFAULT_SETTINGS = {
+    "POLI": "97",
+    "SSPD": "100000",
+    "ISPD": "10000",
+    "ACCE": "65500",
+    "DECE": "65500",
+    "PTOL": "2",
+    "PTO2": "4",
+    "LLIM": "-100000",
+    "HLIM": "100000",
+    "ECHO": "0",
+}
+DEFAULT_RESOLUTION = 1250  # Encoder resolution in nm, until the stage is specified (e.g. "XLA1=1250").
+RESOLUTION_TAGS = ["XLS1", "XLS3", "XLA1", "XLA3", "XLA ", "XLS ", "XLA"]
+TICK = 0.001  # Simulation step in seconds.
+
+
+class SimulatedAxis:
+    """
+    The state and motion model of one axis.
+    """
+
+    def __init__(self, letter, start_position=0):
+        self.letter = letter
+        self.start_position = start_position
+        self.saved_settings = dict(DEFAULT_SETTINGS)
+        self.reset()
+
+    def reset(self):
+        """
+        RSET: back to the saved settings, the encoder isn't valid anymore.
+        """
+        self.settings = {}
+        self.resolution = DEFAULT_RESOLUTION
+        for tag, value in self.saved_settings.items():
+            self.setSetting(tag, value)
+        self.position = float(self.start_position)  # Encoder units.
+        self.velocity = 0.0  # Encoder units per second.
+        self.dpos = int(self.start_position)
+        self.mode = "idle"  # "idle", "position", "scan" or "index"
+        self.scan_direction = 0
+        self.index_direction = 1
+        self.stat = 0
+        self.next_update = 0.0
+
+    def getSetting(self, tag, default=0):
+        try:
+            return float(self.settings.get(tag, default))
+        except ValueError:
+            return default
+
+    def setSetting(self, tag, value):
+        self.settings[tag] = value
+        if tag in RESOLUTION_TAGS:
+            try:
+                if float(value) > 0:
+                    self.resolution = float(value)
+            except ValueError:
+                pass
+
+    def __toEncoderPerSecond(self, um_per_second):
+        return um_per_second * 1000.0 / self.resolution
+
+    def command(self, tag, value):
+        """
+        :return: A reply line (without axis prefix), or None.
+        """
+        if value == "?":
+            if tag == "EPOS":
+                return "EPOS=" + str(int(round(self.position)))
+            if tag == "DPOS":
+                return "DPOS=" + str(self.dpos)
+            if tag == "STAT":
+                return "STAT=" + str(self.stat)
+            return tag + "=" + str(self.settings.get(tag, 0))
+
+        try:
+            number = int(float(value))
+        except ValueError:
+            number = 0
+
+        if tag == "DPOS":
+            self.dpos = number
+            self.mode = "position"
+            self.stat &= ~(BIT_POSITION_REACHED | BIT_LEFT_END_STOP | BIT_RIGHT_END_STOP | BIT_SCANNING)
+            self.stat |= BIT_CLOSED_LOOP
+        elif tag == "SCAN" or tag == "MOVE":
+            if number == 0:
+                self.__stop()
+            else:
+                self.mode = "scan"
+                self.scan_direction = 1 if number > 0 else -1
+                self.stat &= ~(BIT_POSITION_REACHED | BIT_LEFT_END_STOP | BIT_RIGHT_END_STOP)
+                self.stat |= BIT_SCANNING | BIT_CLOSED_LOOP
+        elif tag == "INDX":
+            self.mode = "index"
+            self.index_direction = -1 if number < 0 else 1
+            self.stat &= ~(BIT_ENCODER_VALID | BIT_POSITION_REACHED)
+            self.stat |= BIT_SEARCHING_INDEX
+        elif tag == "STOP":
+            self.__stop()
+        elif tag == "ZERO":
+            self.stat &= ~BIT_CLOSED_LOOP
+        elif tag == "RSET":
+            self.reset()
+        elif tag == "ENBL":
+            self.stat &= ~ERROR_BITS
+        elif tag == "SAVE":
+            self.saved_settings = dict(self.settings)
+        else:
+            self.setSetting(tag, value)
+        return None
+
+    def __stop(self):
+        self.mode = "idle"
+        self.velocity = 0.0
+        self.dpos = int(round(self.position))
+        self.stat &= ~(BIT_SCANNING | BIT_MOTOR_ON)
+
+    def step(self, dt):
+        """
+        Moves the axis dt seconds further and updates the status bits.
+        """
+        if self.stat & ERROR_BITS:  # An error stops the motor until ENBL=1.
+            self.velocity = 0.0
+            self.stat &= ~BIT_MOTOR_ON
+            return
+
+        low = self.getSetting("LLIM", -math.inf)
+        high = self.getSetting("HLIM", math.inf)
+        if self.mode == "position":
+            target = min(max(self.dpos, low), high)
+            self.__moveTowards(target, self.__toEncoderPerSecond(self.getSetting("SSPD")), dt)
+            error = abs(self.dpos - self.position)
+            if self.velocity == 0.0 and self.position == target and target != self.dpos:
+                # DPOS is out of range, the stage stops at the limit.
+                self.stat |= BIT_LEFT_END_STOP if target == low else BIT_RIGHT_END_STOP
+            if error <= self.getSetting("PTOL"):
+                self.stat |= BIT_POSITION_REACHED
+            elif error > self.getSetting("PTO2"):
+                self.stat &= ~BIT_POSITION_REACHED
+        elif self.mode == "scan":
+            target = high if self.scan_direction > 0 else low
+            self.__moveTowards(target, self.__toEncoderPerSecond(self.getSetting("SSPD")), dt)
+            if self.position == target:
+                self.stat |= BIT_RIGHT_END_STOP if self.scan_direction > 0 else BIT_LEFT_END_STOP
+                self.__stop()
+        elif self.mode == "index":
+            # The index is at encoder position 0. Once it's found, the stage goes to the index position.
+            self.__moveTowards(0, self.__toEncoderPerSecond(self.getSetting("ISPD")), dt)
+            if self.position == 0:
+                self.stat &= ~BIT_SEARCHING_INDEX
+                self.stat |= BIT_ENCODER_VALID | BIT_POSITION_REACHED | BIT_CLOSED_LOOP
+                self.dpos = 0
+                self.mode = "position"
+
+        if self.velocity != 0.0:
+            self.stat |= BIT_MOTOR_ON
+        else:
+            self.stat &= ~BIT_MOTOR_ON
+        if abs(self.position) < 1:
+            self.stat |= BIT_ENCODER_AT_INDEX
+        else:
+            self.stat &= ~BIT_ENCODER_AT_INDEX
+
+    def __moveTowards(self, target, max_speed, dt):
+        """
+        Trapezoidal profile: accelerate with ACCE up to max_speed, decelerate with DECE to stop at target.
+        """
+        acceleration = max(self.__toEncoderPerSecond(self.getSetting("ACCE") * 100), 1.0)
+        deceleration = max(self.__toEncoderPerSecond(self.getSetting("DECE") * 100), 1.0)
+        distance = target - self.position
+        direction = 1 if distance > 0 else -1
+        speed = self.velocity * direction  # Speed towards the target.
+        braking_distance = speed * speed / (2 * deceleration)
+
+        if abs(distance) <= braking_distance:
+            speed = max(speed - deceleration * dt, 0.0)
+        else:
+            speed = min(speed + acceleration * dt, max_speed)
+
+        step = speed * dt
+        if step >= abs(distance) or (speed == 0.0 and abs(distance) < 1):
+            self.position = float(target)
+            self.velocity = 0.0
+        else:
+            if speed == 0.0:
+                speed = min(acceleration * dt, max_speed)  # Don't get stuck just before the target.
+                step = speed * dt
+            self.position += direction * step
+            self.velocity = direction * speed
+
+
+class XeryonSimulator:
+    """
+    A virtual Xeryon controller on a pseudo-terminal.
+    """
+
+    def __init__(self, axes = "X", serial_number = 12345, software_version = 100, start_position = 5000):
+        """
+        :param axes: The axis letters, e.g. "X" or "XYZ". With more than one letter, it's a multi-axis controller.
+        :param serial_number: The value answered to "SRNO=?".
+        :param software_version: The value answered to "SOFT=?".
+        :param start_position: The (physical) position of each axis when started, in encoder units.
+        """
+        self.axes = dict([(letter, SimulatedAxis(letter, start_position)) for letter in axes])
+        self.multi_axis = len(axes) > 1
+        self.serial_number = serial_number
+        self.software_version = software_version
+        self.master_settings = {}
+        self.master_fd = None
+        self.slave_fd = None
+        self.port = None
+        self.thread = None
+        self.stop_thread = False
+        self.start_time = None
+        self.received_lines = 0
+
+    def start(self):
+        """
+        :return: The path of the pseudo-terminal, to be used as COM port.
+        """
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        os.set_blocking(self.master_fd, False)
+        self.port = os.ttyname(self.slave_fd)
+        self.start_time = time.monotonic()
+        self.stop_thread = False
+        self.thread = threading.Thread(target=self.__run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.port
+
+    def stop(self):
+        self.stop_thread = True
+        if self.thread is not None:
+            self.thread.join()
+        for fd in [self.master_fd, self.slave_fd]:
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.slave_fd = None
+
+    def setStatusBit(self, letter, bit, value = True):
+        """
+        Sets or clears a status bit of an axis, e.g. to simulate an error: setStatusBit("X", 16) (error limit).
+        """
+        axis = self.axes[letter]
+        if value:
+            axis.stat |= 1 << bit
+        else:
+            axis.stat &= ~(1 << bit)
+
+    def __run(self):
+        buffer = b""
+        next_tick = time.monotonic()
+        while not self.stop_thread:
+            # Read commands until the next simulation step is due.
+            timeout = max(0.0, next_tick - time.monotonic())
+            readable, _, _ = select.select([self.master_fd], [], [], timeout)
+            if readable:
+                try:
+                    buffer += os.read(self.master_fd, 4096)
+                except (BlockingIOError, OSError):
+                    pass
+                lines = buffer.split(b"\n")
+                buffer = lines.pop()
+                replies = [self.__handleLine(line.decode(errors="replace").strip()) for line in lines]
+                self.__write("".join([reply for reply in replies if reply]))
+
+            now = time.monotonic()
+            if now >= next_tick:
+                self.__tick(now)
+                next_tick += TICK
+                if next_tick < now:  # We're behind, don't try to catch up.
+                    next_tick = now + TICK
+
+    def __handleLine(self, line):
+        """
+        :return: The reply, including the end of line, or "".
+        """
+        if "=" not in line:
+            return ""
+        self.received_lines += 1
+        letter = None
+        if ":" in line:
+            letter, line = line.split(":", 1)
+        tag, value = line.split("=", 1)
+
+        reply = ""
+        if tag == "SRNO" and value == "?":
+            answer = "SRNO=" + str(self.serial_number)
+        elif tag == "SOFT" and value == "?":
+            answer = "SOFT=" + str(self.software_version)
+        elif letter is None and self.multi_axis:
+            # Master command.
+            answer = None
+            if value == "?":
+                answer = tag + "=" + str(self.master_settings.get(tag, 0))
+            else:
+                self.master_settings[tag] = value
+        else:
+            axis = self.axes.get(letter) if letter is not None else list(self.axes.values())[0]
+            if axis is None:
+                return ""
+            echo = axis.settings.get("ECHO", "0") != "0"
+            answer = axis.command(tag, value)
+            if echo and value != "?":
+                reply += self.__prefix(axis.letter) + tag + "=" + value + "\n"
+
+        if answer is not None:
+            reply += self.__prefix(letter) + answer + "\n"
+        return reply
+
+    def __prefix(self, letter):
+        if self.multi_axis and letter is not None:
+            return letter + ":"
+        return ""
+
+    def __tick(self, now):
+        frames = []
+        time_counter = int((now - self.start_time) * 10000) % 2 ** 16  # TIME is in 0.1 ms.
+        for axis in self.axes.values():
+            axis.step(TICK)
+            if now >= axis.next_update:
+                poli = max(axis.getSetting("POLI", 97), 1) / 1000.0
+                axis.next_update = max(axis.next_update + poli, now)
+                prefix = self.__prefix(axis.letter)
+                frames.append(prefix + "EPOS=" + str(int(round(axis.position))) + "\n" +
+                              prefix + "DPOS=" + str(axis.dpos) + "\n" +
+                              prefix + "STAT=" + str(axis.stat) + "\n" +
+                              prefix + "TIME=" + str(time_counter) + "\n")
+        self.__write("".join(frames))
+
+    def __write(self, text):
+        if not text:
+            return
+        data = text.encode()
+        while data and not self.stop_thread:
+            try:
+                written = os.write(self.master_fd, data)
+                data = data[written:]
+            except BlockingIOError:
+                # Nobody is reading, drop the data just like a controller would keep on sending.
+                return
+            except OSError:
+                return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Virtual Xeryon controller on a pseudo-terminal.")
+    parser.add_argument("--axes", default="X", help="Axis letters, e.g. X or XYZ. (default: X)")
+    parser.add_argument("--serial-number", type=int, default=12345, help="Answer to SRNO=? (default: 12345)")
+    parser.add_argument("--link", default=None, help="Also create a symbolic link to the pseudo-terminal at this path.")
+    args = parser.parse_args()
+
+    simulator = XeryonSimulator(args.axes, args.serial_number)
+    port = simulator.start()
+    if args.link is not None:
+        if os.path.lexists(args.link):
+            os.remove(args.link)
+        os.symlink(port, args.link)
+    print("Xeryon simulator listening on " + port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        if args.link is not None and os.path.lexists(args.link):
+            os.remove(args.link)